@@ -9,3 +9,7 @@ class AnnouncementsConfig(AppConfig):
 
     def ready(self):
         import announcements.signals  # noqa
+        from uploads.pipeline import register
+        from .models import AnnouncementImage
+
+        register(AnnouncementImage, 'image')
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.2 on 2026-10-19 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0001_initial'),
+        ('announcements', '0002_lostfoundannouncement_animal_type_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcementimage',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='uploads.imageblob', verbose_name='Обработанный файл'),
+        ),
+    ]
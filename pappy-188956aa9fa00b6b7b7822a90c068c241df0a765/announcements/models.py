@@ -6,6 +6,7 @@ from django.utils.text import slugify
 from unidecode import unidecode
 from django.contrib.auth import get_user_model
 from django.utils import timezone
+from django_cleanup import cleanup
 
 User = get_user_model()
 
@@ -255,10 +256,15 @@ class LostFoundAnnouncement(models.Model):
     def __str__(self):
         return f"{self.get_type_display()} - {self.announcement.title}"
 
+# Файлы удаляет конвейер загрузок (uploads) по счетчику ссылок
+@cleanup.ignore
 class AnnouncementImage(models.Model):
     announcement = models.ForeignKey(Announcement, verbose_name=_('Объявление'),
                                    on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(_('Изображение'), upload_to='announcements/')
+    blob = models.ForeignKey('uploads.ImageBlob', verbose_name=_('Обработанный файл'),
+                             on_delete=models.SET_NULL, null=True, blank=True,
+                             editable=False, related_name='+')
     is_main = models.BooleanField(_('Главное изображение'), default=False)
     created_at = models.DateTimeField(_('Создано'), auto_now_add=True)
     
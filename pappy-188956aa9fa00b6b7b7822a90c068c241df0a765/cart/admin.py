@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import Cart, CartItem
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    raw_id_fields = ['product']
+    extra = 0
+
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ['user', 'created', 'updated', 'checked_out']
+    list_filter = ['checked_out']
+    raw_id_fields = ['user']
+    inlines = [CartItemInline]
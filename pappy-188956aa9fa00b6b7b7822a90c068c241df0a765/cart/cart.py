@@ -0,0 +1,233 @@
+import time
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from catalog.models import Product
+from .models import Cart, CartItem
+
+SESSION_KEY = 'cart'
+MAX_QUANTITY = 99
+# Не чаще чем раз в столько секунд измененная корзина пишется в базу в
+# конце запроса (cart.middleware.CartPersistMiddleware)
+PERSIST_INTERVAL = getattr(settings, 'CART_PERSIST_INTERVAL', 60)
+
+
+class CartError(Exception):
+    pass
+
+
+class CartLine:
+    """Строка корзины для шаблона"""
+
+    def __init__(self, product, quantity, unit_price):
+        self.product = product
+        self.quantity = quantity
+        self.unit_price = unit_price
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
+
+
+def _empty_state():
+    # changed - товары, измененные в этой сессии и еще не записанные
+    return {'items': {}, 'dirty': False, 'changed': [], 'persisted': 0}
+
+
+def _open_items(user):
+    return CartItem.objects.filter(cart__user=user, cart__checked_out__isnull=True)
+
+
+class SessionCart:
+    """
+    Корзина покупателя.
+
+    Рабочее состояние хранится в сессии: {id товара: [количество, цена]}.
+    Добавление, изменение и подсчет суммы не обращаются к базе; в базу
+    изменения записываются позже (write-behind): в конце запроса не чаще
+    раза в PERSIST_INTERVAL, при выходе и при оформлении заказа.
+    """
+
+    def __init__(self, request, user=None):
+        self.session = request.session
+        self.user = user or request.user
+        state = self.session.get(SESSION_KEY)
+        if state is None:
+            state = _empty_state()
+            if self.user.is_authenticated:
+                state['items'] = self._load_persisted()
+            self.session[SESSION_KEY] = state
+        elif 'changed' not in state:
+            # Сессия создана до учета измененных товаров
+            state['changed'] = list(state['items']) if state['dirty'] else []
+            state['persisted'] = 0
+        self.state = state
+
+    def _load_persisted(self):
+        return {
+            str(product_id): [quantity, str(unit_price)]
+            for product_id, quantity, unit_price in _open_items(self.user).values_list(
+                'product_id', 'quantity', 'unit_price'
+            )
+        }
+
+    def _changed(self, key):
+        if key not in self.state['changed']:
+            self.state['changed'].append(key)
+        self.state['dirty'] = True
+        self.session.modified = True
+
+    def needs_persist(self):
+        """Есть ли незаписанные изменения, которые пора сохранить"""
+        return self.state['dirty'] and time.time() - self.state['persisted'] >= PERSIST_INTERVAL
+
+    @property
+    def items(self):
+        return self.state['items']
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, product_id):
+        return str(product_id) in self.items
+
+    def quantity_of(self, product_id):
+        return self.items.get(str(product_id), [0])[0]
+
+    def add(self, product, quantity=1):
+        """Добавляет товар или увеличивает его количество"""
+        if product.status != 'active' or product.price is None:
+            raise CartError('Product is not available')
+        if self.user.is_authenticated and product.seller_id == self.user.pk:
+            raise CartError('Cannot buy your own product')
+        quantity = min(self.quantity_of(product.id) + int(quantity), MAX_QUANTITY)
+        if quantity < 1:
+            raise CartError('Invalid quantity')
+        self.items[str(product.id)] = [quantity, str(product.price)]
+        self._changed(str(product.id))
+
+    def update(self, product_id, quantity):
+        """Задает количество; 0 удаляет товар из корзины"""
+        key = str(product_id)
+        if key not in self.items:
+            raise CartError('Product is not in the cart')
+        quantity = int(quantity)
+        if quantity < 0:
+            raise CartError('Invalid quantity')
+        if quantity == 0:
+            del self.items[key]
+        else:
+            self.items[key][0] = min(quantity, MAX_QUANTITY)
+        self._changed(key)
+
+    def remove(self, product_id):
+        if self.items.pop(str(product_id), None) is None:
+            raise CartError('Product is not in the cart')
+        self._changed(str(product_id))
+
+    def count(self):
+        return sum(quantity for quantity, _price in self.items.values())
+
+    def total(self):
+        return sum(
+            (Decimal(price) * quantity for quantity, price in self.items.values()),
+            Decimal('0.00')
+        )
+
+    def lines(self):
+        """Строки корзины с товарами, загруженными одним запросом"""
+        products = Product.objects.filter(
+            id__in=[int(key) for key in self.items]
+        ).select_related('main_image').in_bulk()
+        return [
+            CartLine(products[int(key)], quantity, Decimal(price))
+            for key, (quantity, price) in self.items.items()
+            if int(key) in products
+        ]
+
+    def clear(self):
+        """Очищает корзину; сохраненные строки удаляются одним DELETE"""
+        self.state = _empty_state()
+        self.session[SESSION_KEY] = self.state
+        if self.user.is_authenticated:
+            _open_items(self.user).delete()
+
+    def merge_persisted(self):
+        """Объединяет корзину сессии с сохраненной корзиной пользователя"""
+        for key, (quantity, price) in self._load_persisted().items():
+            if key not in self.items:
+                self.items[key] = [quantity, price]
+            elif quantity > self.items[key][0]:
+                self.items[key][0] = quantity
+            else:
+                continue
+            self._changed(key)
+
+    @transaction.atomic
+    def persist(self, full=False):
+        """
+        Записывает корзину сессии в базу: проверка, что товары еще есть в
+        каталоге, одна вставка с обновлением существующих строк и одно
+        удаление исчезнувших.
+
+        Пишутся только товары, измененные в этой сессии, - строки, которые
+        пользователь поменял с другого устройства, не затираются. full=True
+        приводит сохраненную корзину к корзине сессии целиком.
+        """
+        if not self.user.is_authenticated:
+            return None
+        changed = list(self.items) if full else self.state['changed']
+        existing = set(Product.objects.filter(
+            id__in=[int(key) for key in changed if key in self.items]
+        ).values_list('id', flat=True))
+        for key in changed:
+            if key in self.items and int(key) not in existing:
+                # Товар удален из каталога, пока лежал в корзине
+                del self.items[key]
+
+        cart, _ = Cart.objects.get_or_create(user=self.user, checked_out__isnull=True)
+        if existing:
+            CartItem.objects.bulk_create(
+                [
+                    CartItem(cart=cart, product_id=int(key), quantity=quantity, unit_price=Decimal(price))
+                    for key, (quantity, price) in self.items.items()
+                    if int(key) in existing
+                ],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity', 'unit_price']
+            )
+        stale = cart.items.all() if full else cart.items.filter(product_id__in=[int(key) for key in changed])
+        stale.exclude(product_id__in=existing).delete()
+        self.state.update(dirty=False, changed=[], persisted=time.time())
+        self.session.modified = True
+        return cart
+
+    @transaction.atomic
+    def checkout(self):
+        """
+        Оформляет корзину: обновляет цены по каталогу, убирает недоступные
+        товары, сохраняет корзину и закрывает ее.
+        """
+        if not self.user.is_authenticated:
+            raise CartError('Login required')
+        prices = dict(Product.objects.filter(
+            id__in=[int(key) for key in self.items],
+            status='active',
+            price__isnull=False
+        ).exclude(seller=self.user).values_list('id', 'price'))
+        for key in list(self.items):
+            if int(key) in prices:
+                self.items[key][1] = str(prices[int(key)])
+            else:
+                del self.items[key]
+        if not self.items:
+            raise CartError('Cart is empty')
+
+        cart = self.persist(full=True)
+        cart.checked_out = timezone.now()
+        cart.save(update_fields=['checked_out', 'updated'])
+        self.state = _empty_state()
+        self.session[SESSION_KEY] = self.state
+        return cart
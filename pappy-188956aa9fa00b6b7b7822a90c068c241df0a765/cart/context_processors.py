@@ -0,0 +1,9 @@
+from .cart import SESSION_KEY
+
+
+def cart_count(request):
+    """Количество товаров в корзине из сессии, без запроса к базе"""
+    state = request.session.get(SESSION_KEY)
+    if not state:
+        return {'cart_count': 0}
+    return {'cart_count': sum(quantity for quantity, _price in state['items'].values())}
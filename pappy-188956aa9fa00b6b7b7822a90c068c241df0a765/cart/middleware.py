@@ -0,0 +1,21 @@
+from .cart import SESSION_KEY, SessionCart
+
+
+class CartPersistMiddleware:
+    """
+    Сохраняет измененную корзину в конце запроса, не чаще раза в
+    cart.cart.PERSIST_INTERVAL: изменения не теряются, когда сессия просто
+    истекает, а запросы без изменений корзины базу не трогают.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated and request.session.get(SESSION_KEY):
+            cart = SessionCart(request)
+            if cart.needs_persist():
+                cart.persist()
+        return response
@@ -0,0 +1,61 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import models
+from django.db.models import DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils.translation import gettext_lazy as _
+
+
+class Cart(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('user'),
+                             on_delete=models.CASCADE, related_name='carts')
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    updated = models.DateTimeField(_('updated'), auto_now=True)
+    checked_out = models.DateTimeField(_('checked out'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('cart')
+        verbose_name_plural = _('carts')
+        ordering = ['-created']
+        constraints = [
+            # У пользователя одна незавершенная корзина
+            models.UniqueConstraint(fields=['user'], condition=Q(checked_out__isnull=True),
+                                    name='cart_one_open_per_user'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} ({self.created:%d.%m.%Y})'
+
+    def summary(self):
+        """Количество товаров и сумма корзины одним запросом"""
+        return self.items.aggregate(
+            count=Coalesce(Sum('quantity'), 0),
+            total=Coalesce(
+                Sum(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Decimal('0.00')
+            )
+        )
+
+
+class CartItem(models.Model):
+    cart = models.ForeignKey(Cart, verbose_name=_('cart'),
+                             on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey('catalog.Product', verbose_name=_('product'),
+                                on_delete=models.CASCADE, related_name='cart_items')
+    quantity = models.PositiveIntegerField(_('quantity'), default=1)
+    # Цена на момент добавления; обновляется при оформлении
+    unit_price = models.DecimalField(_('unit price'), max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = _('cart item')
+        verbose_name_plural = _('cart items')
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='cart_item_unique_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id}'
+
+    @property
+    def total_price(self):
+        return self.unit_price * self.quantity
@@ -0,0 +1,21 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.dispatch import receiver
+from .cart import SESSION_KEY, SessionCart
+
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    """Добавляет к корзине сессии сохраненную корзину пользователя"""
+    if request is None or SESSION_KEY not in request.session:
+        return
+    SessionCart(request, user).merge_persisted()
+
+
+@receiver(user_logged_out)
+def persist_cart_on_logout(sender, request, user, **kwargs):
+    """Сессия удаляется при выходе - несохраненная корзина пишется в базу"""
+    if request is None or user is None:
+        return
+    state = request.session.get(SESSION_KEY)
+    if state and state['dirty']:
+        SessionCart(request, user).persist()
@@ -0,0 +1,243 @@
+import time
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, Product
+from cart.cart import PERSIST_INTERVAL, CartError, SessionCart
+from cart.models import Cart, CartItem
+
+class CartTestMixin:
+    def setUp(self):
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.seller = User.objects.create_user(
+            phone='+79997654321',
+            password='seller123',
+            is_seller=True
+        )
+        self.category = Category.objects.create(name='Аксессуары')
+        self.products = [
+            Product.objects.create(
+                seller=self.seller,
+                category=self.category,
+                title=f'Ошейник {i}',
+                description='Описание',
+                price=Decimal('100.00') * (i + 1),
+                condition='new'
+            )
+            for i in range(10)
+        ]
+
+    def make_request(self, user=None):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.user = user or AnonymousUser()
+        return request
+
+
+class SessionCartTest(CartTestMixin, TestCase):
+    def test_changes_do_not_query_database(self):
+        """Test that adding, updating and totals work on the session only"""
+        cart = SessionCart(self.make_request())
+        first, second = self.products[:2]
+        with self.assertNumQueries(0):
+            cart.add(first, 2)
+            cart.add(second)
+            cart.add(second)
+            cart.update(first.id, 3)
+            self.assertEqual(cart.count(), 5)
+            self.assertEqual(cart.total(), Decimal('700.00'))
+            cart.remove(first.id)
+            self.assertEqual(cart.count(), 2)
+
+    def test_rejects_unavailable_products(self):
+        """Test that own, archived and unpriced products cannot be added"""
+        cart = SessionCart(self.make_request(self.seller))
+        with self.assertRaises(CartError):
+            cart.add(self.products[0])
+
+        cart = SessionCart(self.make_request(self.buyer))
+        archived = self.products[1]
+        archived.status = 'archived'
+        with self.assertRaises(CartError):
+            cart.add(archived)
+        unpriced = self.products[2]
+        unpriced.price = None
+        with self.assertRaises(CartError):
+            cart.add(unpriced)
+
+    def test_persist_writes_whole_cart_in_constant_queries(self):
+        """Test that persisting upserts items and removes dropped ones"""
+        cart = SessionCart(self.make_request(self.buyer))
+        for product in self.products[:3]:
+            cart.add(product)
+        cart.persist()
+
+        for product in self.products[3:]:
+            cart.add(product, 2)
+        cart.remove(self.products[0].id)
+        # Транзакция, товары, корзина, вставка с обновлением, удаление
+        with self.assertNumQueries(6):
+            saved = cart.persist()
+
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(saved.items.count(), 9)
+        summary = saved.summary()
+        self.assertEqual(summary['count'], cart.count())
+        self.assertEqual(summary['total'], cart.total())
+
+    def test_clear_deletes_items_with_one_query(self):
+        """Test that clearing the cart issues a single DELETE"""
+        cart = SessionCart(self.make_request(self.buyer))
+        for product in self.products:
+            cart.add(product)
+        cart.persist()
+
+        with self.assertNumQueries(1):
+            cart.clear()
+        self.assertEqual(len(cart), 0)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_persisted_cart_is_loaded_once(self):
+        """Test that a new session loads the saved cart with one query"""
+        cart = SessionCart(self.make_request(self.buyer))
+        cart.add(self.products[0], 2)
+        cart.persist()
+
+        with self.assertNumQueries(1):
+            restored = SessionCart(self.make_request(self.buyer))
+        self.assertEqual(restored.quantity_of(self.products[0].id), 2)
+
+    def test_checkout_reprices_and_closes_cart(self):
+        """Test that checkout uses current prices and drops unavailable items"""
+        request = self.make_request(self.buyer)
+        cart = SessionCart(request)
+        cart.add(self.products[0], 2)
+        cart.add(self.products[1])
+        Product.objects.filter(id=self.products[0].id).update(price=Decimal('150.00'))
+        Product.objects.filter(id=self.products[1].id).update(status='archived')
+
+        order = cart.checkout()
+
+        self.assertIsNotNone(order.checked_out)
+        self.assertEqual(order.summary(), {'count': 2, 'total': Decimal('300.00')})
+        self.assertEqual(len(SessionCart(request)), 0)
+        # Следующая корзина создается заново
+        cart.add(self.products[2])
+        self.assertNotEqual(cart.persist().pk, order.pk)
+
+    def test_persist_keeps_rows_changed_on_another_device(self):
+        """Test that persisting one session does not drop rows saved from another"""
+        phone = SessionCart(self.make_request(self.buyer))
+        laptop = SessionCart(self.make_request(self.buyer))
+        phone.add(self.products[0])
+        phone.persist()
+        laptop.add(self.products[1])
+        laptop.persist()
+
+        saved = CartItem.objects.filter(cart__user=self.buyer).values_list('product_id', flat=True)
+        self.assertEqual(set(saved), {self.products[0].id, self.products[1].id})
+
+        laptop.remove(self.products[1].id)
+        laptop.persist()
+        self.assertEqual(list(saved.all()), [self.products[0].id])
+
+    def test_persist_drops_deleted_products(self):
+        """Test that products deleted from the catalog are dropped instead of failing the insert"""
+        cart = SessionCart(self.make_request(self.buyer))
+        cart.add(self.products[0])
+        cart.add(self.products[1])
+        self.products[1].delete()
+
+        saved = cart.persist()
+        self.assertEqual(list(saved.items.values_list('product_id', flat=True)), [self.products[0].id])
+        self.assertNotIn(self.products[1].id, cart)
+
+
+class CartViewsTest(CartTestMixin, TestCase):
+    def test_cart_page_queries_do_not_grow_with_items(self):
+        """Test that the cart page loads products with a single query"""
+        # Сессия, товары корзины, пользователь, счетчик уведомлений
+        self.client.login(phone='+79991234567', password='testpass123')
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[0].id})
+        with self.assertNumQueries(4):
+            self.client.get(reverse('cart:cart_detail'))
+
+        for product in self.products[1:]:
+            self.client.post(reverse('cart:cart_add'), {'product_id': product.id})
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['lines']), 10)
+        self.assertEqual(response.context['count'], 10)
+
+    def test_ajax_add_returns_totals(self):
+        """Test that adding from the modal returns the new count and total"""
+        response = self.client.post(
+            reverse('cart:cart_add'),
+            {'product_id': self.products[1].id, 'quantity': '2'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.json(), {'status': 'success', 'count': 2, 'total': '400.00'})
+
+    def test_login_merges_anonymous_cart(self):
+        """Test that the anonymous cart is merged with the saved one on login"""
+        saved = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=saved, product=self.products[0], quantity=3, unit_price=Decimal('100.00'))
+
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[0].id})
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[1].id})
+        self.client.login(phone='+79991234567', password='testpass123')
+
+        response = self.client.get(reverse('cart:cart_detail'))
+        quantities = {line.product.id: line.quantity for line in response.context['lines']}
+        self.assertEqual(quantities, {self.products[0].id: 3, self.products[1].id: 1})
+
+    def test_checkout_requires_login(self):
+        """Test that anonymous users are redirected to login at checkout"""
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[0].id})
+        response = self.client.post(reverse('cart:checkout'))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_checkout_shows_order(self):
+        """Test that checkout persists the cart and shows the order summary"""
+        self.client.login(phone='+79991234567', password='testpass123')
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[0].id, 'quantity': '2'})
+        response = self.client.post(reverse('cart:checkout'), follow=True)
+        self.assertEqual(response.context['summary'], {'count': 2, 'total': Decimal('200.00')})
+        self.assertEqual(response.context['cart_count'], 0)
+
+
+class CartPersistenceTest(CartTestMixin, TransactionTestCase):
+    def test_logout_with_deleted_product(self):
+        """Test that a cart holding a deleted product is saved on logout without an integrity error"""
+        self.client.login(phone='+79991234567', password='testpass123')
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[0].id})
+        # Сохранено в конце первого запроса; второй товар ждет выхода
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[1].id})
+        self.products[1].delete()
+
+        response = self.client.post(reverse('login_auth:logout'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            list(CartItem.objects.values_list('product_id', flat=True)), [self.products[0].id]
+        )
+
+    def test_changes_persisted_at_request_end(self):
+        """Test that a changed cart is saved at request end at most once per interval"""
+        self.client.login(phone='+79991234567', password='testpass123')
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[0].id})
+        self.assertEqual(CartItem.objects.count(), 1)
+
+        # Следующее изменение внутри интервала ждет следующего сохранения
+        self.client.post(reverse('cart:cart_add'), {'product_id': self.products[1].id})
+        self.assertEqual(CartItem.objects.count(), 1)
+        with mock.patch('cart.cart.time.time', return_value=time.time() + PERSIST_INTERVAL):
+            self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(CartItem.objects.count(), 2)
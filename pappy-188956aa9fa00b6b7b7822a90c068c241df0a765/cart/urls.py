@@ -0,0 +1,14 @@
+from django.urls import path
+from . import views
+
+app_name = 'cart'
+
+urlpatterns = [
+    path('', views.cart_detail, name='cart_detail'),
+    path('add/', views.cart_add, name='cart_add'),
+    path('update/', views.cart_update, name='cart_update'),
+    path('remove/', views.cart_remove, name='cart_remove'),
+    path('clear/', views.cart_clear, name='cart_clear'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('orders/<int:pk>/', views.order_detail, name='order_detail'),
+]
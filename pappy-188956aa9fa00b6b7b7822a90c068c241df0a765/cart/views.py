@@ -0,0 +1,116 @@
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
+from catalog.models import Product
+from .cart import CartError, SessionCart
+from .models import Cart
+
+
+def _is_ajax(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def _cart_response(request, cart, error=None):
+    """JSON для запросов из модального окна, иначе - возврат на страницу корзины"""
+    if _is_ajax(request):
+        if error:
+            return JsonResponse({'status': 'error', 'error': error}, status=400)
+        return JsonResponse({
+            'status': 'success',
+            'count': cart.count(),
+            'total': str(cart.total())
+        })
+    if error:
+        messages.error(request, error)
+    return redirect('cart:cart_detail')
+
+
+def _product_id(request):
+    product_id = request.POST.get('product_id', '')
+    if not product_id.isdigit():
+        raise Http404
+    return int(product_id)
+
+
+def cart_detail(request):
+    """Страница корзины: товары загружаются одним запросом, сумма - из сессии"""
+    cart = SessionCart(request)
+    return render(request, 'cart/cart_detail.html', {
+        'lines': cart.lines(),
+        'count': cart.count(),
+        'total': cart.total(),
+    })
+
+
+@require_POST
+def cart_add(request):
+    """Добавление товара в корзину"""
+    product = get_object_or_404(Product, pk=_product_id(request))
+    cart = SessionCart(request)
+    quantity = request.POST.get('quantity', '1')
+    try:
+        if not quantity.isdigit():
+            raise CartError('Invalid quantity')
+        cart.add(product, int(quantity))
+    except CartError as e:
+        return _cart_response(request, cart, str(e))
+    return _cart_response(request, cart)
+
+
+@require_POST
+def cart_update(request):
+    """Изменение количества товара"""
+    cart = SessionCart(request)
+    quantity = request.POST.get('quantity', '')
+    try:
+        if not quantity.isdigit():
+            raise CartError('Invalid quantity')
+        cart.update(_product_id(request), int(quantity))
+    except CartError as e:
+        return _cart_response(request, cart, str(e))
+    return _cart_response(request, cart)
+
+
+@require_POST
+def cart_remove(request):
+    """Удаление товара из корзины"""
+    cart = SessionCart(request)
+    try:
+        cart.remove(_product_id(request))
+    except CartError as e:
+        return _cart_response(request, cart, str(e))
+    return _cart_response(request, cart)
+
+
+@require_POST
+def cart_clear(request):
+    """Очистка корзины"""
+    cart = SessionCart(request)
+    cart.clear()
+    return _cart_response(request, cart)
+
+
+@login_required
+@require_POST
+def checkout(request):
+    """Оформление заказа из корзины"""
+    cart = SessionCart(request)
+    try:
+        order = cart.checkout()
+    except CartError as e:
+        messages.error(request, str(e))
+        return redirect('cart:cart_detail')
+    return redirect('cart:order_detail', pk=order.pk)
+
+
+@login_required
+def order_detail(request, pk):
+    """Оформленная корзина: строки одним запросом, итоги - агрегатом"""
+    order = get_object_or_404(Cart, pk=pk, user=request.user, checked_out__isnull=False)
+    return render(request, 'cart/order_detail.html', {
+        'order': order,
+        'items': order.items.select_related('product'),
+        'summary': order.summary(),
+    })
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Category, Product, ProductImage, Favorite
+from .models import Category, Product, ProductImage, Favorite, PriceHistory
+from .homepage import FEATURED, invalidate_product_card
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -24,8 +25,8 @@ class CategoryAdmin(admin.ModelAdmin):
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
-    fields = ['image', 'is_main', 'order', 'preview_image']
-    readonly_fields = ['preview_image']
+    fields = ['image', 'is_main', 'order', 'thumbnails_ready', 'preview_image']
+    readonly_fields = ['thumbnails_ready', 'preview_image']
     
     def preview_image(self, obj):
         if obj.image:
@@ -33,13 +34,24 @@ class ProductImageInline(admin.TabularInline):
         return '-'
     preview_image.short_description = 'Предпросмотр'
 
+class PriceHistoryInline(admin.TabularInline):
+    model = PriceHistory
+    extra = 0
+    fields = ['old_price', 'new_price', 'changed']
+    readonly_fields = ['old_price', 'new_price', 'changed']
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = ['title', 'seller', 'category', 'price', 'status', 'created', 'views', 'is_featured']
     list_filter = ['status', 'condition', 'is_featured', 'created', 'category']
     search_fields = ['title', 'description', 'seller__first_name', 'seller__last_name', 'seller__phone']
     prepopulated_fields = {'slug': ('title',)}
-    inlines = [ProductImageInline]
+    raw_id_fields = ['main_image']
+    inlines = [ProductImageInline, PriceHistoryInline]
     actions = ['mark_as_featured', 'unmark_as_featured', 'block_products']
     date_hierarchy = 'created'
     list_per_page = 20
@@ -63,7 +75,12 @@ class ProductAdmin(admin.ModelAdmin):
     mark_as_featured.short_description = 'Добавить в рекомендуемые'
     
     def unmark_as_featured(self, request, queryset):
+        updated = list(queryset.values_list('id', flat=True))
         queryset.update(is_featured=False)
+        # update() не отправляет сигналы, сбрасываем кэш главной вручную
+        for product_id in updated:
+            invalidate_product_card(product_id)
+        FEATURED.invalidate()
         self.message_user(request, f'Удалено из рекомендуемых: {queryset.count()}')
     unmark_as_featured.short_description = 'Удалить из рекомендуемых'
     
@@ -0,0 +1,159 @@
+import base64
+import binascii
+import json
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from .thumbnails import thumbnail_name
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _column(name):
+    return lambda row: row[name]
+
+
+def _image_url(row):
+    name = row['main_image__image']
+    return default_storage.url(name) if name else None
+
+
+def _thumbnail_url(row):
+    name = row['main_image__image']
+    if not name:
+        return None
+    if not row['main_image__thumbnails_ready']:
+        return default_storage.url(name)
+    return default_storage.url(thumbnail_name(name, 'card', 'jpeg'))
+
+
+# Поля списка товаров: имя в ответе -> (колонки запроса, получение значения)
+LISTING_FIELDS = {
+    'id': (['id'], _column('id')),
+    'slug': (['slug'], _column('slug')),
+    'title': (['title'], _column('title')),
+    'description': (['description'], _column('description')),
+    'price': (['price'], _column('price')),
+    'condition': (['condition'], _column('condition')),
+    'location': (['location'], _column('location')),
+    'breed': (['breed'], _column('breed')),
+    'age': (['age'], _column('age')),
+    'size': (['size'], _column('size')),
+    'gender': (['gender'], _column('gender')),
+    'created': (['created'], _column('created')),
+    'views': (['views'], _column('views')),
+    'is_featured': (['is_featured'], _column('is_featured')),
+    'category': (['category_id'], _column('category_id')),
+    'category_name': (['category__name'], _column('category__name')),
+    'seller': (['seller_id'], _column('seller_id')),
+    'image': (['main_image__image'], _image_url),
+    'thumbnail': (['main_image__image', 'main_image__thumbnails_ready'], _thumbnail_url),
+}
+
+DEFAULT_FIELDS = ['id', 'slug', 'title', 'price', 'location', 'created', 'thumbnail']
+
+
+class ApiError(ValueError):
+    """Некорректные параметры запроса к API"""
+
+
+def parse_fields(value, default=DEFAULT_FIELDS):
+    """Список полей из параметра fields=a,b,c"""
+    if not value:
+        return list(default)
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in LISTING_FIELDS:
+            raise ApiError(f'Unknown field: {name}')
+        if name not in fields:
+            fields.append(name)
+    return fields or list(default)
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiError('Invalid limit')
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(row, *keys):
+    """Курсор по позиции строки: (created, id), перед ними - дополнительные ключи"""
+    payload = json.dumps([*(row[key] for key in keys), row['created'].isoformat(), row['id']])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, keys=0):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        *extra, created, pk = values
+        created = parse_datetime(created)
+        pk = int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise ApiError('Invalid cursor')
+    if created is None or len(extra) != keys:
+        raise ApiError('Invalid cursor')
+    return (*extra, created, pk)
+
+
+def columns_for(fields):
+    columns = []
+    for name in ['id', 'created', *fields]:
+        for column in LISTING_FIELDS[name][0]:
+            if column not in columns:
+                columns.append(column)
+    return columns
+
+
+def project(queryset, fields):
+    """Запрос только нужных колонок без создания объектов моделей"""
+    return queryset.order_by('-created', '-id').values(*columns_for(fields))
+
+
+def serialize_row(row, fields):
+    return {name: LISTING_FIELDS[name][1](row) for name in fields}
+
+
+def listing_page(queryset, params, default_fields=DEFAULT_FIELDS):
+    """
+    Страница списка товаров с курсором.
+
+    Курсор - позиция последней строки по (created, id), поэтому глубина
+    листания не влияет на стоимость запроса.
+    """
+    fields = parse_fields(params.get('fields'), default_fields)
+    limit = parse_limit(params.get('limit'))
+    rows = project(queryset, fields)
+
+    cursor = params.get('cursor')
+    if cursor:
+        created, pk = decode_cursor(cursor)
+        rows = rows.filter(Q(created__lt=created) | Q(created=created, id__lt=pk))
+
+    rows = list(rows[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [serialize_row(row, fields) for row in rows],
+        'next_cursor': encode_cursor(rows[-1]) if has_next else None,
+    }
+
+
+def stream_listing(queryset, fields):
+    """JSON-массив товаров по частям: в памяти не больше одной пачки строк"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    yield '['
+    separator = ''
+    for row in project(queryset, fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield separator + encoder.encode(serialize_row(row, fields))
+        separator = ','
+    yield ']'
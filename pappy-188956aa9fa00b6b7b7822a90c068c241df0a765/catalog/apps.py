@@ -4,4 +4,19 @@ from django.apps import AppConfig
 class CatalogConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'catalog'
-    verbose_name = 'Каталог' 
\ No newline at end of file
+    verbose_name = 'Каталог'
+
+    def ready(self):
+        import catalog.signals  # noqa
+        from uploads.pipeline import register
+        from .homepage import invalidate_image_cards
+        from .models import ProductImage
+        from .thumbnails import render_thumbnails, thumbnail_names
+
+        register(
+            ProductImage, 'image',
+            thumbnails=render_thumbnails,
+            ready_field='thumbnails_ready',
+            derived_names=thumbnail_names,
+            on_processed=invalidate_image_cards
+        )
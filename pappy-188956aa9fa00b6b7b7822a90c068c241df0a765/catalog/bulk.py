@@ -0,0 +1,352 @@
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from operator import or_
+from django import forms
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+from unidecode import unidecode
+from .category_tree import get_category_tree
+from .forms import ProductForm
+from .homepage import BLOCKS
+from .mating import MATING_CATEGORY_SLUG, sync_candidate
+from .models import Product, ProductImage, price_band_for
+from .thumbnails import delete_thumbnails, render_thumbnails
+
+FORMATS = ('csv', 'jsonl')
+
+# Колонки файла импорта/экспорта
+COLUMNS = ProductForm.Meta.fields + ['images']
+
+# Разделитель путей к изображениям в CSV
+IMAGES_SEPARATOR = '|'
+
+BATCH_SIZE = 500
+MAX_IMAGES = 10
+
+
+class CachedCategoryField(forms.Field):
+    """Категория по id или slug из кэшированного дерева, без запроса на строку"""
+
+    default_error_messages = {
+        'invalid_choice': _('Select a valid category.'),
+    }
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        tree = get_category_tree()
+        value = str(value).strip()
+        category = tree.get(int(value)) if value.isdigit() else tree.get_by_slug(value)
+        if category is None or not category.is_active:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return category
+
+
+class ProductImportForm(ProductForm):
+    """Проверка строки импорта по правилам формы создания объявления"""
+
+    category = CachedCategoryField()
+    image_1 = None
+    image_2 = None
+    image_3 = None
+
+    class Meta(ProductForm.Meta):
+        pass
+
+    def _get_validation_exclusions(self):
+        # Категория уже проверена по дереву, повторный запрос в ForeignKey.validate не нужен
+        exclude = super()._get_validation_exclusions()
+        exclude.add('category')
+        return exclude
+
+    def save(self, commit=False):
+        return forms.ModelForm.save(self, commit=False)
+
+
+class ImportReport:
+    """Итоги импорта: созданные товары, ошибки по строкам и скорость"""
+
+    def __init__(self):
+        self.created = 0
+        self.images = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def rows(self):
+        return self.created + len(self.errors)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def add_error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+
+def read_rows(fileobj, fmt):
+    """Строки файла импорта: (номер строки, словарь значений)"""
+    if fmt == 'csv':
+        reader = csv.DictReader(fileobj)
+        for row in reader:
+            images = row.get('images') or ''
+            row['images'] = [path for path in images.split(IMAGES_SEPARATOR) if path]
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(fileobj, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_num, e
+                continue
+            if not isinstance(row, dict):
+                yield line_num, ValueError('Expected a JSON object')
+                continue
+            yield line_num, row
+    else:
+        raise ValueError(f'Unknown format: {fmt}')
+
+
+def _resolve_images(paths, image_root):
+    if not isinstance(paths, list) or len(paths) > MAX_IMAGES:
+        raise ValueError(f'Expected a list of at most {MAX_IMAGES} images')
+    resolved = []
+    for path in paths:
+        if image_root is None:
+            raise ValueError('Images are not allowed without an image root')
+        full_path = os.path.realpath(os.path.join(image_root, str(path)))
+        # Пути за пределами каталога с изображениями запрещены
+        if os.path.commonpath([full_path, image_root]) != image_root:
+            raise ValueError(f'Image outside of image root: {path}')
+        if not os.path.isfile(full_path):
+            raise ValueError(f'Image not found: {path}')
+        try:
+            with Image.open(full_path) as image:
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            # Картинку, которую не открыть, не обработает и process_uploads
+            raise ValueError(f'Not a valid image: {path}')
+        resolved.append(full_path)
+    return resolved
+
+
+def validate_rows(rows, image_root=None):
+    """
+    Проверяет строки по одной.
+
+    Возвращает (номер строки, товар, пути к изображениям, ошибки); товар
+    не сохранен.
+    """
+    if image_root is not None:
+        image_root = os.path.realpath(image_root)
+    for line, row in rows:
+        if isinstance(row, Exception):
+            yield line, None, [], {'__all__': [str(row)]}
+            continue
+        form = ProductImportForm(data={
+            key: value for key, value in row.items() if key in ProductForm.Meta.fields
+        })
+        errors = {} if form.is_valid() else {
+            field: [str(message) for message in messages]
+            for field, messages in form.errors.items()
+        }
+        try:
+            images = _resolve_images(row.get('images') or [], image_root)
+        except ValueError as e:
+            errors.setdefault('images', []).append(str(e))
+            images = []
+        if errors:
+            yield line, None, [], errors
+        else:
+            yield line, form.save(), images, None
+
+
+def allocate_slugs(products):
+    """Уникальные slug для пачки товаров одним запросом"""
+    bases = [slugify(unidecode(product.title)) or 'product' for product in products]
+    taken = set(Product.objects.filter(
+        reduce(or_, (Q(slug__startswith=base) for base in set(bases)))
+    ).values_list('slug', flat=True))
+
+    for product, base in zip(products, bases):
+        slug = base
+        n = 1
+        while slug in taken:
+            slug = f'{base}-{n}'
+            n += 1
+        taken.add(slug)
+        product.slug = slug
+
+
+def _store_image(product_id, path, order):
+    """Копирует файл в хранилище и создает превью; выполняется в пуле потоков"""
+    image = ProductImage(product_id=product_id, order=order, is_main=(order == 0))
+    with open(path, 'rb') as f:
+        image.image.save(os.path.basename(path), File(f), save=False)
+    try:
+        render_thumbnails(image.image)
+        image.thumbnails_ready = True
+    except Exception:
+        # Превью досоздаст команда generate_thumbnails
+        image.thumbnails_ready = False
+    return image
+
+
+def _store_images(jobs, workers):
+    """
+    Сохраняет изображения пачки в пуле потоков. Если хотя бы одно не
+    сохранилось, уже записанные файлы удаляются и ошибка пробрасывается.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_store_image, *job) for job in jobs]
+    stored = [future.result() for future in futures if future.exception() is None]
+    if len(stored) < len(futures):
+        _delete_files(stored)
+        next(future for future in futures if future.exception()).result()
+    return stored
+
+
+def _delete_files(images):
+    for image in images:
+        delete_thumbnails(image.image)
+        image.image.delete(save=False)
+
+
+def _insert_batch(batch, seller, workers, report):
+    products = [product for _line, product, _images in batch]
+    for product in products:
+        product.seller = seller
+        # bulk_create не вызывает Product.save
+        product.price_band = price_band_for(product.price)
+
+    # Товары и их изображения пишутся одной транзакцией: при ошибке не
+    # остается товаров без фото, а сохраненные файлы удаляются
+    images = []
+    try:
+        with transaction.atomic():
+            for attempt in range(3):
+                allocate_slugs(products)
+                try:
+                    with transaction.atomic():
+                        Product.objects.bulk_create(products)
+                    break
+                except IntegrityError:
+                    # Slug занял параллельный процесс - распределяем заново
+                    if attempt == 2:
+                        raise
+
+            jobs = [
+                (product.id, path, order)
+                for _line, product, paths in batch
+                for order, path in enumerate(paths)
+            ]
+            if jobs:
+                images = _store_images(jobs, workers)
+                ProductImage.objects.bulk_create(images)
+
+                by_id = {product.id: product for product in products}
+                for image in images:
+                    if image.is_main:
+                        by_id[image.product_id].main_image = image
+                Product.objects.bulk_update(
+                    [product for product in products if product.main_image_id],
+                    ['main_image']
+                )
+    except Exception:
+        _delete_files(images)
+        raise
+    report.images += len(images)
+
+    # bulk_create не отправляет сигналы - обновляем зависимые кэши и индексы
+    for product in products:
+        category = get_category_tree().get(product.category_id)
+        if category.slug == MATING_CATEGORY_SLUG:
+            sync_candidate(product)
+    for block in BLOCKS:
+        block.invalidate()
+
+    report.created += len(products)
+
+
+def import_products(fileobj, fmt, seller, image_root=None, batch_size=BATCH_SIZE, workers=4):
+    """
+    Потоковый импорт товаров продавца из CSV или JSONL.
+
+    Строки проверяются формой по одной, корректные вставляются пачками;
+    ошибочные попадают в отчет с номером строки.
+    """
+    report = ImportReport()
+    batch = []
+    for line, product, images, errors in validate_rows(read_rows(fileobj, fmt), image_root):
+        if errors:
+            report.add_error(line, errors)
+            continue
+        batch.append((line, product, images))
+        if len(batch) >= batch_size:
+            _insert_batch(batch, seller, workers, report)
+            batch = []
+    if batch:
+        _insert_batch(batch, seller, workers, report)
+    report.finished = time.monotonic()
+    return report
+
+
+def _export_row(product, images):
+    row = {field: getattr(product, field) for field in ProductForm.Meta.fields if field != 'category'}
+    row['category'] = product.category.slug
+    row['price'] = str(product.price) if product.price is not None else None
+    row['images'] = images
+    return row
+
+
+def export_products(queryset, fmt, chunk_size=BATCH_SIZE):
+    """Потоковая выгрузка в формате, который принимает import_products"""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format: {fmt}')
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    if fmt == 'csv':
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    products = queryset.select_related('category').order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(products.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        images = {}
+        for product_id, name in ProductImage.objects.filter(
+            product_id__in=[product.id for product in chunk]
+        ).order_by('product_id', 'order', 'id').values_list('product_id', 'image'):
+            images.setdefault(product_id, []).append(name)
+
+        for product in chunk:
+            row = _export_row(product, images.get(product.id, []))
+            if fmt == 'jsonl':
+                yield json.dumps(row, ensure_ascii=False) + '\n'
+            else:
+                buffer.seek(0)
+                buffer.truncate()
+                row['images'] = IMAGES_SEPARATOR.join(row['images'])
+                writer.writerow({key: '' if value is None else value for key, value in row.items()})
+                yield buffer.getvalue()
@@ -0,0 +1,113 @@
+import uuid
+from collections import defaultdict
+from django.core.cache import cache
+from .models import Category
+
+VERSION_KEY = 'catalog:category_tree:version'
+TREE_KEY = 'catalog:category_tree:{version}'
+# Устаревшие версии дерева удаляются из общего кэша по истечении срока
+TREE_TTL = 60 * 60 * 24
+
+# Дерево, собранное в текущем процессе: (версия, дерево)
+_local_tree = (None, None)
+
+
+class CategoryTree:
+    """Дерево категорий, загруженное одним запросом"""
+
+    def __init__(self, categories):
+        self.by_id = {category.id: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+
+        children = defaultdict(list)
+        for category in categories:
+            children[category.parent_id].append(category)
+        self.children = dict(children)
+
+        for category in categories:
+            self._attach_children(category, children.get(category.id, []))
+
+        self.descendants = {
+            category.id: self._collect_descendants(category.id)
+            for category in categories
+        }
+
+    @staticmethod
+    def _attach_children(category, children):
+        # Кладем детей в кэш prefetch_related, чтобы category.children.all,
+        # .exists и .count в шаблонах не делали запросов
+        queryset = category.children.all()
+        queryset._result_cache = children
+        queryset._prefetch_done = True
+        category._prefetched_objects_cache = {'children': queryset}
+
+    def _collect_descendants(self, category_id):
+        result = set()
+        stack = [category_id]
+        while stack:
+            current = stack.pop()
+            if current in result:
+                continue
+            result.add(current)
+            stack.extend(child.id for child in self.children.get(current, []))
+        return frozenset(result)
+
+    def roots(self, active_only=True):
+        """Категории верхнего уровня"""
+        return [
+            category for category in self.children.get(None, [])
+            if category.is_active or not active_only
+        ]
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+    def get_by_slug(self, slug):
+        return self.by_slug.get(slug)
+
+    def descendant_ids(self, category_id):
+        """Идентификаторы категории и всех ее потомков на любой глубине"""
+        return self.descendants.get(category_id, frozenset())
+
+    def names(self):
+        return {category.id: category.name for category in self.by_id.values()}
+
+
+def get_category_tree():
+    """
+    Возвращает дерево категорий.
+
+    Дерево хранится в памяти процесса и в общем кэше; токен версии в общем
+    кэше меняется при сохранении или удалении категории, и все процессы
+    пересобирают дерево при следующем обращении.
+    """
+    global _local_tree
+
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Версия - случайный токен, а не счетчик: после очистки кэша
+        # процесс не примет старое дерево за актуальное
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+
+    local_version, tree = _local_tree
+    if local_version == version:
+        return tree
+
+    key = TREE_KEY.format(version=version)
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, TREE_TTL)
+
+    tree = CategoryTree(categories)
+    _local_tree = (version, tree)
+    return tree
+
+
+def invalidate_category_tree():
+    """Сбрасывает дерево категорий во всех процессах"""
+    global _local_tree
+
+    _local_tree = (None, None)
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count
+from django.utils.translation import get_language, gettext_lazy as _
+from .models import PRICE_BANDS, Product
+from .category_tree import get_category_tree
+
+# Фасеты фильтров каталога: имя фасета -> (поле Product, заголовок)
+FACETS = {
+    'condition': ('condition', _('Condition')),
+    'category': ('category_id', _('Category')),
+    'size': ('size', _('Size')),
+    'gender': ('gender', _('Gender')),
+    'price_band': ('price_band', _('Price')),
+}
+
+
+def _price_band_labels():
+    def amount(value):
+        return f'{value:,}'.replace(',', ' ')
+
+    labels = {0: f'< {amount(PRICE_BANDS[0])} ₽'}
+    for band, (low, high) in enumerate(zip(PRICE_BANDS, PRICE_BANDS[1:]), start=1):
+        labels[band] = f'{amount(low)} – {amount(high)} ₽'
+    labels[len(PRICE_BANDS)] = f'≥ {amount(PRICE_BANDS[-1])} ₽'
+    return labels
+
+
+FACET_CHOICES = {
+    'condition': dict(Product.CONDITION_CHOICES),
+    'size': dict(Product.SIZE_CHOICES),
+    'gender': dict(Product.GENDER_CHOICES),
+    'price_band': _price_band_labels(),
+}
+
+# Фасеты, значения которых выводятся по порядку, а не по количеству
+ORDERED_FACETS = {'price_band'}
+
+# Параметры запроса, которые не влияют на набор товаров
+IGNORED_PARAMS = {'page', 'sort', 'format'}
+
+
+def facet_signature(scope, params):
+    """Нормализованная подпись набора фильтров для ключа кэша"""
+    normalized = {}
+    for key in sorted(params):
+        if key in IGNORED_PARAMS:
+            continue
+        values = params.getlist(key) if hasattr(params, 'getlist') else params[key]
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        values = sorted(str(v) for v in values if v not in (None, ''))
+        if values:
+            normalized[key] = values
+    payload = json.dumps([scope, get_language(), normalized], sort_keys=True)
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def _grouping_sets_counts(queryset, fields):
+    """Подсчет через GROUPING SETS: одна строка на значение каждого фасета"""
+    connection = connections[queryset.db]
+    qn = connection.ops.quote_name
+    sql, params = queryset.order_by().values('pk', *fields).query.sql_with_params()
+    columns = ', '.join(qn(f) for f in fields)
+    groupings = ', '.join(f'GROUPING({qn(f)})' for f in fields)
+    sets = ', '.join(f'({qn(f)})' for f in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT {columns}, {groupings}, COUNT(*) '
+            f'FROM ({sql}) facet_source GROUP BY GROUPING SETS ({sets})',
+            params
+        )
+        rows = cursor.fetchall()
+
+    counts = {field: {} for field in fields}
+    n = len(fields)
+    for row in rows:
+        values, grouped, count = row[:n], row[n:2 * n], row[-1]
+        for field, value, is_grouped in zip(fields, values, grouped):
+            if not is_grouped:
+                counts[field][value] = count
+    return counts
+
+
+def _cube_counts(queryset, fields):
+    """Подсчет одним GROUP BY по всем полям с суммированием в Python"""
+    counts = {field: {} for field in fields}
+    rows = queryset.order_by().values(*fields).annotate(facet_count=Count('pk', distinct=True))
+    for row in rows:
+        for field in fields:
+            value = row[field]
+            counts[field][value] = counts[field].get(value, 0) + row['facet_count']
+    return counts
+
+
+def compute_facets(queryset):
+    """
+    Считает количество товаров для каждого значения фасетов одним запросом.
+
+    На PostgreSQL используется GROUPING SETS, на остальных СУБД - группировка
+    по сочетанию всех полей фасетов (их мощность невелика).
+    """
+    fields = [field for field, _title in FACETS.values()]
+    if connections[queryset.db].vendor == 'postgresql':
+        counts = _grouping_sets_counts(queryset, fields)
+    else:
+        counts = _cube_counts(queryset, fields)
+
+    category_names = get_category_tree().names()
+
+    facets = []
+    for name, (field, title) in FACETS.items():
+        labels = category_names if name == 'category' else FACET_CHOICES[name]
+        values = [
+            {'value': value, 'label': str(labels.get(value, value)), 'count': count}
+            for value, count in counts[field].items()
+            if value not in (None, '')
+        ]
+        if name in ORDERED_FACETS:
+            values.sort(key=lambda item: item['value'])
+        else:
+            values.sort(key=lambda item: (-item['count'], item['label']))
+        facets.append({'name': name, 'title': str(title), 'values': values})
+    return facets
+
+
+def get_facets(queryset, scope, params):
+    """Фасеты с кэшированием по подписи фильтров"""
+    key = f'catalog:facets:{facet_signature(scope, params)}'
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, getattr(settings, 'CATALOG_FACETS_TTL', 60))
+    return facets
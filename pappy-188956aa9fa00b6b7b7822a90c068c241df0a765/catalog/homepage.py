@@ -0,0 +1,176 @@
+import math
+import random
+import time
+from django.core.cache import cache
+from django.db import transaction
+from .models import Product, ProductImage
+
+CARD_KEY = 'catalog:product_card:{id}'
+CARD_TTL = 60 * 60
+STATS_KEY = 'catalog:block_cache:stats:{block}:{event}'
+STATS_EVENTS = ('hit', 'miss', 'stale', 'early')
+
+# Время удержания блокировки пересчета блока (секунды)
+LOCK_TTL = 30
+
+
+def _record(block, event):
+    key = STATS_KEY.format(block=block, event=event)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+class ProductListBlock:
+    """
+    Блок главной страницы: первые limit активных товаров по дате создания.
+
+    В кэше хранится только список id. Запись считается устаревшей через ttl
+    секунд, но остается в кэше еще ttl секунд: пока один процесс под
+    блокировкой пересчитывает блок, остальные отдают устаревший список.
+    Незадолго до истечения срока блок пересчитывается заранее с
+    вероятностью, растущей к моменту истечения (XFetch).
+    """
+
+    def __init__(self, name, filters, limit=8, ttl=300, beta=1.0):
+        self.name = name
+        self.filters = filters
+        self.limit = limit
+        self.ttl = ttl
+        self.beta = beta
+        self.key = f'catalog:block:{name}'
+        self.lock_key = f'catalog:block:{name}:lock'
+
+    def queryset(self):
+        return (
+            Product.objects.filter(**self.filters)
+            .order_by('-created', '-id')
+            .values_list('id', 'created')[:self.limit]
+        )
+
+    def compute(self):
+        return list(self.queryset())
+
+    def _refresh(self):
+        started = time.monotonic()
+        rows = self.compute()
+        delta = time.monotonic() - started
+        entry = {
+            'ids': [pk for pk, _created in rows],
+            'boundary': rows[-1][1] if len(rows) >= self.limit else None,
+            'expires': time.time() + self.ttl,
+            'delta': delta,
+        }
+        cache.set(self.key, entry, self.ttl * 2)
+        return entry
+
+    def _needs_refresh(self, entry):
+        if entry.get('stale'):
+            return True
+        # XFetch: чем дольше пересчет и ближе срок, тем выше вероятность
+        jitter = -entry['delta'] * self.beta * math.log(1 - random.random())
+        return time.time() + jitter >= entry['expires']
+
+    def get_ids(self):
+        entry = cache.get(self.key)
+        if entry is not None and not self._needs_refresh(entry):
+            _record(self.name, 'hit')
+            return entry['ids']
+
+        if entry is None:
+            _record(self.name, 'miss')
+        elif time.time() < entry['expires'] and not entry.get('stale'):
+            _record(self.name, 'early')
+
+        if cache.add(self.lock_key, 1, LOCK_TTL):
+            try:
+                entry = self._refresh()
+            finally:
+                cache.delete(self.lock_key)
+        elif entry is not None:
+            # Блок пересчитывает другой процесс
+            _record(self.name, 'stale')
+        else:
+            entry = self._refresh()
+        return entry['ids']
+
+    def cached_ids(self):
+        entry = cache.get(self.key)
+        return entry['ids'] if entry else []
+
+    def affected_by(self, product, deleted=False):
+        """Может ли изменение товара изменить состав блока"""
+        entry = cache.get(self.key)
+        if entry is None:
+            return False
+        if product.pk in entry['ids']:
+            return True
+        if deleted:
+            return False
+        if any(getattr(product, field) != value for field, value in self.filters.items()):
+            return False
+        return entry['boundary'] is None or product.created >= entry['boundary']
+
+    def invalidate(self):
+        """Помечает блок устаревшим, не удаляя его"""
+        entry = cache.get(self.key)
+        if entry is not None:
+            entry['stale'] = True
+            cache.set(self.key, entry, self.ttl * 2)
+
+
+FEATURED = ProductListBlock('featured', {'status': 'active', 'is_featured': True})
+LATEST = ProductListBlock('latest', {'status': 'active'})
+BLOCKS = (FEATURED, LATEST)
+
+
+def hydrate_products(ids):
+    """Карточки товаров по списку id: из кэша, недостающие - одним запросом"""
+    keys = {pk: CARD_KEY.format(id=pk) for pk in ids}
+    cached = cache.get_many(keys.values())
+    cards = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in ids if pk not in cards]
+    if missing:
+        # Продавец в карточку не входит: его данные не должны попадать в
+        # общий кэш, а его изменения карточку не сбрасывают
+        fetched = Product.objects.filter(
+            id__in=missing
+        ).select_related('main_image').in_bulk()
+        cards.update(fetched)
+        cache.set_many(
+            {keys[pk]: product for pk, product in fetched.items()},
+            CARD_TTL
+        )
+
+    # Товар мог сменить статус после построения списка
+    return [cards[pk] for pk in ids if pk in cards and cards[pk].status == 'active']
+
+
+def invalidate_product_card(product_id):
+    key = CARD_KEY.format(id=product_id)
+    cache.delete(key)
+    # Параллельный запрос мог закэшировать карточку по данным до коммита
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def invalidate_image_cards(image_ids):
+    """Сбрасывает карточки товаров, у которых сменился файл изображения"""
+    product_ids = set(ProductImage.objects.filter(id__in=image_ids).values_list('product_id', flat=True))
+    cache.delete_many([CARD_KEY.format(id=pk) for pk in product_ids])
+
+
+def block_stats():
+    """Счетчики попаданий в кэш блоков главной страницы"""
+    stats = {}
+    for block in BLOCKS:
+        keys = {event: STATS_KEY.format(block=block.name, event=event) for event in STATS_EVENTS}
+        values = cache.get_many(keys.values())
+        counts = {event: values.get(key, 0) for event, key in keys.items()}
+        total = sum(counts.values())
+        served_from_cache = counts['hit'] + counts['stale']
+        counts['hit_ratio'] = served_from_cache / total if total else 0.0
+        stats[block.name] = counts
+    return stats
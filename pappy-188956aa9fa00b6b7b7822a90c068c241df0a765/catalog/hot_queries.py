@@ -0,0 +1,81 @@
+from django.db.models import Count
+from .category_tree import get_category_tree
+from .homepage import FEATURED, LATEST
+from .models import PriceHistory, Product
+
+# Размер страницы списков каталога
+PAGE_SIZE = 24
+
+
+def _active():
+    return Product.objects.filter(status='active')
+
+
+class QueryContext:
+    """
+    Параметры для типовых запросов: самая наполненная категория, категория
+    потерянных питомцев, диапазон цен, продавец с наибольшим числом объявлений.
+    """
+
+    def __init__(self, category_id=None, price_min=1000, price_max=15000):
+        if category_id is None:
+            category_id = (
+                Product.objects.filter(status='active')
+                .values_list('category_id').annotate(total=Count('id'))
+                .order_by('-total').values_list('category_id', flat=True).first()
+            )
+        self.category_id = category_id
+        tree = get_category_tree()
+        self.category_ids = list(tree.descendant_ids(category_id)) or [category_id]
+        lost = tree.get_by_slug('lostfound')
+        self.lost_category_id = lost.id if lost else None
+        self.price_min = price_min
+        self.price_max = price_max
+        self.product_id = _active().filter(
+            category_id__in=self.category_ids
+        ).values_list('id', flat=True).first()
+        self.seller_id = (
+            Product.objects.values_list('seller_id').annotate(total=Count('id'))
+            .order_by('-total').values_list('seller_id', flat=True).first()
+        )
+
+
+# Основные сочетания фильтров и сортировок главной, поиска, страниц
+# категорий, «Моих объявлений» и поиска потерянных питомцев
+HOT_QUERIES = {
+    'home_featured': lambda ctx: FEATURED.queryset(),
+    'home_latest': lambda ctx: LATEST.queryset(),
+    'search_newest': lambda ctx: _active().order_by('-created', '-id')[:PAGE_SIZE],
+    'search_price_asc': lambda ctx: _active().order_by('price')[:PAGE_SIZE],
+    'search_price_range': lambda ctx: _active().filter(
+        price__gte=ctx.price_min, price__lte=ctx.price_max
+    ).order_by('price')[:PAGE_SIZE],
+    'search_popular': lambda ctx: _active().order_by('-popularity_score', '-id')[:PAGE_SIZE],
+    'category_newest': lambda ctx: _active().filter(
+        category_id__in=ctx.category_ids
+    ).order_by('-created')[:PAGE_SIZE],
+    'category_price_desc': lambda ctx: _active().filter(
+        category_id__in=ctx.category_ids
+    ).order_by('-price')[:PAGE_SIZE],
+    'category_price_range': lambda ctx: _active().filter(
+        category_id__in=ctx.category_ids,
+        price__gte=ctx.price_min,
+        price__lte=ctx.price_max
+    ).order_by('price')[:PAGE_SIZE],
+    'category_popular': lambda ctx: _active().filter(
+        category_id__in=ctx.category_ids
+    ).order_by('-popularity_score', '-id')[:PAGE_SIZE],
+    'category_price_histogram': lambda ctx: _active().filter(
+        category_id__in=ctx.category_ids
+    ).values('price_band').annotate(total=Count('id')).order_by('price_band'),
+    'my_products': lambda ctx: Product.objects.filter(
+        seller_id=ctx.seller_id
+    ).order_by('-created')[:10],
+    'my_products_status': lambda ctx: Product.objects.filter(
+        seller_id=ctx.seller_id, status='archived'
+    ).order_by('-created')[:10],
+    'lost_pets': lambda ctx: _active().filter(
+        category_id=ctx.lost_category_id
+    ).order_by('-created', '-id')[:PAGE_SIZE],
+    'price_history': lambda ctx: PriceHistory.objects.filter(product_id=ctx.product_id)[:50],
+}
@@ -0,0 +1,103 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from notifications.models import Notification
+from .homepage import BLOCKS, CARD_KEY
+from .models import MatingCandidate, Product
+from .trending import refresh_top
+
+BATCH_SIZE = 500
+LOCK_KEY = 'catalog:lifecycle:lock'
+LOCK_TTL = 60 * 30
+
+
+class ExpiryReport:
+    """Итоги прохода: сколько объявлений найдено и архивировано"""
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.found = 0
+        self.archived = 0
+        self.batches = 0
+
+
+def expiry_cutoff(days=None, now=None):
+    """Объявления, не менявшиеся с этого момента, считаются устаревшими"""
+    if days is None:
+        days = settings.CATALOG_LISTING_TTL_DAYS
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _expire_batch(products, report):
+    ids = [product.id for product in products]
+    now = timezone.now()
+    with transaction.atomic():
+        # Условие повторяется в UPDATE: товар могли изменить после выборки
+        archived = Product.objects.filter(
+            id__in=ids, status='active', updated__lt=report.cutoff
+        ).update(status='archived', updated=now)
+        if archived != len(ids):
+            ids = set(Product.objects.filter(
+                id__in=ids, status='archived', updated=now
+            ).values_list('id', flat=True))
+            products = [product for product in products if product.id in ids]
+        Notification.objects.bulk_create([
+            Notification.product_status_notification(product.seller_id, product, 'archived')
+            for product in products
+        ])
+        MatingCandidate.objects.filter(product_id__in=ids).delete()
+    report.archived += len(products)
+    return products
+
+
+def _invalidate_caches(products):
+    # UPDATE не отправляет сигналы - сбрасываем то, что сбросили бы они
+    ids = {product.id for product in products}
+    cache.delete_many([CARD_KEY.format(id=pk) for pk in ids])
+    for block in BLOCKS:
+        if ids.intersection(block.cached_ids()):
+            block.invalidate()
+
+
+def expire_listings(days=None, batch_size=BATCH_SIZE, dry_run=False):
+    """
+    Переводит в архив активные объявления без изменений дольше days дней.
+
+    Кандидаты обходятся пачками по частичному индексу (updated, id) с
+    курсором по последней строке; на каждую пачку - один UPDATE и один
+    INSERT уведомлений владельцам.
+    """
+    report = ExpiryReport(expiry_cutoff(days))
+    if not dry_run and not cache.add(LOCK_KEY, 1, LOCK_TTL):
+        return report
+    try:
+        candidates = Product.objects.filter(
+            status='active', updated__lt=report.cutoff
+        ).only('id', 'seller_id', 'category_id', 'title', 'slug', 'updated').order_by('updated', 'id')
+        categories = set()
+        last = None
+        while True:
+            batch = candidates
+            if last is not None:
+                batch = batch.filter(
+                    Q(updated__gt=last.updated) | Q(updated=last.updated, id__gt=last.id)
+                )
+            products = list(batch[:batch_size])
+            if not products:
+                break
+            last = products[-1]
+            report.found += len(products)
+            report.batches += 1
+            if not dry_run:
+                expired = _expire_batch(products, report)
+                _invalidate_caches(expired)
+                categories.update(product.category_id for product in expired)
+        if categories:
+            refresh_top(categories)
+        return report
+    finally:
+        if not dry_run:
+            cache.delete(LOCK_KEY)
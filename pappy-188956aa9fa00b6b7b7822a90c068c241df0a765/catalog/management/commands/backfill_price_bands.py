@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Case, Value, When
+from catalog.models import PRICE_BANDS, Product
+
+class Command(BaseCommand):
+    help = 'Fill Product.price_band for existing products'
+
+    def handle(self, *args, **options):
+        # Тот же номер диапазона, что и price_band_for(), одним UPDATE
+        whens = [
+            When(price__lt=bound, then=Value(band))
+            for band, bound in enumerate(PRICE_BANDS)
+        ]
+        updated = Product.objects.filter(price__isnull=False).update(
+            price_band=Case(*whens, default=Value(len(PRICE_BANDS)))
+        )
+        Product.objects.filter(price__isnull=True).update(price_band=None)
+        self.stdout.write(self.style.SUCCESS(f'Updated price bands: {updated}'))
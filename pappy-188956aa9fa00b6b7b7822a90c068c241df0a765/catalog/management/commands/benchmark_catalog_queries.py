@@ -0,0 +1,53 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from catalog.hot_queries import HOT_QUERIES, QueryContext
+
+class Command(BaseCommand):
+    help = 'Time the most frequent catalog filter and sort queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of runs per query'
+        )
+        parser.add_argument(
+            '--category',
+            type=int,
+            help='Category id (default: the category with most active products)'
+        )
+        parser.add_argument(
+            '--query',
+            action='append',
+            choices=sorted(HOT_QUERIES),
+            help='Run only this query (can be repeated)'
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print the query plan of each query'
+        )
+
+    def handle(self, *args, **options):
+        ctx = QueryContext(category_id=options['category'])
+        if ctx.category_id is None:
+            raise CommandError('No active products to benchmark')
+
+        for name in options['query'] or HOT_QUERIES:
+            build = HOT_QUERIES[name]
+            timings = []
+            for _ in range(max(options['repeat'], 1)):
+                started = time.perf_counter()
+                rows = len(list(build(ctx)))
+                timings.append((time.perf_counter() - started) * 1000)
+
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(
+                f'{name:<28} rows={rows:<4} median={statistics.median(timings):.2f}ms '
+                f'p95={p95:.2f}ms'
+            )
+            if options['explain']:
+                self.stdout.write(build(ctx).explain())
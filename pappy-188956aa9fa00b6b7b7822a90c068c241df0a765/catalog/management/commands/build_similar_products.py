@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from catalog.models import Product, ProductSimilarity
+from catalog.recommendations import (
+    BATCH_SIZE, build_similarities, dirty_products, last_build_time
+)
+
+class Command(BaseCommand):
+    help = 'Build item-to-item similar products table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild neighbours for all active products'
+        )
+        parser.add_argument(
+            '--since',
+            help='Recompute products changed after this ISO datetime '
+                 '(default: time of the previous build)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of products computed per batch'
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('Invalid --since datetime')
+        elif not options['full']:
+            since = last_build_time()
+
+        if since is None:
+            product_ids = set(Product.objects.filter(status='active').values_list('id', flat=True))
+            # Соседи снятых с публикации товаров больше не нужны
+            removed, _ = ProductSimilarity.objects.exclude(product__status='active').delete()
+            self.stdout.write(f'Full rebuild, removed stale rows: {removed}')
+        else:
+            product_ids = dirty_products(since)
+            self.stdout.write(f'Incremental rebuild since {since.isoformat()}')
+
+        written = build_similarities(product_ids, batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Computed neighbours for {len(product_ids)} products, rows written: {written}'
+            )
+        )
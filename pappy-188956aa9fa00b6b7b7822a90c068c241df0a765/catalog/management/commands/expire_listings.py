@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from catalog.lifecycle import BATCH_SIZE, expire_listings
+
+class Command(BaseCommand):
+    help = 'Archive active listings that have not been updated for a configured number of days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.CATALOG_LISTING_TTL_DAYS,
+            help='Inactivity period after which a listing expires'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of listings archived per batch'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count expired listings without archiving them'
+        )
+
+    def handle(self, *args, **options):
+        report = expire_listings(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run']
+        )
+        if options['dry_run']:
+            self.stdout.write(f'{report.found} listings not updated since {report.cutoff:%Y-%m-%d} would be archived')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived {report.archived} of {report.found} expired listings in {report.batches} batches'
+            ))
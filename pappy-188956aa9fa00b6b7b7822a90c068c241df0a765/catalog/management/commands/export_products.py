@@ -0,0 +1,47 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from login_auth.models import User
+from catalog.bulk import FORMATS, export_products
+from catalog.models import Product
+
+class Command(BaseCommand):
+    help = 'Export products to CSV or JSONL in the import_products format'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file')
+        parser.add_argument(
+            '--seller',
+            help='Export only products of the seller with this phone number'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='File format (default: by file extension)'
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if fmt not in FORMATS:
+            raise CommandError(f'Unknown format: {fmt}')
+
+        products = Product.objects.all()
+        if options['seller']:
+            try:
+                products = products.filter(seller=User.objects.get(phone=options['seller']))
+            except User.DoesNotExist:
+                raise CommandError(f"Seller {options['seller']} not found")
+
+        started = time.monotonic()
+        rows = -1 if fmt == 'csv' else 0
+        with open(options['path'], 'w', newline='', encoding='utf-8') as f:
+            for chunk in export_products(products, fmt):
+                f.write(chunk)
+                rows += 1
+        elapsed = time.monotonic() - started
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Exported {rows} products, '
+                f'{rows / elapsed if elapsed else 0:.1f} rows/sec'
+            )
+        )
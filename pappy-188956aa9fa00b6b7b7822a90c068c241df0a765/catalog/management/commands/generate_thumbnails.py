@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from catalog.models import Product, ProductImage
+from catalog.thumbnails import generate_thumbnails
+
+class Command(BaseCommand):
+    help = 'Generate card thumbnails for product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker threads'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of images processed per batch'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Regenerate thumbnails for images that already have them'
+        )
+        parser.add_argument(
+            '--sync-main',
+            action='store_true',
+            help='Fill Product.main_image for products created before it existed'
+        )
+
+    def handle(self, *args, **options):
+        if options['sync_main']:
+            main_image = ProductImage.objects.filter(
+                product=OuterRef('pk')
+            ).order_by('-is_main', 'order', 'id').values('pk')[:1]
+            synced = Product.objects.filter(
+                main_image__isnull=True
+            ).update(main_image=Subquery(main_image))
+            self.stdout.write(f'Synced main images: {synced}')
+
+        images = ProductImage.objects.only('id', 'image').order_by('id')
+        if not options['all']:
+            images = images.filter(thumbnails_ready=False)
+
+        total_done = total_failed = 0
+        last_id = 0
+        while True:
+            batch = list(images.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            done, failed = generate_thumbnails(batch, workers=options['workers'])
+            ProductImage.objects.filter(id__in=done).update(thumbnails_ready=True)
+
+            total_done += len(done)
+            total_failed += len(failed)
+            for pk, error in failed:
+                self.stderr.write(f'Image {pk}: {error}')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Generated thumbnails for {total_done} images, failed: {total_failed}'
+            )
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from catalog.homepage import block_stats
+
+class Command(BaseCommand):
+    help = 'Show hit ratio of the catalog homepage block cache'
+
+    def handle(self, *args, **options):
+        for name, counts in block_stats().items():
+            self.stdout.write(
+                f"{name}: hit={counts['hit']} stale={counts['stale']} "
+                f"early={counts['early']} miss={counts['miss']} "
+                f"hit_ratio={counts['hit_ratio']:.2%}"
+            )
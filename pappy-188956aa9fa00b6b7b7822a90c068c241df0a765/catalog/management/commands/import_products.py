@@ -0,0 +1,74 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from login_auth.models import User
+from catalog.bulk import BATCH_SIZE, FORMATS, import_products
+
+class Command(BaseCommand):
+    help = 'Import products for a seller from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import')
+        parser.add_argument(
+            '--seller',
+            required=True,
+            help='Phone number of the seller who owns the imported products'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='File format (default: by file extension)'
+        )
+        parser.add_argument(
+            '--image-root',
+            help='Directory that image paths in the file are relative to'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of products inserted per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of threads copying images and rendering thumbnails'
+        )
+        parser.add_argument(
+            '--errors',
+            help='Write per-row errors to this JSONL file'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(phone=options['seller'])
+        except User.DoesNotExist:
+            raise CommandError(f"Seller {options['seller']} not found")
+
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        if fmt not in FORMATS:
+            raise CommandError(f'Unknown format: {fmt}')
+
+        with open(options['path'], newline='', encoding='utf-8') as f:
+            report = import_products(
+                f, fmt, seller,
+                image_root=options['image_root'],
+                batch_size=options['batch_size'],
+                workers=options['workers']
+            )
+
+        if options['errors']:
+            with open(options['errors'], 'w', encoding='utf-8') as f:
+                for error in report.errors:
+                    f.write(json.dumps(error, ensure_ascii=False) + '\n')
+        else:
+            for error in report.errors:
+                self.stderr.write(f"Line {error['line']}: {error['errors']}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Imported {report.created} products with {report.images} images, '
+                f'errors: {len(report.errors)}, '
+                f'{report.rows_per_second:.1f} rows/sec'
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from catalog.mating import MATING_CATEGORY_SLUG, sync_candidate
+from catalog.models import MatingCandidate, Product
+
+class Command(BaseCommand):
+    help = 'Rebuild the mating partner candidate index'
+
+    def handle(self, *args, **options):
+        products = Product.objects.filter(category__slug=MATING_CATEGORY_SLUG)
+        # Товары, покинувшие категорию вязки
+        removed, _ = MatingCandidate.objects.exclude(product__in=products).delete()
+
+        indexed = 0
+        for product in products.iterator(chunk_size=500):
+            if sync_candidate(product):
+                indexed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Indexed candidates: {indexed}, removed: {removed}')
+        )
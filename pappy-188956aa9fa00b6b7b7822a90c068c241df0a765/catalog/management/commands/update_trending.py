@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from catalog.trending import BATCH_SIZE, update_scores
+
+class Command(BaseCommand):
+    help = 'Fold new product activity into popularity scores and trending lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of activity events processed per batch'
+        )
+
+    def handle(self, *args, **options):
+        updated = update_scores(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated popularity of {len(updated)} products'))
@@ -0,0 +1,116 @@
+from django.db.models import Case, IntegerField, Q, Value, When
+from . import api
+from .category_tree import get_category_tree
+from .models import MatingCandidate, Product, age_band_for
+
+MATING_CATEGORY_SLUG = 'mating'
+
+OPPOSITE_GENDER = {'male': 'female', 'female': 'male'}
+
+# Вес совпадения признака в оценке совместимости
+SCORE_WEIGHTS = {
+    'region': 4,
+    'size': 2,
+    'age_band': 1,
+}
+
+PARTNER_FIELDS = ['id', 'slug', 'title', 'breed', 'gender', 'size', 'age', 'location', 'thumbnail']
+
+
+def breed_key(breed):
+    """Порода в нормализованном виде для сравнения"""
+    return ' '.join(breed.lower().split())
+
+
+def region_key(location):
+    """Регион - первая часть адреса: «Москва, ул. Ленина» -> «москва»"""
+    return location.split(',')[0].strip().lower()
+
+
+def is_mating_product(product):
+    category = get_category_tree().get(product.category_id)
+    return (
+        category is not None
+        and category.slug == MATING_CATEGORY_SLUG
+        and product.status == 'active'
+        and bool(product.breed)
+        and product.gender in OPPOSITE_GENDER
+    )
+
+
+def sync_candidate(product):
+    """Добавляет, обновляет или удаляет товар из индекса кандидатов"""
+    if not is_mating_product(product):
+        MatingCandidate.objects.filter(product_id=product.pk).delete()
+        return None
+    candidate, _ = MatingCandidate.objects.update_or_create(
+        product_id=product.pk,
+        defaults={
+            'seller_id': product.seller_id,
+            'breed_key': breed_key(product.breed),
+            'gender': product.gender,
+            'size': product.size,
+            'age_band': age_band_for(product.age),
+            'region': region_key(product.location),
+            'created': product.created,
+        }
+    )
+    return candidate
+
+
+def compatible_partners(pet):
+    """
+    Партнеры для питомца: та же порода, противоположный пол, другой владелец.
+
+    Отбор идет по индексу (breed_key, gender), порядок - по оценке
+    совместимости (регион, размер, возраст), затем по новизне.
+    """
+    candidate = pet.mating_candidate
+    score = sum(
+        (
+            Case(
+                When(**{f'mating_candidate__{field}': getattr(candidate, field)}, then=Value(weight)),
+                default=Value(0),
+                output_field=IntegerField()
+            )
+            for field, weight in SCORE_WEIGHTS.items()
+            if getattr(candidate, field) not in (None, '')
+        ),
+        Value(0, output_field=IntegerField())
+    )
+    return Product.objects.filter(
+        mating_candidate__breed_key=candidate.breed_key,
+        mating_candidate__gender=OPPOSITE_GENDER[candidate.gender]
+    ).exclude(
+        mating_candidate__seller_id=candidate.seller_id
+    ).annotate(score=score)
+
+
+def partners_page(pet, params):
+    """Страница кандидатов с курсором по (оценка, дата, id)"""
+    limit = api.parse_limit(params.get('limit'))
+    rows = compatible_partners(pet).order_by('-score', '-created', '-id').values(
+        'score', *api.columns_for(PARTNER_FIELDS)
+    )
+
+    cursor = params.get('cursor')
+    if cursor:
+        score, created, pk = api.decode_cursor(cursor, keys=1)
+        if not isinstance(score, int):
+            raise api.ApiError('Invalid cursor')
+        rows = rows.filter(
+            Q(score__lt=score)
+            | Q(score=score, created__lt=created)
+            | Q(score=score, created=created, id__lt=pk)
+        )
+
+    rows = list(rows[:limit + 1])
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'results': [
+            {**api.serialize_row(row, PARTNER_FIELDS), 'score': row['score']}
+            for row in rows
+        ],
+        'next_cursor': api.encode_cursor(rows[-1], 'score') if has_next else None,
+    }
@@ -1,10 +1,14 @@
+from bisect import bisect_right
 from django.db import models
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
 from django.utils.translation import gettext_lazy as _
+from django_cleanup import cleanup
 from unidecode import unidecode
+from .price_history import record_price_change
 
 class Category(models.Model):
     name = models.CharField(_('name'), max_length=200)
@@ -42,6 +46,23 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('catalog:category_detail', kwargs={'slug': self.slug})
 
+# Границы ценовых диапазонов (руб.) для сравнения товаров между собой
+PRICE_BANDS = [1000, 5000, 15000, 50000, 150000]
+
+# Границы возрастных групп
+AGE_BANDS = [1, 3, 7]
+
+def price_band_for(price):
+    """Номер ценового диапазона; None для товаров без цены"""
+    if price is None:
+        return None
+    return bisect_right(PRICE_BANDS, price)
+
+def age_band_for(age):
+    if age is None:
+        return None
+    return bisect_right(AGE_BANDS, age)
+
 class Product(models.Model):
     CONDITION_CHOICES = [
         ('new', _('New')),
@@ -87,6 +108,16 @@ class Product(models.Model):
     updated = models.DateTimeField(_('updated'), auto_now=True)
     views = models.PositiveIntegerField(_('views'), default=0)
     is_featured = models.BooleanField(_('featured'), default=False)
+    # log2 суммы весов событий с затуханием во времени (см. catalog.trending);
+    # пересчитывается командой update_trending
+    popularity_score = models.FloatField(_('popularity score'), default=0, editable=False)
+    # Номер ценового диапазона (PRICE_BANDS) для гистограммы цен в фасетах
+    price_band = models.PositiveSmallIntegerField(_('price band'), null=True, blank=True, editable=False)
+    # Денормализованная ссылка на главное изображение: карточки в списках
+    # получают его через select_related без отдельного запроса на товар
+    main_image = models.ForeignKey('ProductImage', verbose_name=_('main image'),
+                                  on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='+')
     
     class Meta:
         verbose_name = _('product')
@@ -96,12 +127,51 @@ class Product(models.Model):
             models.Index(fields=['-created']),
             models.Index(fields=['status']),
             models.Index(fields=['is_featured']),
+            # Списки каталога показывают только активные товары, поэтому
+            # индексы под них частичные: архивные строки в них не попадают,
+            # размер зависит только от живого каталога.
+            # Поиск, главная и API: новые, по цене, популярные
+            models.Index(fields=['-created', '-id'], name='product_active_created',
+                         condition=models.Q(status='active')),
+            models.Index(fields=['price'], name='product_active_price',
+                         condition=models.Q(status='active')),
+            models.Index(fields=['-popularity_score', '-id'], name='product_active_popular',
+                         condition=models.Q(status='active')),
+            models.Index(fields=['-created', '-id'], name='product_active_featured',
+                         condition=models.Q(status='active', is_featured=True)),
+            # Страницы категорий и поиск потерянных питомцев; (category,
+            # price_band) покрывает гистограмму цен без чтения таблицы
+            models.Index(fields=['category', '-created', '-id'], name='product_active_cat_created',
+                         condition=models.Q(status='active')),
+            models.Index(fields=['category', 'price'], name='product_active_cat_price',
+                         condition=models.Q(status='active')),
+            models.Index(fields=['category', 'price_band'], name='product_active_cat_band',
+                         condition=models.Q(status='active')),
+            models.Index(fields=['category', '-popularity_score', '-id'], name='product_active_cat_popular',
+                         condition=models.Q(status='active')),
+            # Обход кандидатов на истечение срока (catalog.lifecycle)
+            models.Index(fields=['updated', 'id'], name='product_active_updated',
+                         condition=models.Q(status='active')),
+            # Мои объявления: все статусы продавца, новые первыми
+            models.Index(fields=['seller', '-created'], name='product_seller_created'),
         ]
     
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Цена на момент загрузки - для истории изменений цены
+        instance._loaded_price = instance.__dict__.get('price', models.DEFERRED)
+        return instance
+    
     def save(self, *args, **kwargs):
+        self.price_band = price_band_for(self.price)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'price' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'price_band'}
+        old_price = getattr(self, '_loaded_price', models.DEFERRED)
         if not self.slug:
             # Convert Russian text to Latin characters and create base slug
             base_slug = slugify(unidecode(self.title))
@@ -113,16 +183,27 @@ class Product(models.Model):
                 n += 1
             self.slug = slug
         super().save(*args, **kwargs)
+        
+        if old_price is not models.DEFERRED and old_price != self.price:
+            record_price_change(self.pk, old_price, self.price)
+        self._loaded_price = self.price
     
     def get_absolute_url(self):
         return reverse('catalog:product_detail', kwargs={'slug': self.slug})
 
+# Файлы удаляет конвейер загрузок (uploads) по счетчику ссылок
+@cleanup.ignore
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, verbose_name=_('product'),
                                on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(_('image'), upload_to='products/')
     is_main = models.BooleanField(_('main image'), default=False)
     order = models.IntegerField(_('order'), default=0)
+    thumbnails_ready = models.BooleanField(_('thumbnails ready'), default=False)
+    # Обработанный файл (uploads.ImageBlob); пока пусто, в поле исходная загрузка
+    blob = models.ForeignKey('uploads.ImageBlob', verbose_name=_('processed file'),
+                             on_delete=models.SET_NULL, null=True, blank=True,
+                             editable=False, related_name='+')
     
     class Meta:
         verbose_name = _('product image')
@@ -137,6 +218,29 @@ class ProductImage(models.Model):
             # Если это первое изображение продукта, делаем его основным
             self.is_main = True
         super().save(*args, **kwargs)
+        
+        if self.is_main:
+            Product.objects.filter(pk=self.product_id).update(main_image=self)
+            self.product.main_image = self
+        else:
+            # Изображение перестало быть главным
+            Product.objects.filter(pk=self.product_id, main_image=self).update(main_image=None)
+    
+    def thumbnail_url(self, size='card', fmt='jpeg'):
+        """URL превью заданного размера; до генерации превью - оригинал"""
+        from .thumbnails import thumbnail_name
+        
+        if not self.thumbnails_ready:
+            return self.image.url
+        return self.image.storage.url(thumbnail_name(self.image.name, size, fmt))
+    
+    @property
+    def card_url(self):
+        return self.thumbnail_url('card', 'jpeg')
+    
+    @property
+    def card_webp_url(self):
+        return self.thumbnail_url('card', 'webp')
 
 class Favorite(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('user'),
@@ -191,4 +295,98 @@ class MatingRequest(models.Model):
         """Check if request is still valid (not expired)"""
         from django.utils import timezone
         from datetime import timedelta
-        return self.created > timezone.now() - timedelta(days=30) 
\ No newline at end of file
+        return self.created > timezone.now() - timedelta(days=30) 
+
+
+class ProductSimilarity(models.Model):
+    """Ближайшие соседи товара, рассчитанные командой build_similar_products"""
+    product = models.ForeignKey(Product, verbose_name=_('product'),
+                               on_delete=models.CASCADE, related_name='similarities')
+    neighbor = models.ForeignKey(Product, verbose_name=_('similar product'),
+                                on_delete=models.CASCADE, related_name='neighbor_of')
+    score = models.FloatField(_('score'))
+    rank = models.PositiveSmallIntegerField(_('rank'))
+    computed = models.DateTimeField(_('computed'), db_index=True)
+    
+    class Meta:
+        verbose_name = _('product similarity')
+        verbose_name_plural = _('product similarities')
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'],
+                                  name='unique_product_similarity_rank')
+        ]
+    
+    def __str__(self):
+        return f'{self.product_id} ~ {self.neighbor_id} ({self.score:.2f})'
+
+class MatingCandidate(models.Model):
+    """Индекс активных анкет для вязки; поддерживается сигналами Product"""
+    product = models.OneToOneField(Product, verbose_name=_('product'), primary_key=True,
+                                  on_delete=models.CASCADE, related_name='mating_candidate')
+    seller = models.ForeignKey(settings.AUTH_USER_MODEL, verbose_name=_('seller'),
+                              on_delete=models.CASCADE, related_name='+')
+    breed_key = models.CharField(_('breed key'), max_length=100)
+    gender = models.CharField(_('gender'), max_length=6, choices=Product.GENDER_CHOICES, blank=True)
+    size = models.CharField(_('size'), max_length=6, choices=Product.SIZE_CHOICES, blank=True)
+    age_band = models.PositiveSmallIntegerField(_('age band'), null=True, blank=True)
+    region = models.CharField(_('region'), max_length=200, blank=True)
+    created = models.DateTimeField(_('created'))
+    
+    class Meta:
+        verbose_name = _('mating candidate')
+        verbose_name_plural = _('mating candidates')
+        indexes = [
+            models.Index(fields=['breed_key', 'gender', 'region', 'size', 'age_band'],
+                        name='mating_candidate_lookup'),
+        ]
+    
+    def __str__(self):
+        return f'{self.breed_key} / {self.gender} / {self.region}'
+
+class PriceHistory(models.Model):
+    """Изменения цены товара; каждое пишется после коммита своей транзакции"""
+    product = models.ForeignKey(Product, verbose_name=_('product'),
+                               on_delete=models.CASCADE, related_name='price_history')
+    old_price = models.DecimalField(_('old price'), max_digits=10, decimal_places=2, null=True, blank=True)
+    new_price = models.DecimalField(_('new price'), max_digits=10, decimal_places=2, null=True, blank=True)
+    changed = models.DateTimeField(_('changed'), default=timezone.now)
+    
+    class Meta:
+        verbose_name = _('price change')
+        verbose_name_plural = _('price history')
+        ordering = ['-changed']
+        indexes = [
+            models.Index(fields=['product', '-changed'], name='price_history_product'),
+        ]
+    
+    def __str__(self):
+        return f'{self.product_id}: {self.old_price} -> {self.new_price}'
+
+class ProductActivity(models.Model):
+    """
+    Событие по товару для расчета популярности.
+
+    Таблица работает как очередь: update_trending учитывает события в
+    popularity_score и удаляет их.
+    """
+    VIEW = 'view'
+    FAVORITE = 'favorite'
+    DIALOG = 'dialog'
+    KIND_CHOICES = [
+        (VIEW, _('View')),
+        (FAVORITE, _('Favorite')),
+        (DIALOG, _('Dialog')),
+    ]
+    
+    product = models.ForeignKey(Product, verbose_name=_('product'),
+                               on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(_('kind'), max_length=8, choices=KIND_CHOICES)
+    created = models.DateTimeField(_('created'), default=timezone.now)
+    
+    class Meta:
+        verbose_name = _('product activity')
+        verbose_name_plural = _('product activity')
+    
+    def __str__(self):
+        return f'{self.product_id}: {self.kind}'
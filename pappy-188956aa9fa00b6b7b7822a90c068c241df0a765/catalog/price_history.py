@@ -0,0 +1,18 @@
+from django.db import transaction
+from django.utils import timezone
+
+
+def record_price_change(product_id, old_price, new_price):
+    """
+    Записывает изменение цены после коммита.
+
+    У каждого изменения свой колбэк on_commit: при откате транзакции или
+    точки сохранения Django отбрасывает его вместе с изменением, так что в
+    историю не попадают цены, которых не было. Вне транзакции запись сразу.
+    """
+    from .models import PriceHistory
+
+    changed = timezone.now()
+    transaction.on_commit(lambda: PriceHistory.objects.create(
+        product_id=product_id, old_price=old_price, new_price=new_price, changed=changed
+    ))
@@ -0,0 +1,270 @@
+import heapq
+import math
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from chat.models import Dialog
+from .models import Favorite, Product, ProductSimilarity, age_band_for, price_band_for
+
+# Количество соседей, сохраняемых для каждого товара
+TOP_K = 8
+
+# Сколько самых новых товаров блока рассматривается как кандидаты
+CANDIDATES_PER_BLOCK = 200
+
+BATCH_SIZE = 500
+
+WEIGHTS = {
+    'favorites': 3.0,
+    'dialogs': 2.0,
+    'breed': 2.0,
+    'price_band': 1.0,
+    'location': 1.0,
+    'size': 0.5,
+    'age_band': 0.5,
+    'gender': 0.3,
+}
+
+ATTRIBUTES = ('breed', 'location', 'size', 'gender', 'price_band', 'age_band')
+
+PRODUCT_FIELDS = ('id', 'category_id', 'breed', 'location', 'size', 'gender', 'age', 'price', 'created')
+
+
+def _normalize(row):
+    return {
+        'id': row['id'],
+        'category_id': row['category_id'],
+        'created': row['created'],
+        'breed': row['breed'].strip().lower(),
+        'location': row['location'].strip().lower(),
+        'size': row['size'],
+        'gender': row['gender'],
+        'price_band': price_band_for(row['price']),
+        'age_band': age_band_for(row['age']),
+    }
+
+
+def attribute_score(a, b):
+    """Совпадение характеристик двух товаров"""
+    return sum(
+        WEIGHTS[key] for key in ATTRIBUTES
+        if a[key] not in (None, '') and a[key] == b[key]
+    )
+
+
+def _co_occurrence(pairs, targets, popularity):
+    """
+    Косинусная близость товаров по общим пользователям.
+
+    pairs - пары (пользователь, товар) для пользователей, которые
+    взаимодействовали хотя бы с одним товаром из targets.
+    """
+    by_user = defaultdict(set)
+    for user_id, product_id in pairs:
+        by_user[user_id].add(product_id)
+
+    counts = defaultdict(Counter)
+    for products in by_user.values():
+        for product_id in products & targets:
+            for other_id in products:
+                if other_id != product_id:
+                    counts[product_id][other_id] += 1
+
+    return {
+        product_id: {
+            other_id: count / math.sqrt(popularity[product_id] * popularity[other_id])
+            for other_id, count in neighbors.items()
+        }
+        for product_id, neighbors in counts.items()
+    }
+
+
+def _favorite_signals(targets):
+    users = Favorite.objects.filter(product_id__in=targets).values('user_id')
+    pairs = list(Favorite.objects.filter(user_id__in=users).values_list('user_id', 'product_id'))
+    popularity = dict(
+        Favorite.objects.filter(product_id__in={pid for _uid, pid in pairs})
+        .values_list('product_id').annotate(total=Count('id')).order_by()
+    )
+    return _co_occurrence(pairs, targets, popularity)
+
+
+def _dialog_signals(targets):
+    # Покупатели, начавшие диалог по товару (без продавца)
+    starts = Dialog.participants.through.objects.filter(
+        dialog__product__isnull=False
+    ).exclude(user_id=F('dialog__product__seller_id'))
+    users = starts.filter(dialog__product_id__in=targets).values('user_id')
+    pairs = list(starts.filter(user_id__in=users).values_list('user_id', 'dialog__product_id').distinct())
+    popularity = Counter(pid for _uid, pid in pairs)
+    return _co_occurrence(pairs, targets, popularity)
+
+
+def _blocks(rows):
+    """Группы кандидатов: та же категория и порода, та же категория и цена"""
+    blocks = defaultdict(list)
+    for row in sorted(rows, key=lambda r: r['created'], reverse=True):
+        if row['breed']:
+            blocks[('breed', row['category_id'], row['breed'])].append(row)
+        blocks[('price', row['category_id'], row['price_band'])].append(row)
+    return {key: members[:CANDIDATES_PER_BLOCK] for key, members in blocks.items()}
+
+
+def _block_keys(row):
+    if row['breed']:
+        yield ('breed', row['category_id'], row['breed'])
+    yield ('price', row['category_id'], row['price_band'])
+
+
+class CandidatePool:
+    """
+    Активные товары, среди которых ищутся соседи, и их блоки. Категория
+    читается из базы один раз за запуск, сколько бы пачек в нее ни попало.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.blocks = {}
+        self.categories = set()
+
+    def load_categories(self, categories):
+        missing = set(categories) - self.categories
+        if not missing:
+            return
+        rows = [
+            _normalize(row)
+            for row in Product.objects.filter(
+                category_id__in=missing, status='active'
+            ).values(*PRODUCT_FIELDS)
+        ]
+        self.rows.update((row['id'], row) for row in rows)
+        self.blocks.update(_blocks(rows))
+        self.categories |= missing
+
+    def load_ids(self, ids):
+        """Отдельные товары других категорий, связанные через пользователей"""
+        missing = [product_id for product_id in ids if product_id not in self.rows]
+        if missing:
+            self.rows.update(
+                (row['id'], _normalize(row))
+                for row in Product.objects.filter(
+                    id__in=missing, status='active'
+                ).values(*PRODUCT_FIELDS)
+            )
+
+
+def compute_neighbors(target_ids, pool=None):
+    """
+    Top-k соседей для переданных активных товаров. Пул кандидатов можно
+    передавать между пачками одного запуска.
+    """
+    targets = {
+        row['id']: _normalize(row)
+        for row in Product.objects.filter(id__in=target_ids, status='active').values(*PRODUCT_FIELDS)
+    }
+    if not targets:
+        return {}
+
+    target_set = set(targets)
+    favorites = _favorite_signals(target_set)
+    dialogs = _dialog_signals(target_set)
+
+    pool = pool if pool is not None else CandidatePool()
+    pool.load_categories({row['category_id'] for row in targets.values()})
+    linked = set()
+    for signals in (favorites, dialogs):
+        for neighbors in signals.values():
+            linked.update(neighbors)
+    pool.load_ids(linked)
+
+    result = {}
+    for product_id, row in targets.items():
+        candidates = set(favorites.get(product_id, ())) | set(dialogs.get(product_id, ()))
+        for key in _block_keys(row):
+            candidates.update(member['id'] for member in pool.blocks.get(key, ()))
+        candidates.discard(product_id)
+
+        scored = []
+        for other_id in candidates:
+            other = pool.rows.get(other_id)
+            if other is None:
+                continue
+            score = (
+                WEIGHTS['favorites'] * favorites.get(product_id, {}).get(other_id, 0)
+                + WEIGHTS['dialogs'] * dialogs.get(product_id, {}).get(other_id, 0)
+                + attribute_score(row, other)
+            )
+            if score > 0:
+                scored.append((score, other['created'], other_id))
+        result[product_id] = [
+            (other_id, score)
+            for score, _created, other_id in heapq.nlargest(TOP_K, scored)
+        ]
+    return result
+
+
+def dirty_products(since):
+    """Товары, соседей которых нужно пересчитать после since"""
+    ids = set(Product.objects.filter(updated__gte=since).values_list('id', flat=True))
+    ids.update(Favorite.objects.filter(created__gte=since).values_list('product_id', flat=True))
+    ids.update(Dialog.objects.filter(
+        created_at__gte=since, product__isnull=False
+    ).values_list('product_id', flat=True))
+    # Товары, у которых в соседях есть измененные
+    ids.update(ProductSimilarity.objects.filter(
+        neighbor_id__in=Product.objects.filter(updated__gte=since).values('id')
+    ).values_list('product_id', flat=True))
+    return ids
+
+
+def last_build_time():
+    return ProductSimilarity.objects.order_by('-computed').values_list('computed', flat=True).first()
+
+
+def build_similarities(product_ids, batch_size=BATCH_SIZE):
+    """
+    Пересчитывает и сохраняет соседей товаров пачками. Товары идут по
+    категориям, так что пачки одной категории пользуются одним пулом.
+
+    Все строки помечаются временем начала запуска: данные читаются после
+    него, поэтому изменения во время расчета попадут в следующий запуск.
+    """
+    started = timezone.now()
+    product_ids = sorted(product_ids)
+    categories = {}
+    for start in range(0, len(product_ids), batch_size):
+        categories.update(Product.objects.filter(
+            id__in=product_ids[start:start + batch_size]
+        ).values_list('id', 'category_id'))
+    product_ids.sort(key=lambda product_id: (categories.get(product_id) or 0, product_id))
+
+    pool = CandidatePool()
+    written = 0
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        neighbors = compute_neighbors(batch, pool)
+        rows = [
+            ProductSimilarity(
+                product_id=product_id,
+                neighbor_id=neighbor_id,
+                score=score,
+                rank=rank,
+                computed=started
+            )
+            for product_id, items in neighbors.items()
+            for rank, (neighbor_id, score) in enumerate(items)
+        ]
+        with transaction.atomic():
+            ProductSimilarity.objects.filter(product_id__in=batch).delete()
+            ProductSimilarity.objects.bulk_create(rows)
+        written += len(rows)
+    return written
+
+
+def similar_products(product):
+    """Похожие товары по порядку близости; читаются по индексу (product, rank)"""
+    return Product.objects.filter(
+        neighbor_of__product=product,
+        status='active'
+    ).select_related('main_image').order_by('neighbor_of__rank')
@@ -0,0 +1,118 @@
+import time
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Set
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
+from .models import Favorite, Product, ProductActivity
+from .trending import record_activity
+
+class FavoriteService:
+    """
+    Избранное пользователя.
+
+    Идентификаторы избранных товаров хранятся в кэше отсортированным
+    массивом int64 под версией пользователя; изменение увеличивает версию.
+    Массив, собранный по старым данным, остается под старой версией и
+    больше не читается.
+    """
+
+    CACHE_KEY = 'catalog:favorites:{user_id}:{version}'
+    VERSION_KEY = 'catalog:favorites:{user_id}:version'
+    CACHE_TTL = 60 * 60 * 24
+    MAX_BULK_SIZE = 500
+
+    def __init__(self, user):
+        self.user = user
+        self.version_key = self.VERSION_KEY.format(user_id=user.pk) if user.is_authenticated else None
+
+    def annotate(self, queryset):
+        """Добавляет к товарам признак is_favorite одним подзапросом"""
+        if not self.user.is_authenticated:
+            return queryset.annotate(is_favorite=Value(False, output_field=BooleanField()))
+        return queryset.annotate(is_favorite=Exists(
+            Favorite.objects.filter(user=self.user, product=OuterRef('pk'))
+        ))
+
+    def ids(self) -> array:
+        """Отсортированный массив id избранных товаров"""
+        if not self.user.is_authenticated:
+            return array('q')
+        # Версия читается до базы: если данные изменятся после запроса,
+        # массив попадет под уже устаревшую версию
+        key = self.CACHE_KEY.format(user_id=self.user.pk, version=self._version())
+        packed = cache.get(key)
+        if packed is not None:
+            ids = array('q')
+            ids.frombytes(packed)
+            return ids
+        ids = array('q', Favorite.objects.filter(
+            user=self.user
+        ).order_by('product_id').values_list('product_id', flat=True))
+        self._store(key, ids)
+        return ids
+
+    def contains(self, product_id: int) -> bool:
+        ids = self.ids()
+        index = bisect_left(ids, product_id)
+        return index < len(ids) and ids[index] == product_id
+
+    def _store(self, key, ids: array):
+        cache.set(key, ids.tobytes(), self.CACHE_TTL)
+
+    def _version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # Начало от времени: после вытеснения счетчика старые массивы не всплывут
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def _bump_version(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # Счетчик вытеснен - следующее чтение начнет новую версию
+            pass
+
+    def _invalidate(self):
+        # Массив не правится на месте: параллельные изменения (две вкладки)
+        # теряли бы друг друга. Версия увеличивается сразу и еще раз после
+        # коммита - массив, собранный до коммита, не будет прочитан
+        self._bump_version()
+        transaction.on_commit(self._bump_version)
+
+    def add(self, product_ids: Iterable[int]) -> Set[int]:
+        """Добавляет существующие товары в избранное одним INSERT"""
+        existing = set(Product.objects.filter(
+            id__in=set(product_ids)
+        ).values_list('id', flat=True))
+        # Новые строки определяются по базе, а не по кэшу, который может отставать
+        added = existing.difference(Favorite.objects.filter(
+            user=self.user, product_id__in=existing
+        ).values_list('product_id', flat=True))
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, product_id=product_id) for product_id in existing],
+            ignore_conflicts=True
+        )
+        self._invalidate()
+        record_activity(added, ProductActivity.FAVORITE)
+        return existing
+
+    def remove(self, product_ids: Iterable[int]) -> Set[int]:
+        """Удаляет товары из избранного одним DELETE"""
+        product_ids = set(product_ids)
+        Favorite.objects.filter(user=self.user, product_id__in=product_ids).delete()
+        self._invalidate()
+        return product_ids
+
+    def toggle(self, product_id: int) -> bool:
+        """Переключает товар в избранном, возвращает новое состояние"""
+        deleted, _ = Favorite.objects.filter(user=self.user, product_id=product_id).delete()
+        if deleted:
+            self._invalidate()
+            return False
+        if not self.add([product_id]):
+            raise Product.DoesNotExist
+        return True
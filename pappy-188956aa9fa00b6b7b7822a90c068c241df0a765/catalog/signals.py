@@ -0,0 +1,64 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from chat.models import Dialog
+from .models import Category, Product, ProductActivity, ProductImage
+from .category_tree import invalidate_category_tree
+from .homepage import BLOCKS, invalidate_product_card
+from .mating import sync_candidate
+from .thumbnails import delete_thumbnails
+from .trending import record_activity
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def handle_category_change(sender, instance, **kwargs):
+    """
+    Сбрасывает кэшированное дерево категорий. Сразу - чтобы изменение видела
+    сама транзакция, и еще раз после коммита: дерево, которое другой процесс
+    успел собрать из старых данных под промежуточной версией, отбрасывается.
+    """
+    invalidate_category_tree()
+    transaction.on_commit(invalidate_category_tree)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def handle_product_change(sender, instance, **kwargs):
+    """Сбрасывает карточку товара и блоки главной, в которые он попадает"""
+    invalidate_product_card(instance.pk)
+    deleted = 'created' not in kwargs
+    for block in BLOCKS:
+        if block.affected_by(instance, deleted=deleted):
+            block.invalidate()
+
+@receiver(post_save, sender=Product)
+def handle_mating_product_save(sender, instance, **kwargs):
+    """Поддерживает индекс кандидатов для вязки"""
+    sync_candidate(instance)
+
+@receiver(post_save, sender=ProductImage)
+def handle_product_image_save(sender, instance, **kwargs):
+    """Карточка товара хранит главное изображение"""
+    invalidate_product_card(instance.product_id)
+
+@receiver(post_delete, sender=ProductImage)
+def handle_product_image_delete(sender, instance, **kwargs):
+    """Удаляет превью и назначает новое главное изображение"""
+    invalidate_product_card(instance.product_id)
+
+    # Превью обработанного файла общие и удаляются вместе с ним
+    if instance.image and not instance.blob_id:
+        delete_thumbnails(instance.image)
+    
+    if instance.is_main:
+        next_image = ProductImage.objects.filter(
+            product_id=instance.product_id
+        ).order_by('order', 'id').first()
+        if next_image:
+            next_image.is_main = True
+            next_image.save()
+
+@receiver(post_save, sender=Dialog)
+def handle_dialog_created(sender, instance, created, **kwargs):
+    """Начало диалога по товару учитывается в популярности"""
+    if created and instance.product_id:
+        record_activity([instance.product_id], ProductActivity.DIALOG)
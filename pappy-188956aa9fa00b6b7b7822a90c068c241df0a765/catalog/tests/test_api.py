@@ -0,0 +1,73 @@
+import json
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, Product
+from catalog.api import MAX_PAGE_SIZE
+
+class ListingApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Собаки')
+        self.products = [
+            Product.objects.create(
+                seller=self.user,
+                category=self.category,
+                title=f'Щенок {i}',
+                description='Описание',
+                price=1000 + i,
+                condition='new',
+                status='active'
+            )
+            for i in range(5)
+        ]
+        # Одинаковое время создания проверяет курсор по id
+        Product.objects.update(created=self.products[0].created)
+
+    def test_sparse_fieldset(self):
+        """Test that only the requested fields are returned"""
+        response = self.client.get(reverse('catalog:api_products'), {'fields': 'id,title'})
+        self.assertEqual(response.status_code, 200)
+        for row in response.json()['results']:
+            self.assertEqual(set(row), {'id', 'title'})
+
+        response = self.client.get(reverse('catalog:api_products'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        """Test that cursors walk all rows once and the page size is capped"""
+        seen = []
+        params = {'limit': 2, 'fields': 'id'}
+        while True:
+            with self.assertNumQueries(1):
+                data = self.client.get(reverse('catalog:api_products'), params).json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen.extend(row['id'] for row in data['results'])
+            if not data['next_cursor']:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(seen, sorted((p.id for p in self.products), reverse=True))
+
+        response = self.client.get(reverse('catalog:api_products'), {'limit': 10 ** 6})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.json()['results']), MAX_PAGE_SIZE)
+
+        response = self.client.get(reverse('catalog:api_products'), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streaming_export(self):
+        """Test that the export is streamed as a single JSON array"""
+        self.client.login(phone='+79991234567', password='testpass123')
+        response = self.client.get(
+            reverse('catalog:api_products_export'),
+            {'fields': 'id,price,created'}
+        )
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['price'], '1004.00')
@@ -0,0 +1,149 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+from login_auth.models import User
+from catalog.bulk import export_products, import_products
+from catalog.category_tree import get_category_tree
+from catalog.models import Category, Product
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+def jsonl(rows):
+    return io.StringIO(''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows))
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BulkImportTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.shelter = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123',
+            is_shelter=True
+        )
+        self.category = Category.objects.create(name='Собаки', slug='dogs')
+
+    def row(self, title='Щенок', **kwargs):
+        row = {
+            'category': 'dogs',
+            'title': title,
+            'description': 'Описание',
+            'price': '1500',
+            'condition': 'new',
+            'location': 'Москва',
+        }
+        row.update(kwargs)
+        return row
+
+    def test_errors_reported_per_row(self):
+        """Test that invalid rows are reported by line and valid ones are imported"""
+        Product.objects.create(
+            seller=self.shelter, category=self.category, title='Щенок',
+            description='Описание', condition='new'
+        )
+        report = import_products(jsonl([
+            self.row(),
+            self.row(category='cats'),
+            self.row(price='дорого'),
+            self.row(),
+        ]), 'jsonl', self.shelter)
+
+        self.assertEqual(report.created, 2)
+        self.assertEqual([error['line'] for error in report.errors], [2, 3])
+        self.assertIn('category', report.errors[0]['errors'])
+        self.assertIn('price', report.errors[1]['errors'])
+        self.assertEqual(
+            sorted(Product.objects.values_list('slug', flat=True)),
+            ['shchenok', 'shchenok-1', 'shchenok-2']
+        )
+
+    def test_queries_do_not_grow_with_rows(self):
+        """Test that validation and inserts are batched"""
+        get_category_tree()
+        counts = []
+        for size in (5, 40):
+            rows = [self.row(f'Щенок {size} {i}') for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                import_products(jsonl(rows), 'jsonl', self.shelter)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_images_and_round_trip(self):
+        """Test that local images are stored with thumbnails and export re-imports"""
+        image_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_root, ignore_errors=True)
+        Image.new('RGB', (800, 600), color='red').save(os.path.join(image_root, 'dog.jpg'))
+
+        csv_file = io.StringIO(
+            'category,title,description,price,condition,images\n'
+            'dogs,Щенок,Описание,1500,new,dog.jpg\n'
+            'dogs,Щенок,Описание,1500,new,../etc/passwd\n'
+        )
+        report = import_products(csv_file, 'csv', self.shelter, image_root=image_root)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(report.images, 1)
+        self.assertIn('images', report.errors[0]['errors'])
+
+        product = Product.objects.select_related('main_image').get()
+        self.assertTrue(product.main_image.thumbnails_ready)
+
+        other = User.objects.create_user(phone='+79997654321', password='testpass123')
+        exported = ''.join(export_products(Product.objects.filter(seller=self.shelter), 'jsonl'))
+        report = import_products(io.StringIO(exported), 'jsonl', other, image_root=MEDIA_ROOT)
+        self.assertEqual((report.created, report.images, report.errors), (1, 1, []))
+
+        copy = Product.objects.get(seller=other)
+        for field in ('title', 'description', 'price', 'condition', 'category_id'):
+            self.assertEqual(getattr(copy, field), getattr(product, field))
+
+    def test_invalid_image_reported_per_row(self):
+        """Test that a file Pillow cannot open is an images error, not a main image"""
+        image_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_root, ignore_errors=True)
+        with open(os.path.join(image_root, 'notes.jpg'), 'w') as f:
+            f.write('не картинка')
+
+        report = import_products(jsonl([self.row(images=['notes.jpg'])]), 'jsonl', self.shelter,
+                                 image_root=image_root)
+        self.assertEqual(report.created, 0)
+        self.assertEqual(report.errors[0]['errors'], {'images': ['Not a valid image: notes.jpg']})
+
+    def test_image_failure_rolls_back_batch(self):
+        """Test that a failing image stage leaves neither products nor stored files"""
+        image_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, image_root, ignore_errors=True)
+        for name in ('a.jpg', 'b.jpg'):
+            Image.new('RGB', (80, 60), color='red').save(os.path.join(image_root, name))
+        stored = os.path.join(MEDIA_ROOT, 'products')
+        before = set(os.listdir(stored)) if os.path.isdir(stored) else set()
+
+        rows = [self.row(images=['a.jpg']), self.row(images=['b.jpg'])]
+        with mock.patch('catalog.bulk.ProductImage.objects.bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                import_products(jsonl(rows), 'jsonl', self.shelter, image_root=image_root)
+        self.assertFalse(Product.objects.exists())
+        after = set(os.listdir(stored)) if os.path.isdir(stored) else set()
+        self.assertEqual(after, before)
+
+    def test_export_view_streams_csv(self):
+        """Test that sellers can download their products as CSV"""
+        import_products(jsonl([self.row(), self.row()]), 'jsonl', self.shelter)
+        self.client.login(phone='+79991234567', password='testpass123')
+        response = self.client.get(reverse('catalog:my_products_export'), {'format': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('category,title'))
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, Product
+from catalog.category_tree import get_category_tree
+
+class CategoryTreeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.animals = Category.objects.create(name='Животные')
+        self.dogs = Category.objects.create(name='Собаки', parent=self.animals)
+        self.huskies = Category.objects.create(name='Хаски', parent=self.dogs)
+        self.cats = Category.objects.create(name='Кошки', parent=self.animals)
+
+    def test_tree_loaded_in_one_query(self):
+        """Test that the whole tree is materialized with one query and then cached"""
+        with self.assertNumQueries(1):
+            tree = get_category_tree()
+            roots = tree.roots()
+            self.assertEqual(roots, [self.animals])
+            self.assertEqual(roots[0].children.count(), 2)
+            self.assertTrue(roots[0].children.exists())
+        with self.assertNumQueries(0):
+            get_category_tree()
+
+    def test_descendant_ids_at_any_depth(self):
+        """Test that descendants include all nested levels"""
+        tree = get_category_tree()
+        self.assertEqual(
+            tree.descendant_ids(self.animals.id),
+            {self.animals.id, self.dogs.id, self.huskies.id, self.cats.id}
+        )
+        self.assertEqual(tree.descendant_ids(self.huskies.id), {self.huskies.id})
+
+    def test_invalidation_on_save_and_delete(self):
+        """Test that category changes rebuild the tree"""
+        get_category_tree()
+        birds = Category.objects.create(name='Птицы', parent=self.animals)
+        self.assertIn(birds.id, get_category_tree().descendant_ids(self.animals.id))
+
+        birds.delete()
+        self.assertNotIn(birds.id, get_category_tree().descendant_ids(self.animals.id))
+
+    def test_tree_built_before_commit_is_discarded(self):
+        """Test that a tree cached while the change was uncommitted is rebuilt after commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dogs.name = 'Псы'
+            self.dogs.save()
+            # Так другой процесс собрал бы дерево до коммита
+            stale = get_category_tree()
+        self.assertIsNot(get_category_tree(), stale)
+
+    def test_search_filters_nested_categories(self):
+        """Test that filtering by a root category finds products deeper than one level"""
+        Product.objects.create(
+            seller=self.user,
+            category=self.huskies,
+            title='Щенок хаски',
+            description='Описание',
+            price=15000,
+            condition='new',
+            status='active'
+        )
+        response = self.client.get(reverse('catalog:search'), {'category': self.animals.id})
+        self.assertEqual(len(response.context['products']), 1)
+
+        response = self.client.get(
+            reverse('catalog:category_detail', kwargs={'slug': self.animals.slug})
+        )
+        self.assertEqual(response.context['products'].paginator.count, 1)
@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, Product
+from catalog.category_tree import get_category_tree
+from catalog.facets import compute_facets, facet_signature
+
+class FacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.dogs = Category.objects.create(name='Собаки')
+        self.cats = Category.objects.create(name='Кошки')
+        for category, condition, size, gender in [
+            (self.dogs, 'new', 'small', 'male'),
+            (self.dogs, 'new', 'large', 'female'),
+            (self.dogs, 'used', 'large', 'male'),
+            (self.cats, 'new', 'small', 'female'),
+        ]:
+            Product.objects.create(
+                seller=self.user,
+                category=category,
+                title='Питомец',
+                description='Описание',
+                price=1000,
+                condition=condition,
+                size=size,
+                gender=gender,
+                status='active'
+            )
+
+    def get_counts(self, facets, name):
+        facet = next(f for f in facets if f['name'] == name)
+        return {item['value']: item['count'] for item in facet['values']}
+
+    def test_compute_facets_in_one_query(self):
+        """Test that all facet counts come from a single grouped query"""
+        queryset = Product.objects.filter(status='active')
+        get_category_tree()
+        with self.assertNumQueries(1):
+            facets = compute_facets(queryset)
+        self.assertEqual(self.get_counts(facets, 'condition'), {'new': 3, 'used': 1})
+        self.assertEqual(self.get_counts(facets, 'size'), {'small': 2, 'large': 2})
+        self.assertEqual(self.get_counts(facets, 'gender'), {'male': 2, 'female': 2})
+        self.assertEqual(
+            self.get_counts(facets, 'category'),
+            {self.dogs.id: 3, self.cats.id: 1}
+        )
+
+    def test_signature_is_normalized(self):
+        """Test that parameter order and pagination do not change the signature"""
+        first = facet_signature('search', {'condition': ['used', 'new'], 'q': 'кот', 'page': '2'})
+        second = facet_signature('search', {'q': 'кот', 'condition': ['new', 'used']})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, facet_signature('search', {'q': 'пес'}))
+
+    def test_facets_are_cached(self):
+        """Test that repeated requests reuse cached facet counts"""
+        url = reverse('catalog:search_facets')
+        response = self.client.get(url, {'condition': 'new'})
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()['facets']
+        self.assertEqual(self.get_counts(facets, 'condition'), {'new': 3})
+
+        with self.assertNumQueries(0):
+            self.client.get(url, {'condition': 'new'})
+
+    def test_facets_in_template_context(self):
+        """Test that listing pages expose facets"""
+        response = self.client.get(reverse('catalog:search'), {'q': 'Питомец'})
+        self.assertIn('facets', response.context)
+        response = self.client.get(
+            reverse('catalog:category_detail', kwargs={'slug': self.dogs.slug})
+        )
+        self.assertEqual(self.get_counts(response.context['facets'], 'condition'), {'new': 2, 'used': 1})
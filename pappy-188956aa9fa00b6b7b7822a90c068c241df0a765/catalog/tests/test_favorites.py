@@ -0,0 +1,105 @@
+import json
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, Favorite, Product, ProductActivity
+from catalog.services import FavoriteService
+
+class FavoriteServiceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Собаки')
+        self.products = [
+            Product.objects.create(
+                seller=self.user,
+                category=self.category,
+                title=f'Щенок {i}',
+                description='Описание',
+                condition='new',
+                status='active'
+            )
+            for i in range(4)
+        ]
+        self.service = FavoriteService(self.user)
+
+    def test_annotate_is_favorite(self):
+        """Test that is_favorite is computed in the listing query"""
+        Favorite.objects.create(user=self.user, product=self.products[1])
+        with self.assertNumQueries(1):
+            flags = {p.id: p.is_favorite for p in self.service.annotate(Product.objects.all())}
+        self.assertEqual([pid for pid, flag in flags.items() if flag], [self.products[1].id])
+
+    def test_toggle_invalidates_cache(self):
+        """Test that toggling drops the cached id array, which is reloaded once"""
+        self.assertEqual(len(self.service.ids()), 0)
+        self.assertTrue(self.service.toggle(self.products[2].id))
+        # Другая вкладка того же пользователя
+        self.assertTrue(FavoriteService(self.user).toggle(self.products[0].id))
+        with self.assertNumQueries(1):
+            self.service.ids()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.service.ids().tolist(),
+                sorted([self.products[0].id, self.products[2].id])
+            )
+            self.assertTrue(self.service.contains(self.products[2].id))
+        with self.assertNumQueries(1):
+            self.assertFalse(self.service.toggle(self.products[2].id))
+        self.assertEqual(self.service.ids().tolist(), [self.products[0].id])
+        self.assertFalse(Favorite.objects.filter(product=self.products[2]).exists())
+
+    def test_array_built_before_change_is_not_served(self):
+        """Test that an array read from the database before a toggle is stored under a stale version"""
+        real_store = FavoriteService._store
+
+        def store_after_toggle(service, key, ids):
+            # Другая вкладка меняет избранное между запросом и записью в кэш
+            FavoriteService(self.user).toggle(self.products[1].id)
+            real_store(service, key, ids)
+
+        with mock.patch.object(FavoriteService, '_store', autospec=True, side_effect=store_after_toggle):
+            self.assertEqual(self.service.ids().tolist(), [])
+        self.assertEqual(FavoriteService(self.user).ids().tolist(), [self.products[1].id])
+
+    def test_add_records_events_for_new_rows(self):
+        """Test that favorite events follow the database, not a stale cached array"""
+        Favorite.objects.create(user=self.user, product=self.products[0])
+        self.assertTrue(self.service.contains(self.products[0].id))
+        # Строка удалена в обход сервиса: кэш о ней не знает
+        Favorite.objects.all().delete()
+
+        self.service.add([self.products[0].id, self.products[1].id])
+        self.assertEqual(
+            sorted(ProductActivity.objects.values_list('product_id', flat=True)),
+            [self.products[0].id, self.products[1].id]
+        )
+
+    def test_bulk_sync_endpoint(self):
+        """Test that offline changes are applied in bulk and unknown ids are skipped"""
+        self.client.login(phone='+79991234567', password='testpass123')
+        Favorite.objects.create(user=self.user, product=self.products[3])
+        response = self.client.post(
+            reverse('catalog:sync_favorites'),
+            json.dumps({
+                'add': [self.products[0].id, self.products[1].id, 999999],
+                'remove': [self.products[3].id],
+            }),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['favorite_ids'],
+            sorted([self.products[0].id, self.products[1].id])
+        )
+
+        response = self.client.post(
+            reverse('catalog:sync_favorites'), '{"add": "x"}',
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,92 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, Product
+from catalog.homepage import CARD_KEY, FEATURED, LATEST, block_stats, hydrate_products
+
+class HomepageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Собаки')
+        self.product = self.create_product('Щенок', is_featured=True)
+
+    def create_product(self, title, **kwargs):
+        defaults = {
+            'seller': self.user,
+            'category': self.category,
+            'title': title,
+            'description': 'Описание',
+            'price': 1000,
+            'condition': 'new',
+            'status': 'active',
+        }
+        defaults.update(kwargs)
+        return Product.objects.create(**defaults)
+
+    def test_warm_homepage_makes_no_queries(self):
+        """Test that cached blocks and cards are served without hitting the database"""
+        self.client.get(reverse('catalog:home'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('catalog:home'))
+        self.assertEqual(response.context['featured_products'], [self.product])
+        self.assertEqual(response.context['latest_products'], [self.product])
+
+    def test_card_cached_before_commit_is_dropped(self):
+        """Test that a card cached while a change was uncommitted is deleted after commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = 'Щенок хаски'
+            self.product.save()
+            # Так другой процесс закэшировал бы карточку до коммита
+            cache.set(CARD_KEY.format(id=self.product.id), self.product)
+        self.assertIsNone(cache.get(CARD_KEY.format(id=self.product.id)))
+
+    def test_cards_do_not_cache_seller(self):
+        """Test that cached cards carry no seller account data"""
+        hydrate_products([self.product.id])
+        card = cache.get(CARD_KEY.format(id=self.product.id))
+        self.assertNotIn('seller', card._state.fields_cache)
+
+    def test_product_changes_invalidate_blocks(self):
+        """Test that saves and deletes refresh only the affected blocks"""
+        self.assertEqual(FEATURED.get_ids(), [self.product.id])
+        self.assertEqual(LATEST.get_ids(), [self.product.id])
+
+        new_product = self.create_product('Котенок')
+        self.assertEqual(FEATURED.get_ids(), [self.product.id])
+        self.assertEqual(LATEST.get_ids(), [new_product.id, self.product.id])
+
+        self.product.status = 'blocked'
+        self.product.save()
+        response = self.client.get(reverse('catalog:home'))
+        self.assertEqual(response.context['featured_products'], [])
+        self.assertEqual(response.context['latest_products'], [new_product])
+
+        new_product.delete()
+        self.assertEqual(LATEST.get_ids(), [])
+
+    def test_stale_block_served_while_locked(self):
+        """Test that only the lock holder recomputes an invalidated block"""
+        LATEST.get_ids()
+        cache.add(LATEST.lock_key, 1)
+        new_product = self.create_product('Котенок')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(LATEST.get_ids(), [self.product.id])
+
+        cache.delete(LATEST.lock_key)
+        self.assertEqual(LATEST.get_ids(), [new_product.id, self.product.id])
+        self.assertEqual(block_stats()['latest']['stale'], 1)
+
+    def test_hit_ratio(self):
+        """Test that hits and misses are counted per block"""
+        FEATURED.get_ids()
+        FEATURED.get_ids()
+        FEATURED.get_ids()
+        stats = block_stats()['featured']
+        self.assertEqual((stats['miss'], stats['hit']), (1, 2))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
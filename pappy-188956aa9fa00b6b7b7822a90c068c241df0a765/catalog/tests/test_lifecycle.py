@@ -0,0 +1,97 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from login_auth.models import User
+from notifications.models import Notification
+from catalog.homepage import LATEST
+from catalog import lifecycle
+from catalog.lifecycle import expire_listings
+from catalog.models import Category, MatingCandidate, Product
+
+class ListingExpiryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Собаки')
+        self.mating = Category.objects.create(name='Вязка', slug='mating')
+        self.stale = [
+            Product.objects.create(
+                seller=self.user,
+                category=self.category,
+                title=f'Старое объявление {i}',
+                description='Описание',
+                condition='new'
+            )
+            for i in range(5)
+        ]
+        self.fresh = Product.objects.create(
+            seller=self.user,
+            category=self.category,
+            title='Свежее объявление',
+            description='Описание',
+            condition='new'
+        )
+        self.stale_pet = Product.objects.create(
+            seller=self.user,
+            category=self.mating,
+            title='Лабрадор',
+            description='Описание',
+            condition='new',
+            breed='Лабрадор',
+            gender='male'
+        )
+        self.stale.append(self.stale_pet)
+        Product.objects.filter(
+            id__in=[product.id for product in self.stale]
+        ).update(updated=timezone.now() - timedelta(days=100))
+
+    def test_archives_stale_listings_in_batches(self):
+        """Test that stale listings are archived with one notification each"""
+        self.assertEqual(LATEST.get_ids()[0], self.stale_pet.id)
+        with self.assertNumQueries(22):
+            report = expire_listings(days=90, batch_size=2)
+
+        self.assertEqual(report.found, 6)
+        self.assertEqual(report.archived, 6)
+        self.assertEqual(report.batches, 3)
+        self.assertEqual(
+            set(Product.objects.filter(status='archived').values_list('id', flat=True)),
+            {product.id for product in self.stale}
+        )
+        self.assertEqual(Product.objects.get(id=self.fresh.id).status, 'active')
+        self.assertEqual(
+            Notification.objects.filter(recipient=self.user, type='product_status').count(), 6
+        )
+        self.assertFalse(MatingCandidate.objects.exists())
+        self.assertEqual(LATEST.get_ids(), [self.fresh.id])
+
+    def test_dry_run_changes_nothing(self):
+        """Test that a dry run only counts expired listings"""
+        out = StringIO()
+        call_command('expire_listings', '--dry-run', '--batch-size=4', stdout=out)
+        self.assertIn('6 listings', out.getvalue())
+        self.assertEqual(Product.objects.filter(status='active').count(), 7)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_skips_listings_updated_after_selection(self):
+        """Test that the archive update rechecks that the listing is still stale"""
+        original = lifecycle._expire_batch
+
+        def touch_then_expire(products, report):
+            Product.objects.filter(id=products[0].id).update(updated=timezone.now())
+            return original(products, report)
+
+        with mock.patch.object(lifecycle, '_expire_batch', touch_then_expire):
+            report = expire_listings(days=90)
+
+        self.assertEqual(report.found, 6)
+        self.assertEqual(report.archived, 5)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(Product.objects.filter(status='active').count(), 2)
@@ -2,7 +2,7 @@ from django.test import TransactionTestCase
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from login_auth.models import User
-from catalog.models import Category, Product, MatingRequest
+from catalog.models import Category, Product, MatingRequest, MatingCandidate
 from chat.models import Dialog
 
 class MatingTest(TransactionTestCase):
@@ -192,4 +192,69 @@ class MatingTest(TransactionTestCase):
         
         # Check request was canceled
         request.refresh_from_db()
-        self.assertEqual(request.status, 'canceled') 
\ No newline at end of file
+        self.assertEqual(request.status, 'canceled') 
+
+    def test_candidate_index_follows_product(self):
+        """Test that the candidate index tracks status and attribute changes"""
+        self.assertEqual(MatingCandidate.objects.count(), 2)
+        self.assertEqual(self.male_pet.mating_candidate.breed_key, 'британская')
+        
+        self.male_pet.status = 'archived'
+        self.male_pet.save()
+        self.assertFalse(MatingCandidate.objects.filter(product=self.male_pet).exists())
+        
+        self.male_pet.status = 'active'
+        self.male_pet.save()
+        self.assertTrue(MatingCandidate.objects.filter(product=self.male_pet).exists())
+    
+    def test_compatible_partners_ranked(self):
+        """Test that partners are ranked by compatibility and paged by cursor"""
+        third_owner = User.objects.create_user(phone='+79990000001', password='testpass123')
+        self.male_pet.location = 'Москва, ул. Ленина'
+        self.male_pet.save()
+        close_match = Product.objects.create(
+            seller=third_owner,
+            category=self.category,
+            title='Кошка из Москвы',
+            description='Описание',
+            status='active',
+            breed='британская ',
+            age=2,
+            size='medium',
+            gender='female',
+            location='москва'
+        )
+        Product.objects.create(
+            seller=third_owner,
+            category=self.category,
+            title='Кошка другой породы',
+            description='Описание',
+            status='active',
+            breed='Сиамская',
+            gender='female'
+        )
+        
+        self.client.login(phone='+79991234567', password='testpass123')
+        response = self.client.get(reverse('catalog:mating_partners'), {'limit': 1})
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['results']], [close_match.id])
+        self.assertEqual(data['results'][0]['score'], 7)
+        
+        response = self.client.get(reverse('catalog:mating_partners'), {
+            'limit': 1,
+            'cursor': data['next_cursor']
+        })
+        data = response.json()
+        self.assertEqual([row['id'] for row in data['results']], [self.female_pet.id])
+        self.assertIsNone(data['next_cursor'])
+    
+    def test_repeated_like_is_idempotent(self):
+        """Test that liking twice keeps a single request"""
+        self.client.login(phone='+79997654321', password='testpass123')
+        for _ in range(2):
+            response = self.client.post(reverse('catalog:mating_like'), {
+                'product': self.male_pet.id
+            })
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(MatingRequest.objects.count(), 1)
+        self.assertFalse(response.json()['matched'])
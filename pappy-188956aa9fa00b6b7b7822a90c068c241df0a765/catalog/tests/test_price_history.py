@@ -0,0 +1,98 @@
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from catalog.models import Category, PriceHistory, Product
+
+class PriceHistoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Собаки')
+        self.products = [
+            Product.objects.create(
+                seller=self.user,
+                category=self.category,
+                title=f'Щенок {i}',
+                description='Описание',
+                price=price,
+                condition='new'
+            )
+            for i, price in enumerate([500, 1000, 20000, None])
+        ]
+
+    def test_price_band_on_save(self):
+        """Test that the price band is kept in sync with the price"""
+        self.assertEqual([p.price_band for p in self.products], [0, 1, 3, None])
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.price = 200000
+        product.save(update_fields=['price'])
+        product.refresh_from_db()
+        self.assertEqual(product.price_band, 5)
+
+    def test_changes_written_after_commit(self):
+        """Test that price changes are recorded on commit and dropped on rollback"""
+        self.assertFalse(PriceHistory.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for product in Product.objects.all():
+                    product.price = 3000
+                    product.save()
+                    product.save()
+            # До коммита история не пишется
+            self.assertFalse(PriceHistory.objects.exists())
+        self.assertEqual(PriceHistory.objects.count(), 4)
+
+        product = Product.objects.get(pk=self.products[2].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                product.price = 200
+                product.save()
+                try:
+                    with transaction.atomic():
+                        product.price = 999
+                        product.save()
+                        raise ValueError
+                except ValueError:
+                    pass
+        # Цена 999 откатилась вместе с точкой сохранения
+        self.assertEqual(
+            list(PriceHistory.objects.filter(product=product).order_by('id').values_list('new_price', flat=True)),
+            [3000, 200]
+        )
+
+    def test_seller_sees_history(self):
+        """Test that only the seller can read the price history"""
+        product = Product.objects.get(pk=self.products[1].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.price = 1500
+            product.save()
+
+        self.client.login(phone='+79991234567', password='testpass123')
+        response = self.client.get(reverse('catalog:product_price_history', args=[product.pk]))
+        history = response.json()['history']
+        self.assertEqual([(h['old_price'], h['new_price']) for h in history], [('1000.00', '1500.00')])
+
+        User.objects.create_user(phone='+79997654321', password='testpass123')
+        self.client.login(phone='+79997654321', password='testpass123')
+        response = self.client.get(reverse('catalog:product_price_history', args=[product.pk]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_backfill_and_benchmark_commands(self):
+        """Test that bands are backfilled in one UPDATE and hot queries run"""
+        Product.objects.update(price_band=None)
+        call_command('backfill_price_bands', stdout=StringIO())
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('price_band', flat=True)),
+            [0, 1, 3, None]
+        )
+
+        out = StringIO()
+        call_command('benchmark_catalog_queries', '--repeat', '2', stdout=out)
+        self.assertIn('category_price_range', out.getvalue())
@@ -0,0 +1,122 @@
+import json
+import random
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from login_auth.models import User
+from catalog.hot_queries import HOT_QUERIES, QueryContext
+from catalog.models import Category, PriceHistory, Product, price_band_for
+
+# Таблицы, которые в планах горячих запросов нельзя читать целиком
+WATCHED_TABLES = {Product._meta.db_table, PriceHistory._meta.db_table}
+
+# Индекс, которым должен обслуживаться каждый горячий запрос
+EXPECTED_INDEXES = {
+    'home_featured': 'product_active_featured',
+    'home_latest': 'product_active_created',
+    'search_newest': 'product_active_created',
+    'search_price_asc': 'product_active_price',
+    'search_price_range': 'product_active_price',
+    'search_popular': 'product_active_popular',
+    'category_newest': 'product_active_cat_created',
+    'category_price_desc': 'product_active_cat_price',
+    'category_price_range': 'product_active_cat_price',
+    'category_popular': 'product_active_cat_popular',
+    'category_price_histogram': 'product_active_cat_band',
+    'my_products': 'product_seller_created',
+    'my_products_status': 'product_seller_created',
+    'lost_pets': 'product_active_cat_created',
+    'price_history': 'price_history_product',
+}
+
+
+def seq_scans(plan):
+    """Последовательные чтения отслеживаемых таблиц в плане EXPLAIN (FORMAT JSON)"""
+    found = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan' and node['Relation Name'] in WATCHED_TABLES:
+            found.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return found
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Query plans are checked on PostgreSQL')
+class HotQueryPlanTest(TestCase):
+    """
+    Горячие запросы каталога не должны деградировать до полного чтения таблицы.
+
+    Данные похожи на рабочие: большая часть объявлений в архиве, активные
+    распределены по категориям и продавцам.
+    """
+
+    PRODUCTS = 20000
+    ACTIVE_SHARE = 0.2
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        sellers = User.objects.bulk_create([
+            User(phone=f'+7999{i:07d}', password='!') for i in range(200)
+        ])
+        animals = Category.objects.create(name='Животные')
+        categories = [
+            Category.objects.create(name=f'Порода {i}', parent=animals) for i in range(30)
+        ]
+        categories.append(Category.objects.create(name='Потерялись', slug='lostfound'))
+
+        now = timezone.now()
+        products = []
+        for i in range(cls.PRODUCTS):
+            price = Decimal(rng.randrange(100, 200000)) if rng.random() > 0.1 else None
+            products.append(Product(
+                seller=rng.choice(sellers),
+                category=rng.choice(categories),
+                title=f'Объявление {i}',
+                slug=f'product-{i}',
+                description='Описание',
+                condition='new',
+                price=price,
+                price_band=price_band_for(price),
+                status='active' if rng.random() < cls.ACTIVE_SHARE else 'archived',
+                is_featured=rng.random() < 0.01,
+                popularity_score=rng.random() * 100,
+            ))
+        Product.objects.bulk_create(products, batch_size=2000)
+        # auto_now_add не позволяет задать дату при создании
+        for offset in range(0, cls.PRODUCTS, 2000):
+            ids = [product.id for product in products[offset:offset + 2000]]
+            Product.objects.filter(id__in=ids).update(created=now - timedelta(minutes=offset))
+
+        PriceHistory.objects.bulk_create([
+            PriceHistory(product=product, old_price=1000, new_price=2000, changed=now)
+            for product in products[::4]
+        ], batch_size=2000)
+
+        with connection.cursor() as cursor:
+            for table in sorted(WATCHED_TABLES):
+                cursor.execute(f'ANALYZE {table}')
+
+    def setUp(self):
+        cache.clear()
+        self.ctx = QueryContext()
+
+    def test_hot_queries_use_indexes(self):
+        """Test that no hot query plan reads a whole catalog table"""
+        for name, build in HOT_QUERIES.items():
+            with self.subTest(query=name):
+                plan = json.loads(build(self.ctx).explain(format='json'))[0]['Plan']
+                self.assertEqual(seq_scans(plan), [], json.dumps(plan, indent=2))
+
+    def test_hot_queries_use_expected_indexes(self):
+        """Test that every hot query is served by the index designed for it"""
+        self.assertEqual(set(EXPECTED_INDEXES), set(HOT_QUERIES))
+        for name, index in EXPECTED_INDEXES.items():
+            with self.subTest(query=name):
+                plan = HOT_QUERIES[name](self.ctx).explain()
+                self.assertIn(index, plan)
@@ -0,0 +1,111 @@
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from login_auth.models import User
+from chat.models import Dialog
+from catalog.models import Category, Favorite, Product, ProductSimilarity
+from catalog import recommendations
+from catalog.recommendations import build_similarities, compute_neighbors, dirty_products, last_build_time
+
+class RecommendationsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user(phone='+79991234567', password='testpass123')
+        self.buyers = [
+            User.objects.create_user(phone=f'+7999000000{i}', password='testpass123')
+            for i in range(3)
+        ]
+        self.dogs = Category.objects.create(name='Собаки')
+        self.cats = Category.objects.create(name='Кошки')
+        self.husky = self.create_product('Хаски', self.dogs, breed='Хаски', price=20000)
+        self.husky_twin = self.create_product('Хаски 2', self.dogs, breed='хаски ', price=25000)
+        self.poodle = self.create_product('Пудель', self.dogs, breed='Пудель', price=900)
+        self.cat = self.create_product('Кот', self.cats, breed='Мейн-кун', price=30000)
+
+    def create_product(self, title, category, **kwargs):
+        return Product.objects.create(
+            seller=self.seller,
+            category=category,
+            title=title,
+            description='Описание',
+            condition='new',
+            status='active',
+            **kwargs
+        )
+
+    def test_attribute_and_co_favorite_neighbors(self):
+        """Test that breed overlap and co-favorites rank neighbours across categories"""
+        for buyer in self.buyers:
+            Favorite.objects.create(user=buyer, product=self.husky)
+            Favorite.objects.create(user=buyer, product=self.cat)
+
+        neighbors = dict(compute_neighbors([self.husky.id])[self.husky.id])
+        self.assertIn(self.husky_twin.id, neighbors)
+        self.assertIn(self.cat.id, neighbors)
+        self.assertNotIn(self.poodle.id, neighbors)
+        self.assertGreater(neighbors[self.cat.id], neighbors[self.husky_twin.id])
+
+    def test_dialog_starts_link_products(self):
+        """Test that buyers contacting two sellers make the products neighbours"""
+        for product in (self.poodle, self.cat):
+            dialog = Dialog.objects.create(product=product)
+            dialog.participants.add(self.buyers[0], self.seller)
+
+        neighbors = dict(compute_neighbors([self.poodle.id])[self.poodle.id])
+        self.assertIn(self.cat.id, neighbors)
+
+    def test_served_in_one_query(self):
+        """Test that product detail reads stored neighbours by rank"""
+        build_similarities([self.husky.id])
+        self.assertEqual(
+            list(ProductSimilarity.objects.filter(product=self.husky).values_list('neighbor_id', flat=True)),
+            [self.husky_twin.id]
+        )
+        response = self.client.get(reverse('catalog:product_detail', args=[self.husky.slug]))
+        self.assertEqual(list(response.context['similar_products']), [self.husky_twin])
+
+    def test_category_pool_loaded_once_per_build(self):
+        """Test that batches of the same category reuse its candidate pool"""
+        products = [self.husky, self.husky_twin, self.poodle, self.cat]
+        with CaptureQueriesContext(connection) as queries:
+            build_similarities([product.id for product in products], batch_size=1)
+        pool_queries = [q for q in queries.captured_queries if '"category_id" IN' in q['sql']]
+        self.assertEqual(len(pool_queries), 2)
+        self.assertEqual(
+            list(ProductSimilarity.objects.filter(product=self.husky).values_list('neighbor_id', flat=True)),
+            [self.husky_twin.id]
+        )
+
+    def test_changes_during_build_are_picked_up_next_run(self):
+        """Test that every batch is stamped with the run start so mid-run changes stay dirty"""
+        batches = []
+
+        def compute(target_ids, pool=None):
+            if batches:
+                # Пока считается вторая пачка, меняется товар из первой
+                Product.objects.get(id=batches[0][0]).save()
+            batches.append(target_ids)
+            return compute_neighbors(target_ids, pool)
+
+        with mock.patch.object(recommendations, 'compute_neighbors', side_effect=compute):
+            build_similarities([self.husky.id, self.husky_twin.id], batch_size=1)
+
+        self.assertEqual(len(set(ProductSimilarity.objects.values_list('computed', flat=True))), 1)
+        self.assertIn(batches[0][0], dirty_products(last_build_time()))
+
+    def test_incremental_build(self):
+        """Test that the command only recomputes products touched since the last build"""
+        call_command('build_similar_products', '--full', stdout=StringIO())
+        since = ProductSimilarity.objects.latest('computed').computed
+        self.assertEqual(dirty_products(since), set())
+
+        Favorite.objects.create(user=self.buyers[0], product=self.poodle)
+        self.assertEqual(dirty_products(since), {self.poodle.id})
+
+        self.husky_twin.save()
+        self.assertEqual(dirty_products(since), {self.poodle.id, self.husky_twin.id, self.husky.id})
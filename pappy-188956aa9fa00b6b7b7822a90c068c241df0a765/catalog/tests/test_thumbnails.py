@@ -0,0 +1,111 @@
+import io
+import shutil
+import tempfile
+from django.test import TestCase, override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from PIL import Image
+from login_auth.models import User
+from catalog.models import Category, Product, ProductImage
+from catalog.thumbnails import THUMBNAIL_SIZES, thumbnail_name, thumbnail_names
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+def make_image(name='photo.jpg', size=(800, 600), color='red'):
+    image_io = io.BytesIO()
+    Image.new('RGB', size, color=color).save(image_io, format='JPEG')
+    return SimpleUploadedFile(name, image_io.getvalue(), content_type='image/jpeg')
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class MainImageTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Потеряшки', slug='lostfound')
+        self.product = Product.objects.create(
+            seller=self.user,
+            category=self.category,
+            title='Пропал кот',
+            description='Рыжий кот',
+            condition='new',
+            status='active'
+        )
+
+    def test_first_image_becomes_main(self):
+        """Test that the first image is stored as Product.main_image"""
+        image = ProductImage.objects.create(product=self.product, image=make_image())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image, image)
+
+    def test_main_image_switch(self):
+        """Test that marking another image as main updates the pointer"""
+        ProductImage.objects.create(product=self.product, image=make_image())
+        second = ProductImage.objects.create(product=self.product, image=make_image('b.jpg'))
+        second.is_main = True
+        second.save()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.main_image, second)
+
+    def test_main_image_promoted_on_delete(self):
+        """Test that deleting the main image promotes the next one"""
+        first = ProductImage.objects.create(product=self.product, image=make_image())
+        second = ProductImage.objects.create(product=self.product, image=make_image('b.jpg'))
+        first.delete()
+        self.product.refresh_from_db()
+        second.refresh_from_db()
+        self.assertTrue(second.is_main)
+        self.assertEqual(self.product.main_image, second)
+
+        second.delete()
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.main_image)
+
+    def test_thumbnail_generation(self):
+        """Test that the command renders fixed-size renditions next to the original"""
+        image = ProductImage.objects.create(product=self.product, image=make_image())
+        self.assertEqual(image.card_url, image.image.url)
+
+        call_command('generate_thumbnails', workers=2, stdout=io.StringIO())
+
+        image.refresh_from_db()
+        self.assertTrue(image.thumbnails_ready)
+        for size_name, size in THUMBNAIL_SIZES.items():
+            for fmt in ('webp', 'jpeg'):
+                name = thumbnail_name(image.image.name, size_name, fmt)
+                self.assertTrue(default_storage.exists(name))
+                with default_storage.open(name) as f:
+                    self.assertEqual(Image.open(f).size, size)
+        self.assertTrue(image.card_webp_url.endswith('.card.webp'))
+
+        names = thumbnail_names(image.image.name)
+        image.delete()
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_lost_pets_search_without_per_row_queries(self):
+        """Test that search results use the denormalized main image"""
+        for i in range(5):
+            product = Product.objects.create(
+                seller=self.user,
+                category=self.category,
+                title=f'Пропал кот {i}',
+                description='Рыжий кот',
+                condition='new',
+                status='active'
+            )
+            ProductImage.objects.create(product=product, image=make_image())
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('catalog:lost_pets_search'))
+        results = response.json()['results']
+        self.assertEqual(len(results), 6)
+        self.assertEqual(sum(1 for r in results if r['thumbnail']), 5)
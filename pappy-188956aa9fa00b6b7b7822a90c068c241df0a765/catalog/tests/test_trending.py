@@ -0,0 +1,113 @@
+import time
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from login_auth.models import User
+from chat.models import Dialog
+from catalog.models import Category, Product, ProductActivity
+from catalog.services import FavoriteService
+from catalog.trending import VIEW_BUCKET, add_scores, event_weight, trending_ids, update_scores
+
+class TrendingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.animals = Category.objects.create(name='Животные')
+        self.dogs = Category.objects.create(name='Собаки', parent=self.animals)
+        self.old, self.new, self.quiet = [
+            Product.objects.create(
+                seller=self.user,
+                category=self.dogs,
+                title=title,
+                description='Описание',
+                condition='new'
+            )
+            for title in ('Старый', 'Новый', 'Тихий')
+        ]
+
+    def flush(self):
+        """update_scores после закрытия текущего интервала просмотров"""
+        with mock.patch('catalog.trending.time.time', return_value=time.time() + 2 * VIEW_BUCKET):
+            return update_scores()
+
+    def test_recent_activity_outweighs_old(self):
+        """Test that a week-old burst of views loses to a few fresh ones"""
+        week_ago = timezone.now() - timedelta(days=7)
+        ProductActivity.objects.bulk_create(
+            [ProductActivity(product=self.old, kind='view', created=week_ago) for _ in range(10)]
+        )
+        ProductActivity.objects.bulk_create(
+            [ProductActivity(product=self.new, kind='view') for _ in range(4)]
+        )
+        self.assertEqual(update_scores(), {self.old.id, self.new.id})
+        self.assertFalse(ProductActivity.objects.exists())
+
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        self.assertGreater(self.new.popularity_score, self.old.popularity_score)
+        self.assertEqual(trending_ids(self.animals.id)[:2], [self.new.id, self.old.id])
+
+    def test_scores_accumulate_incrementally(self):
+        """Test that folding events in two runs equals one run"""
+        # События группируются по часу
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        first = event_weight('view', now)
+        self.assertAlmostEqual(add_scores(first, first), first + 1)
+
+        ProductActivity.objects.create(product=self.old, kind='view', created=now)
+        update_scores()
+        ProductActivity.objects.create(product=self.old, kind='view', created=now)
+        self.assertEqual(update_scores(), {self.old.id})
+        self.old.refresh_from_db()
+        self.assertAlmostEqual(self.old.popularity_score, first + 1)
+        self.assertEqual(update_scores(), set())
+
+    def test_events_recorded_and_feed_served(self):
+        """Test that views, favorites and dialogs are queued and the feed reads the top list"""
+        self.client.get(reverse('catalog:product_detail', args=[self.quiet.slug]))
+        FavoriteService(self.user).toggle(self.quiet.id)
+        Dialog.objects.create(product=self.quiet)
+        self.assertEqual(
+            sorted(ProductActivity.objects.values_list('kind', flat=True)),
+            ['dialog', 'favorite']
+        )
+
+        self.flush()
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.quiet.views, 1)
+        response = self.client.get(reverse('catalog:trending_products'), {'fields': 'id'})
+        self.assertEqual(response.json()['results'][0], {'id': self.quiet.id})
+
+        response = self.client.get(
+            reverse('catalog:category_detail', args=[self.dogs.slug]),
+            {'sort': 'popular'}
+        )
+        self.assertEqual(response.context['products'][0], self.quiet)
+
+    def test_views_buffered_and_deduplicated(self):
+        """Test that views skip the database, count once per visitor and ignore bots"""
+        url = reverse('catalog:product_detail', args=[self.quiet.slug])
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(3):
+                self.client.get(url)
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE'))]
+        self.assertEqual(writes, [])
+
+        Client(HTTP_USER_AGENT='Mozilla/5.0 (compatible; Googlebot/2.1)').get(url)
+        Client(REMOTE_ADDR='10.0.0.2').get(url)
+        self.client.get(reverse('catalog:product_detail', args=[self.old.slug]))
+
+        self.assertEqual(self.flush(), {self.quiet.id, self.old.id})
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.quiet.views, 2)
+        self.assertGreater(self.quiet.popularity_score, 0)
+        # Учтенные интервалы не складываются повторно
+        self.assertEqual(self.flush(), set())
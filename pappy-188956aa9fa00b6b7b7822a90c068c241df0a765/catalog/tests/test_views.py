@@ -1,13 +1,18 @@
+import time
+from unittest import mock
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from catalog.models import Category, Product, ProductImage, Favorite
+from catalog.trending import VIEW_BUCKET, update_scores
 
 User = get_user_model()
 
 class CatalogViewsTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         
         # Create users
@@ -79,7 +84,9 @@ class CatalogViewsTest(TestCase):
         self.assertTemplateUsed(response, 'catalog/product_detail.html')
         self.assertEqual(response.context['product'], self.product)
         
-        # Test view counter
+        # Test view counter: просмотры копятся в кэше до update_trending
+        with mock.patch('catalog.trending.time.time', return_value=time.time() + 2 * VIEW_BUCKET):
+            update_scores()
         self.product.refresh_from_db()
         self.assertEqual(self.product.views, 1)
 
@@ -0,0 +1,99 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+# Размеры превью для карточек товаров (ширина, высота)
+THUMBNAIL_SIZES = {
+    'card': (400, 300),
+    'small': (160, 120),
+}
+
+# Форматы превью: расширение файла -> (формат Pillow, параметры кодирования)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+FORMAT_EXTENSIONS = {
+    'webp': 'webp',
+    'jpeg': 'jpg',
+}
+
+
+def thumbnail_name(name, size, fmt):
+    """Имя файла превью рядом с оригиналом: products/cat.jpg -> products/cat.card.webp"""
+    root, _ext = os.path.splitext(name)
+    return f'{root}.{size}.{FORMAT_EXTENSIONS[fmt]}'
+
+
+def thumbnail_names(name):
+    """Все имена превью для оригинала"""
+    return [
+        thumbnail_name(name, size, fmt)
+        for size in THUMBNAIL_SIZES
+        for fmt in THUMBNAIL_FORMATS
+    ]
+
+
+def render_thumbnails(field_file):
+    """Создает все превью для файла изображения и сохраняет их в хранилище"""
+    storage = field_file.storage
+
+    with field_file.open('rb') as f:
+        source = Image.open(f)
+        source.draft('RGB', max(THUMBNAIL_SIZES.values()))
+        source = ImageOps.exif_transpose(source).convert('RGB')
+
+    for size_name, size in THUMBNAIL_SIZES.items():
+        thumbnail = ImageOps.fit(source, size, Image.LANCZOS)
+        for fmt, (pil_format, options) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            thumbnail.save(buffer, pil_format, **options)
+
+            name = thumbnail_name(field_file.name, size_name, fmt)
+            # Имя превью детерминировано, поэтому перезаписываем старый файл
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def delete_thumbnails(field_file):
+    """Удаляет превью вместе с оригиналом"""
+    storage = field_file.storage
+    for name in thumbnail_names(field_file.name):
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def generate_thumbnails(images, workers=4):
+    """
+    Генерирует превью для списка ProductImage в пуле потоков.
+
+    Pillow отпускает GIL при декодировании, масштабировании и кодировании,
+    поэтому потоки загружают все ядра без отдельных процессов.
+    Возвращает (id успешно обработанных изображений, [(id, ошибка)]).
+    """
+    done, failed = [], []
+
+    def process(image):
+        try:
+            render_thumbnails(image.image)
+            return image.pk, None
+        except Exception as e:
+            logger.warning('Failed to render thumbnails for image %s: %s', image.pk, e)
+            return image.pk, str(e)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for pk, error in executor.map(process, images):
+            if error is None:
+                done.append(pk)
+            else:
+                failed.append((pk, error))
+
+    return done, failed
@@ -0,0 +1,250 @@
+import hashlib
+import math
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from .category_tree import get_category_tree
+from .models import Product, ProductActivity
+
+# Вес события в оценке популярности
+WEIGHTS = {
+    ProductActivity.VIEW: 1.0,
+    ProductActivity.FAVORITE: 5.0,
+    ProductActivity.DIALOG: 10.0,
+}
+
+# Через сколько часов вклад события уменьшается вдвое
+HALF_LIFE_HOURS = 72
+
+# Точка отсчета времени для оценки
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+TOP_N = 50
+TOP_KEY = 'catalog:trending:{category}'
+TOP_TTL = 60 * 60
+LOCK_KEY = 'catalog:trending:lock'
+LOCK_TTL = 60 * 10
+BATCH_SIZE = 10000
+
+# Просмотры не пишутся в базу на каждый запрос: счетчики копятся в кэше по
+# интервалам VIEW_BUCKET секунд, update_scores забирает закрытые интервалы.
+# Номера слотов - журнал товаров интервала без чтения-изменения-записи
+VIEW_BUCKET = 5 * 60
+VIEW_KEY = 'catalog:trending:views:{bucket}:{product}'
+VIEW_SLOTS_KEY = 'catalog:trending:views:{bucket}:slots'
+VIEW_SLOT_KEY = 'catalog:trending:views:{bucket}:slot:{slot}'
+VIEW_FLUSHED_KEY = 'catalog:trending:views:flushed'
+# Необработанные интервалы старше суток теряются
+VIEW_TTL = 60 * 60 * 24
+# Повторный просмотр того же посетителя в течение этого времени не считается
+VIEW_SEEN_KEY = 'catalog:trending:seen:{product}:{visitor}'
+VIEW_DEDUPE_TTL = 30 * 60
+BOT_RE = re.compile(r'bot|crawl|spider|slurp|preview', re.IGNORECASE)
+
+
+def event_weight(kind, created):
+    """
+    Вклад события в log2-пространстве.
+
+    Вместо уменьшения старых оценок новые события весят экспоненциально
+    больше: вес растет вдвое каждые HALF_LIFE_HOURS. Порядок товаров при
+    этом тот же, что при затухании, а пересчитывать нужно только товары
+    с новыми событиями.
+    """
+    hours = (created - EPOCH).total_seconds() / 3600
+    return hours / HALF_LIFE_HOURS + math.log2(WEIGHTS[kind])
+
+
+def add_scores(score, increment):
+    """log2(2**score + 2**increment) без переполнения"""
+    high, low = max(score, increment), min(score, increment)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def record_activity(product_ids, kind):
+    """Добавляет события по товарам одним INSERT"""
+    ProductActivity.objects.bulk_create([
+        ProductActivity(product_id=product_id, kind=kind)
+        for product_id in product_ids
+    ])
+
+
+def _visitor(request):
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if request.session.session_key:
+        return f'session:{request.session.session_key}'
+    # Без сессии (первый заход, клиенты без cookie) - адрес и браузер
+    agent = hashlib.md5(request.headers.get('User-Agent', '').encode()).hexdigest()
+    return f'ip:{request.META.get("REMOTE_ADDR")}:{agent}'
+
+
+def record_view(request, product_id):
+    """
+    Учитывает просмотр товара в кэше: без запросов к базе, один раз за
+    VIEW_DEDUPE_TTL на посетителя, без поисковых роботов.
+    """
+    if BOT_RE.search(request.headers.get('User-Agent', '')):
+        return False
+    if not cache.add(VIEW_SEEN_KEY.format(product=product_id, visitor=_visitor(request)), 1, VIEW_DEDUPE_TTL):
+        return False
+    bucket = int(time.time() // VIEW_BUCKET)
+    key = VIEW_KEY.format(bucket=bucket, product=product_id)
+    if cache.add(key, 1, VIEW_TTL):
+        # Первый просмотр товара в интервале - записываем его в журнал
+        slots_key = VIEW_SLOTS_KEY.format(bucket=bucket)
+        cache.add(slots_key, 0, VIEW_TTL)
+        slot = cache.incr(slots_key)
+        cache.set(VIEW_SLOT_KEY.format(bucket=bucket, slot=slot), product_id, VIEW_TTL)
+    else:
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Ключ истек между add и incr
+            pass
+    return True
+
+
+def collect_views():
+    """
+    Просмотры закрытых интервалов: ({(id товара, начало интервала): число},
+    ключи кэша, последний интервал). Текущий и предыдущий интервалы не
+    трогаем - в них еще могут идти записи.
+    """
+    current = int(time.time() // VIEW_BUCKET)
+    flushed = cache.get(VIEW_FLUSHED_KEY)
+    first = current - VIEW_TTL // VIEW_BUCKET
+    if flushed is not None:
+        first = max(first, flushed + 1)
+    buckets = range(first, current - 1)
+    slot_counts = cache.get_many([VIEW_SLOTS_KEY.format(bucket=bucket) for bucket in buckets])
+
+    views = {}
+    keys = list(slot_counts)
+    for bucket in buckets:
+        slots = slot_counts.get(VIEW_SLOTS_KEY.format(bucket=bucket))
+        if not slots:
+            continue
+        slot_keys = [VIEW_SLOT_KEY.format(bucket=bucket, slot=slot) for slot in range(1, slots + 1)]
+        count_keys = {
+            VIEW_KEY.format(bucket=bucket, product=product_id): product_id
+            for product_id in cache.get_many(slot_keys).values()
+        }
+        started = datetime.fromtimestamp(bucket * VIEW_BUCKET, tz=dt_timezone.utc)
+        for key, total in cache.get_many(list(count_keys)).items():
+            views[(count_keys[key], started)] = total
+        keys.extend(slot_keys)
+        keys.extend(count_keys)
+    return views, keys, buckets[-1] if buckets else flushed
+
+
+def _fold(increments, touched, views=None):
+    """Добавляет вклады к оценкам товаров (и просмотры к счетчику views)"""
+    products = Product.objects.filter(
+        id__in=increments
+    ).select_for_update().only('id', 'popularity_score', 'category_id', 'views')
+    for product in products:
+        score = product.popularity_score or None
+        for increment in increments[product.id]:
+            score = increment if score is None else add_scores(score, increment)
+        product.popularity_score = score
+        if views:
+            product.views += views.get(product.id, 0)
+        touched.add((product.id, product.category_id))
+    Product.objects.bulk_update(products, ['popularity_score', 'views'] if views else ['popularity_score'])
+
+
+def _category_keys(category_ids):
+    """Категории и все их предки - их топы меняются вместе"""
+    tree = get_category_tree()
+    keys = {'all'}
+    for category_id in category_ids:
+        category = tree.get(category_id)
+        while category is not None:
+            keys.add(category.id)
+            category = tree.get(category.parent_id)
+    return keys
+
+
+def update_scores(batch_size=BATCH_SIZE):
+    """
+    Учитывает накопленные события в popularity_score, а просмотры из кэша -
+    еще и в счетчике views.
+
+    Обрабатываются только товары с новыми событиями; события группируются
+    по часу, просмотры - по интервалу VIEW_BUCKET. Возвращает id товаров,
+    у которых изменилась оценка.
+    """
+    if not cache.add(LOCK_KEY, 1, LOCK_TTL):
+        return set()
+    try:
+        touched = set()
+        views, keys, flushed = collect_views()
+        if views:
+            increments = defaultdict(list)
+            counts = defaultdict(int)
+            for (product_id, started), total in views.items():
+                increments[product_id].append(event_weight(ProductActivity.VIEW, started) + math.log2(total))
+                counts[product_id] += total
+            with transaction.atomic():
+                _fold(increments, touched, counts)
+        # Ключи удаляются только после коммита: при ошибке интервалы учтутся в следующий раз
+        cache.delete_many(keys)
+        if flushed is not None:
+            cache.set(VIEW_FLUSHED_KEY, flushed, VIEW_TTL)
+
+        while True:
+            # Берем явный список id: события, закоммиченные во время
+            # обработки пачки, не будут удалены неучтенными
+            ids = list(ProductActivity.objects.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            events = ProductActivity.objects.filter(id__in=ids)
+            increments = defaultdict(list)
+            for row in events.values(
+                'product_id', 'kind', hour=TruncHour('created')
+            ).annotate(total=Count('id')).order_by():
+                weight = event_weight(row['kind'], row['hour'])
+                increments[row['product_id']].append(weight + math.log2(row['total']))
+
+            with transaction.atomic():
+                _fold(increments, touched)
+                events.delete()
+
+        refresh_top({category_id for _product_id, category_id in touched})
+        return {product_id for product_id, _category_id in touched}
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _compute_top(category):
+    products = Product.objects.filter(status='active')
+    if category != 'all':
+        products = products.filter(category_id__in=get_category_tree().descendant_ids(category))
+    return list(
+        products.order_by('-popularity_score', '-id').values_list('id', flat=True)[:TOP_N]
+    )
+
+
+def refresh_top(category_ids):
+    """Пересчитывает топы затронутых категорий и их предков"""
+    cache.set_many(
+        {TOP_KEY.format(category=key): _compute_top(key) for key in _category_keys(category_ids)},
+        TOP_TTL
+    )
+
+
+def trending_ids(category='all'):
+    """Id самых популярных товаров категории (или всего каталога)"""
+    key = TOP_KEY.format(category=category)
+    ids = cache.get(key)
+    if ids is None:
+        ids = _compute_top(category)
+        cache.set(key, ids, TOP_TTL)
+    return ids
@@ -6,7 +6,9 @@ app_name = 'catalog'
 urlpatterns = [
     path('', views.catalog_home, name='home'),
     path('search/', views.search_products, name='search'),
+    path('search/facets/', views.search_facets, name='search_facets'),
     path('my-products/', views.my_products, name='my_products'),
+    path('my-products/export/', views.my_products_export, name='my_products_export'),
     path('product/create/', views.product_create, name='product_create'),
     path('product/<slug:slug>/edit/', views.product_edit, name='product_edit'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
@@ -22,9 +24,15 @@ urlpatterns = [
     
     # Mating
     path('mating/like/', views.mating_like, name='mating_like'),
+    path('mating/partners/', views.mating_partners, name='mating_partners'),
     path('mating/cancel/', views.cancel_mating_request, name='cancel_mating_request'),
     
     # API endpoints
+    path('api/products/', views.api_products, name='api_products'),
+    path('api/trending/', views.trending_products, name='trending_products'),
+    path('api/favorites/sync/', views.sync_favorites, name='sync_favorites'),
+    path('api/products/export/', views.api_products_export, name='api_products_export'),
+    path('api/products/<int:product_id>/price-history/', views.product_price_history, name='product_price_history'),
     path('api/products/<int:product_id>/status/', views.update_product_status, name='update_product_status'),
     path('api/products/<int:product_id>/', views.delete_product, name='delete_product'),
     path('api/images/<int:image_id>/', views.delete_product_image, name='delete_product_image'),
@@ -1,11 +1,21 @@
+import json
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.db.models import Q
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.utils.translation import gettext as _
 from .models import Category, Product, Favorite, ProductImage, MatingRequest
 from .forms import ProductForm, ProductFilterForm
+from .facets import get_facets
+from .category_tree import get_category_tree
+from . import api, bulk, homepage
+from .homepage import hydrate_products
+from .services import FavoriteService
+from .recommendations import similar_products as recommended_products
+from .mating import MATING_CATEGORY_SLUG, breed_key, partners_page
+from .trending import record_view, trending_ids
 from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.db import transaction
@@ -13,42 +23,64 @@ from chat.models import Dialog
 from notifications.models import Notification
 from login_auth.models import User
 
-def search_products(request):
-    query = request.GET.get('q', '')
+def _search_queryset(params):
+    """Товары, отобранные по параметрам поиска, и текущие фильтры"""
+    query = params.get('q', '')
     products_list = Product.objects.filter(
         Q(title__icontains=query) |
         Q(description__icontains=query) |
         Q(category__name__icontains=query),
         status='active'
-    ).select_related('seller', 'category').prefetch_related('images').distinct()
+    ).select_related('seller', 'category', 'main_image').distinct()
     
     # Фильтрация по состоянию
-    conditions = request.GET.getlist('condition')
+    conditions = params.getlist('condition')
     if conditions:
         products_list = products_list.filter(condition__in=conditions)
     
     # Фильтрация по цене
-    price_min = request.GET.get('price_min')
+    price_min = params.get('price_min')
     if price_min and price_min.isdigit():
         products_list = products_list.filter(price__gte=price_min)
     
-    price_max = request.GET.get('price_max')
+    price_max = params.get('price_max')
     if price_max and price_max.isdigit():
         products_list = products_list.filter(price__lte=price_max)
     
-    # Фильтрация по категории
-    category_id = request.GET.get('category')
+    # Фильтрация по ценовому диапазону из фасета
+    price_bands = [band for band in params.getlist('price_band') if band.isdigit()]
+    if price_bands:
+        products_list = products_list.filter(price_band__in=price_bands)
+    
+    # Фильтрация по категории с учетом всех подкатегорий
+    category_id = params.get('category')
     if category_id and category_id.isdigit():
-        category = get_object_or_404(Category, id=category_id)
-        products_list = products_list.filter(
-            Q(category=category) | Q(category__parent=category)
-        )
+        category_ids = get_category_tree().descendant_ids(int(category_id))
+        if not category_ids:
+            raise Http404
+        products_list = products_list.filter(category_id__in=category_ids)
     
     # Фильтрация по местоположению
-    location = request.GET.get('location')
+    location = params.get('location')
     if location:
         products_list = products_list.filter(location__icontains=location)
     
+    current_filters = {
+        'condition': conditions,
+        'price_min': price_min,
+        'price_max': price_max,
+        'price_band': price_bands,
+        'category': category_id,
+        'location': location,
+    }
+    return products_list, current_filters
+
+def search_products(request):
+    query = request.GET.get('q', '')
+    products_list, current_filters = _search_queryset(request.GET)
+    facets = get_facets(products_list, 'search', request.GET)
+    products_list = FavoriteService(request.user).annotate(products_list)
+    
     # Сортировка
     sort = request.GET.get('sort', '-created')
     valid_sort_fields = ['price', '-price', 'created', '-created', 'views', '-views']
@@ -66,55 +98,97 @@ def search_products(request):
         products = paginator.page(paginator.num_pages)
     
     # Получаем все категории для фильтра
-    categories = Category.objects.filter(parent=None).prefetch_related('children')
+    categories = get_category_tree().roots(active_only=False)
     
+    current_filters['sort'] = sort
     context = {
         'query': query,
         'products': products,
         'categories': categories,
-        'current_filters': {
-            'condition': conditions,
-            'price_min': price_min,
-            'price_max': price_max,
-            'category': category_id,
-            'location': location,
-            'sort': sort,
-        }
+        'facets': facets,
+        'current_filters': current_filters
     }
     return render(request, 'catalog/search_results.html', context)
 
+def api_products(request):
+    """Список товаров в JSON: выбор полей и постраничный вывод по курсору"""
+    products_list, current_filters = _search_queryset(request.GET)
+    try:
+        page = api.listing_page(products_list, request.GET)
+    except api.ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
+
+@login_required
+def api_products_export(request):
+    """Выгрузка всех найденных товаров потоковым JSON"""
+    products_list, current_filters = _search_queryset(request.GET)
+    try:
+        fields = api.parse_fields(request.GET.get('fields'))
+    except api.ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    response = StreamingHttpResponse(
+        api.stream_listing(products_list, fields),
+        content_type='application/json'
+    )
+    response['Content-Disposition'] = 'attachment; filename="products.json"'
+    return response
+
+def trending_products(request):
+    """Популярные сейчас товары каталога или категории"""
+    category = request.GET.get('category', '')
+    if category and not category.isdigit():
+        return JsonResponse({'error': 'Invalid category'}, status=400)
+    if category and get_category_tree().get(int(category)) is None:
+        raise Http404
+    try:
+        fields = api.parse_fields(request.GET.get('fields'))
+        limit = api.parse_limit(request.GET.get('limit'))
+    except api.ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    ids = trending_ids(int(category) if category else 'all')[:limit]
+    rows = {
+        row['id']: row
+        for row in Product.objects.filter(id__in=ids, status='active').values(*api.columns_for(fields))
+    }
+    return JsonResponse({
+        'results': [api.serialize_row(rows[pk], fields) for pk in ids if pk in rows]
+    })
+
+def search_facets(request):
+    """Количество товаров по значениям фильтров в формате JSON"""
+    products_list, current_filters = _search_queryset(request.GET)
+    return JsonResponse({
+        'facets': get_facets(products_list, 'search', request.GET)
+    })
+
 def catalog_home(request):
     """Главная страница каталога"""
-    featured_products = Product.objects.filter(
-        status='active',
-        is_featured=True
-    ).select_related('seller').prefetch_related('images')[:8]
-    
-    categories = Category.objects.filter(
-        is_active=True,
-        parent__isnull=True
-    ).prefetch_related('children')
-    
-    latest_products = Product.objects.filter(
-        status='active'
-    ).select_related('seller').prefetch_related('images')[:8]
+    featured_products = hydrate_products(homepage.FEATURED.get_ids())
+    categories = get_category_tree().roots()
+    latest_products = hydrate_products(homepage.LATEST.get_ids())
     
     return render(request, 'catalog/home.html', {
         'featured_products': featured_products,
         'categories': categories,
-        'latest_products': latest_products
+        'latest_products': latest_products,
+        'favorite_ids': FavoriteService(request.user).ids()
     })
 
 def category_detail(request, slug):
     """Страница категории с фильтрацией товаров"""
-    category = get_object_or_404(Category, slug=slug, is_active=True)
+    tree = get_category_tree()
+    category = tree.get_by_slug(slug)
+    if category is None or not category.is_active:
+        raise Http404
     form = ProductFilterForm(request.GET)
     
-    # Базовый queryset
+    # Базовый queryset: товары категории и всех ее подкатегорий
     products = Product.objects.filter(
         status='active',
-        category=category
-    ).select_related('seller').prefetch_related('images')
+        category_id__in=tree.descendant_ids(category.id)
+    ).select_related('seller', 'main_image')
     
     if form.is_valid():
         # Применяем фильтры
@@ -143,10 +217,13 @@ def category_detail(request, slug):
         elif sort == 'price_high':
             products = products.order_by('-price')
         elif sort == 'popular':
-            products = products.order_by('-views')
+            products = products.order_by('-popularity_score', '-id')
         else:  # newest
             products = products.order_by('-created')
     
+    facets = get_facets(products, f'category:{category.id}', request.GET)
+    products = FavoriteService(request.user).annotate(products)
+    
     # Пагинация
     paginator = Paginator(products, 12)
     page = request.GET.get('page')
@@ -154,26 +231,33 @@ def category_detail(request, slug):
     
     return render(request, 'catalog/category_detail.html', {
         'category': category,
+        'categories': tree.roots(),
+        'current_category': category,
         'form': form,
-        'products': products
+        'products': products,
+        'facets': facets
     })
 
 def product_detail(request, slug):
     """Страница товара"""
     product = get_object_or_404(Product, slug=slug, status='active')
     
-    # Увеличиваем счетчик просмотров
-    product.views += 1
-    product.save()
+    # Просмотр копится в кэше; views и оценку обновляет update_trending
+    record_view(request, product.id)
     
     # Получаем похожие товары
-    similar_products = Product.objects.filter(
-        status='active',
-        category=product.category
-    ).exclude(id=product.id)[:4]
+    favorite_service = FavoriteService(request.user)
+    similar_products = list(favorite_service.annotate(recommended_products(product))[:4])
+    if not similar_products:
+        # Соседи еще не рассчитаны - показываем товары той же категории
+        similar_products = favorite_service.annotate(Product.objects.filter(
+            status='active',
+            category=product.category
+        ).exclude(id=product.id).select_related('main_image'))[:4]
     
     return render(request, 'catalog/product_detail.html', {
         'product': product,
+        'is_favorite': favorite_service.contains(product.id),
         'similar_products': similar_products
     })
 
@@ -182,7 +266,7 @@ def my_products(request):
     """Страница с товарами пользователя"""
     products = Product.objects.filter(
         seller=request.user
-    ).order_by('-created')
+    ).select_related('main_image').order_by('-created')
     
     # Фильтр по статусу
     status = request.GET.get('status')
@@ -199,6 +283,20 @@ def my_products(request):
         'current_status': status
     })
 
+@login_required
+def my_products_export(request):
+    """Выгрузка своих товаров в CSV или JSONL для повторного импорта"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in bulk.FORMATS:
+        return JsonResponse({'error': 'Unknown format'}, status=400)
+    
+    response = StreamingHttpResponse(
+        bulk.export_products(Product.objects.filter(seller=request.user), fmt),
+        content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+    return response
+
 @login_required
 def product_create(request):
     """Создание нового товара"""
@@ -242,18 +340,11 @@ def toggle_favorite(request):
     """Добавление/удаление товара из избранного"""
     if request.method == 'POST':
         product_id = request.POST.get('product_id')
-        if product_id:
-            product = get_object_or_404(Product, id=product_id)
-            favorite, created = Favorite.objects.get_or_create(
-                user=request.user,
-                product=product
-            )
-            
-            if not created:
-                favorite.delete()
-                is_favorite = False
-            else:
-                is_favorite = True
+        if product_id and product_id.isdigit():
+            try:
+                is_favorite = FavoriteService(request.user).toggle(int(product_id))
+            except Product.DoesNotExist:
+                raise Http404
             
             return JsonResponse({
                 'status': 'success',
@@ -262,12 +353,37 @@ def toggle_favorite(request):
     
     return JsonResponse({'status': 'error'}, status=400)
 
+@login_required
+@require_POST
+def sync_favorites(request):
+    """Пакетное добавление и удаление избранного для офлайн-синхронизации"""
+    try:
+        data = json.loads(request.body)
+        to_add = [int(product_id) for product_id in data.get('add', [])]
+        to_remove = [int(product_id) for product_id in data.get('remove', [])]
+    except (ValueError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+    
+    service = FavoriteService(request.user)
+    if len(to_add) + len(to_remove) > service.MAX_BULK_SIZE:
+        return JsonResponse({'error': 'Too many items'}, status=400)
+    
+    if to_remove:
+        service.remove(to_remove)
+    if to_add:
+        service.add(to_add)
+    
+    return JsonResponse({
+        'status': 'success',
+        'favorite_ids': service.ids().tolist()
+    })
+
 @login_required
 def favorites(request):
     """Страница с избранными товарами"""
     favorites = Favorite.objects.filter(
         user=request.user
-    ).select_related('product', 'product__seller').prefetch_related('product__images')
+    ).select_related('product', 'product__seller', 'product__main_image')
     
     # Пагинация
     paginator = Paginator(favorites, 12)
@@ -299,6 +415,16 @@ def update_product_status(request, product_id):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
+@login_required
+def product_price_history(request, product_id):
+    """История изменения цены товара для продавца"""
+    product = get_object_or_404(Product, id=product_id, seller=request.user)
+    changes = product.price_history.values('old_price', 'new_price', 'changed')[:50]
+    return JsonResponse({
+        'price': product.price,
+        'history': list(changes)
+    })
+
 @login_required
 def delete_product(request, product_id):
     if request.method != 'DELETE':
@@ -316,15 +442,7 @@ def delete_product_image(request, image_id):
     
     image = get_object_or_404(ProductImage, id=image_id, product__seller=request.user)
     
-    # Если это главное изображение, сделать следующее изображение главным
-    if image.is_main:
-        next_image = ProductImage.objects.filter(
-            product=image.product
-        ).exclude(id=image.id).first()
-        if next_image:
-            next_image.is_main = True
-            next_image.save()
-    
+    # Следующее изображение становится главным в обработчике post_delete
     image.delete()
     return JsonResponse({'status': 'success'})
 
@@ -354,13 +472,18 @@ def create_lost_pet(request):
     
     return render(request, 'catalog/lost_pet_form.html', {'form': form})
 
+LOST_PET_FIELDS = ['id', 'title', 'description', 'location', 'image', 'thumbnail']
+
 def lost_pets_search(request):
     """Search for lost pets"""
     query = request.GET.get('q', '')
     location = request.GET.get('location', '')
     
+    # Категория берется из дерева: без соединения запрос идет по индексу
+    # активных объявлений категории
+    lost = get_category_tree().get_by_slug('lostfound')
     products = Product.objects.filter(
-        category__slug='lostfound',
+        category_id=lost.id if lost else None,
         status='active'
     )
     
@@ -374,18 +497,11 @@ def lost_pets_search(request):
     if location:
         products = products.filter(location__icontains=location)
     
-    return JsonResponse({
-        'results': [
-            {
-                'id': p.id,
-                'title': p.title,
-                'description': p.description,
-                'location': p.location,
-                'image': p.images.filter(is_main=True).first().image.url if p.images.exists() else None
-            }
-            for p in products
-        ]
-    })
+    try:
+        page = api.listing_page(products, request.GET, default_fields=LOST_PET_FIELDS)
+    except api.ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
 
 @login_required
 @require_POST
@@ -454,6 +570,15 @@ def notify_nearby_users(product):
         )
         print(f"Created notification: {notification.id}")
 
+def _user_mating_pet(user, pet_id=None):
+    pets = user.products.filter(
+        category__slug=MATING_CATEGORY_SLUG,
+        status='active'
+    ).select_related('mating_candidate')
+    if pet_id:
+        pets = pets.filter(pk=pet_id) if pet_id.isdigit() else pets.none()
+    return pets.first()
+
 @login_required
 @require_POST
 def mating_like(request):
@@ -461,10 +586,7 @@ def mating_like(request):
     product = get_object_or_404(Product, pk=request.POST.get('product'))
     
     # Get user's pet in mating category
-    user_pet = request.user.products.filter(
-        category__slug='mating',
-        status='active'
-    ).first()
+    user_pet = _user_mating_pet(request.user)
     
     if not user_pet:
         return JsonResponse({
@@ -473,7 +595,7 @@ def mating_like(request):
         }, status=400)
     
     # Check breed compatibility
-    if user_pet.breed != product.breed:
+    if breed_key(user_pet.breed) != breed_key(product.breed):
         return JsonResponse({
             'status': 'error',
             'message': _('Pets must be of the same breed')
@@ -486,33 +608,49 @@ def mating_like(request):
             'message': _('Pets must be of opposite genders')
         }, status=400)
     
-    # Create mating request
     with transaction.atomic():
-        request = MatingRequest.objects.create(
-            from_pet=user_pet,
-            to_pet=product
-        )
-        
-        # Check for mutual like
-        mutual_request = MatingRequest.objects.filter(
+        # Встречная заявка переходит в matched одним UPDATE по уникальному индексу
+        is_match = MatingRequest.objects.filter(
             from_pet=product,
             to_pet=user_pet,
             status='pending'
-        ).first()
+        ).update(status='matched', updated=timezone.now())
         
-        if mutual_request:
-            # It's a match!
-            request.status = 'matched'
-            mutual_request.status = 'matched'
-            request.save()
-            mutual_request.save()
+        if is_match:
+            MatingRequest.objects.bulk_create(
+                [MatingRequest(from_pet=user_pet, to_pet=product, status='matched')],
+                update_conflicts=True,
+                unique_fields=['from_pet', 'to_pet'],
+                update_fields=['status', 'updated']
+            )
             
-            # Create dialog
+            # It's a match! Create dialog
             dialog = Dialog.objects.create(product=product)
-            dialog.participants.add(request.from_pet.seller, request.to_pet.seller)
-            dialog.save()
+            dialog.participants.add(user_pet.seller_id, product.seller_id)
+        else:
+            # Повторный лайк не меняет существующую заявку
+            MatingRequest.objects.bulk_create(
+                [MatingRequest(from_pet=user_pet, to_pet=product)],
+                ignore_conflicts=True
+            )
     
-    return JsonResponse({'status': 'success'})
+    return JsonResponse({'status': 'success', 'matched': bool(is_match)})
+
+@login_required
+def mating_partners(request):
+    """Compatible partners for the user's mating pet"""
+    user_pet = _user_mating_pet(request.user, request.GET.get('pet'))
+    if not user_pet or not hasattr(user_pet, 'mating_candidate'):
+        return JsonResponse({
+            'status': 'error',
+            'message': _('You need to create a mating profile first')
+        }, status=400)
+    
+    try:
+        page = partners_page(user_pet, request.GET)
+    except api.ApiError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
 
 @login_required
 @require_POST
@@ -15,8 +15,8 @@ class DialogAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'dialog', 'sender', 'content', 'created_at', 'is_read']
-    list_filter = ['is_read', 'created_at']
+    list_display = ['id', 'dialog', 'sender', 'content', 'created_at']
+    list_filter = ['created_at']
     search_fields = ['content', 'sender__username', 'sender__email']
     readonly_fields = ['dialog', 'sender', 'created_at']
     date_hierarchy = 'created_at'
@@ -37,10 +37,10 @@ class LocationMessageAdmin(admin.ModelAdmin):
 
 @admin.register(VoiceMessage)
 class VoiceMessageAdmin(admin.ModelAdmin):
-    list_display = ['id', 'dialog', 'sender', 'duration', 'created_at']
-    list_filter = ['created_at']
+    list_display = ['id', 'dialog', 'sender', 'duration', 'status', 'created_at']
+    list_filter = ['status', 'created_at']
     search_fields = ['sender__username']
-    readonly_fields = ['created_at']
+    readonly_fields = ['created_at', 'processed_at', 'error']
 
 @admin.register(GroupChat)
 class GroupChatAdmin(admin.ModelAdmin):
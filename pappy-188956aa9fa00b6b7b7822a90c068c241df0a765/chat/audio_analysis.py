@@ -0,0 +1,220 @@
+import math
+import os
+import subprocess
+import tempfile
+import wave
+import numpy as np
+
+# Сколько кадров декодируется за раз: больше этого окна в памяти не бывает
+BLOCK_SIZE = 64 * 1024
+WAVEFORM_BUCKETS = 100
+# Уровень шума оценивается по первым NOISE_WINDOW секундам
+NOISE_WINDOW = 0.5
+COMPRESS_THRESHOLD = 0.3
+COMPRESS_RATIO = 0.6
+
+# Чем декодировать то, что не читает libsndfile (webm/opus, m4a/AAC)
+FFMPEG = 'ffmpeg'
+FFMPEG_TIMEOUT = 300
+
+_PCM_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+class AudioDecodeError(ValueError):
+    """Формат записи не удалось декодировать"""
+
+
+def transcode_to_wav(path):
+    """
+    Перекодирует запись через ffmpeg во временный моно 16-битный WAV и
+    возвращает его путь; ffmpeg пишет файл потоком, сигнал в память не
+    попадает. Удалить файл должен вызывающий.
+    """
+    fd, target = tempfile.mkstemp(prefix='voice-', suffix='.wav')
+    os.close(fd)
+    try:
+        subprocess.run(
+            [FFMPEG, '-nostdin', '-v', 'error', '-y', '-i', path,
+             '-vn', '-ac', '1', '-c:a', 'pcm_s16le', '-f', 'wav', target],
+            check=True, capture_output=True, timeout=FFMPEG_TIMEOUT
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        os.remove(target)
+        raise AudioDecodeError(f'Cannot decode {os.path.basename(path)}') from e
+    return target
+
+
+class AudioReader:
+    """
+    Потоковое чтение аудио блоками моно float32.
+
+    PCM WAV читается стандартным модулем wave, остальное, что умеет
+    libsndfile (24-битный и float WAV, FLAC, OGG), - через soundfile.
+    Прочие форматы сначала перекодируются ffmpeg во временный WAV.
+    frames и samplerate известны до чтения.
+    """
+
+    def __init__(self, path, block_size=BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+
+    def __enter__(self):
+        self._wave = self._file = self._transcoded = None
+        if self._open_wave(self.path) or self._open_soundfile():
+            return self
+        self._transcoded = transcode_to_wav(self.path)
+        if not self._open_wave(self._transcoded):
+            os.remove(self._transcoded)
+            raise AudioDecodeError(f'Cannot decode {os.path.basename(self.path)}')
+        return self
+
+    def __exit__(self, *exc_info):
+        (self._wave or self._file).close()
+        if self._transcoded:
+            os.remove(self._transcoded)
+
+    def _open_wave(self, path):
+        try:
+            handle = wave.open(path, 'rb')
+        except (wave.Error, EOFError):
+            return False
+        if handle.getsampwidth() not in _PCM_DTYPES:
+            # 24-битный PCM модуль wave открывает, но numpy его не разберет
+            handle.close()
+            return False
+        self._wave = handle
+        self.samplerate = handle.getframerate()
+        self.frames = handle.getnframes()
+        self.channels = handle.getnchannels()
+        return True
+
+    def _open_soundfile(self):
+        try:
+            import soundfile
+            handle = soundfile.SoundFile(self.path)
+        except (ImportError, RuntimeError):
+            # LibsndfileError - наследник RuntimeError
+            return False
+        self._file = handle
+        self.samplerate = handle.samplerate
+        self.frames = handle.frames
+        self.channels = handle.channels
+        return True
+
+    def blocks(self):
+        if self._wave is None:
+            for block in self._file.blocks(self.block_size, dtype='float32', always_2d=True):
+                yield block.mean(axis=1, dtype=np.float32) if self.channels > 1 else block[:, 0].copy()
+            return
+        self._wave.rewind()
+        width = self._wave.getsampwidth()
+        dtype = _PCM_DTYPES[width]
+        scale = float(2 ** (8 * width - 1))
+        while True:
+            data = self._wave.readframes(self.block_size)
+            if not data:
+                return
+            block = np.frombuffer(data, dtype=dtype).astype(np.float32)
+            if width == 1:
+                # 8-битный PCM беззнаковый
+                block -= 128
+            block /= scale
+            if self.channels > 1:
+                # Кадры чередуются по каналам: вид (кадры, каналы) без копии
+                block = block.reshape(-1, self.channels).mean(axis=1, dtype=np.float32)
+            yield block
+
+
+def measure_levels(reader):
+    """Первый проход: пик сигнала и средний модуль первых NOISE_WINDOW секунд"""
+    peak = 0.0
+    noise_total = 0.0
+    noise_frames = int(reader.samplerate * NOISE_WINDOW)
+    seen = 0
+    for block in reader.blocks():
+        if block.size:
+            peak = max(peak, float(np.abs(block).max()))
+        if seen < noise_frames:
+            head = block[:noise_frames - seen]
+            noise_total += float(np.abs(head).sum())
+        seen += block.size
+    noise_profile = noise_total / min(seen, noise_frames) if seen else 0.0
+    return peak, noise_profile
+
+
+def bucket_edges(frames, buckets=WAVEFORM_BUCKETS):
+    """Начала корзин волновой формы; последняя забирает хвост сигнала"""
+    buckets = min(buckets, frames)
+    return np.arange(buckets, dtype=np.int64) * frames // buckets
+
+
+def process_stream(source_path, output_path, buckets=WAVEFORM_BUCKETS, block_size=BLOCK_SIZE,
+                   threshold=COMPRESS_THRESHOLD, ratio=COMPRESS_RATIO):
+    """
+    Нормализует, очищает от шума и сжимает аудио, записывая моно 16-битный
+    WAV в output_path, и считает волновую форму и громкость.
+
+    Файл читается двумя проходами по блокам: первый находит пик и уровень
+    шума, второй обрабатывает блок на месте, пишет его и добавляет в корзины
+    пиков и RMS. Память не зависит от длины записи.
+    """
+    with AudioReader(source_path, block_size) as reader, wave.open(output_path, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(reader.samplerate)
+
+        source_peak, noise_profile = measure_levels(reader)
+        # Тишину не усиливаем: делить не на что
+        gain = 1.0 / source_peak if source_peak > 0 else 1.0
+        gate = noise_profile * gain * 2
+
+        edges = bucket_edges(reader.frames, buckets)
+        peaks = np.zeros(len(edges))
+        squares = np.zeros(len(edges))
+        counts = np.diff(np.append(edges, reader.frames))
+        magnitude = np.empty(block_size, dtype=np.float32)
+        position = 0
+
+        for block in reader.blocks():
+            size = block.size
+            if not size:
+                continue
+            mag = magnitude[:size]
+            block *= gain
+            np.abs(block, out=mag)
+            block[mag < gate] = 0
+            mag[mag < gate] = 0
+            over = mag > threshold
+            if over.any():
+                compressed = threshold + (mag[over] - threshold) * ratio
+                block[over] = np.copysign(compressed, block[over])
+                mag[over] = compressed
+
+            if len(edges):
+                # Корзины, которые начинаются внутри блока, и та, что в нем продолжается
+                first = int(np.searchsorted(edges, position, side='right')) - 1
+                inside = edges[(edges > position) & (edges < position + size)] - position
+                offsets = np.concatenate(([0], inside))
+                index = np.arange(first, first + len(offsets))
+                np.maximum.at(peaks, index, np.maximum.reduceat(mag, offsets))
+                np.square(mag, out=mag)
+                squares[index] += np.add.reduceat(mag, offsets, dtype=np.float64)
+
+            np.clip(block, -1.0, 1.0, out=block)
+            block *= 32767
+            output.writeframes(block.astype('<i2').tobytes())
+            position += size
+
+    if not reader.frames:
+        return {'waveform': [], 'rms': [], 'peak': 0.0, 'loudness': None, 'duration': 0.0}
+    rms = np.sqrt(squares / np.maximum(counts, 1))
+    top = peaks.max()
+    total_rms = math.sqrt(squares.sum() / reader.frames)
+    return {
+        'waveform': np.round(peaks / top if top > 0 else peaks, 3).tolist(),
+        'rms': np.round(rms, 4).tolist(),
+        'peak': source_peak,
+        # Громкость обработанной записи, dBFS; у тишины ее нет
+        'loudness': round(20 * math.log10(total_rms), 2) if total_rms > 0 else None,
+        'duration': reader.frames / reader.samplerate
+    }
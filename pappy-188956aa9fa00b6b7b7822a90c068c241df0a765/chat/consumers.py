@@ -1,10 +1,81 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
-from .models import Dialog, Message, User, GroupChat
+from django.db import IntegrityError, transaction
+from . import presence
+from .history import serialize_message
+from .inbox import mark_read
+from .membership import is_dialog_participant, is_group_member
+from .models import Message, GroupChat
+
+MAX_MESSAGE_LENGTH = 4000
+MAX_CLIENT_ID_LENGTH = 64
+# Через сколько секунд после первого события прочтения отметка пишется в базу;
+# события за это время сливаются в одну запись
+READ_FLUSH_DELAY = 2
+# Статус печати гаснет сам через TYPING_TIMEOUT секунд без нажатий; пока
+# пользователь печатает, подтверждение рассылается не чаще TYPING_REFRESH
+# (окно общее для всех вкладок пользователя в комнате, см. presence.claim_typing)
+TYPING_TIMEOUT = 6
+TYPING_REFRESH = 4
+
+# Отложенные проверки выхода из сети переживают свой consumer;
+# ссылки держатся здесь, пока задача не завершится
+_offline_checks = set()
+
+
+async def presence_call(func, *args):
+    """
+    Вызывает функцию presence, меняющую запись соединений. Пока замок
+    пользователя занят, ждет в цикле событий, а не в общем потоке ORM;
+    дольше LOCK_TTL замок не держится.
+    """
+    deadline = time.monotonic() + presence.LOCK_TTL + 1
+    while True:
+        try:
+            return await database_sync_to_async(func)(*args)
+        except presence.PresenceLocked:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(presence.LOCK_RETRY_DELAY)
+
+
+async def announce_offline_later(channel_layer, rooms, user_id):
+    """
+    Рассылает выход из сети во все комнаты rooms, если пользователь не
+    вернулся за OFFLINE_GRACE
+    """
+    await asyncio.sleep(presence.OFFLINE_GRACE)
+    if await database_sync_to_async(presence.is_online)(user_id):
+        return
+    for room_group_name in rooms:
+        if await database_sync_to_async(presence.should_announce)(room_group_name, user_id, False):
+            await channel_layer.group_send(
+                room_group_name,
+                {
+                    'type': 'user_status',
+                    'user': {
+                        'id': user_id,
+                        'is_online': False
+                    }
+                }
+            )
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    # Наибольший прочитанный id, еще не записанный в базу, и таймер записи
+    pending_read_id = None
+    read_flush_task = None
+    # Задача heartbeat; есть только у принятых соединений
+    heartbeat_task = None
+    # Статус печати, разосланный этим соединением: время последней
+    # рассылки, срок угасания и задача, которая его ждет
+    typing_sent_at = None
+    typing_deadline = None
+    typing_expiry_task = None
+
     async def connect(self):
         self.dialog_id = self.scope['url_route']['kwargs']['dialog_id']
         self.room_group_name = f'chat_{self.dialog_id}'
@@ -22,76 +93,251 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
-        
-        # Обновление статуса пользователя
-        await self.update_user_status(True)
-        
-        # Отправка уведомления другим участникам
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status',
-                'user': {
-                    'id': self.user.id,
-                    'is_online': True
-                }
-            }
-        )
+        await self.start_presence()
     
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
-            # Обновление статуса пользователя
-            await self.update_user_status(False)
+            # Отложенная отметка прочтения не должна потеряться
+            if self.read_flush_task is not None:
+                self.read_flush_task.cancel()
+                self.read_flush_task = None
+            await self.flush_read()
+            await self.stop_typing()
+            await self.stop_presence()
             
-            # Отправка уведомления другим участникам
+            # Отключение от группы чата
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
+    
+    async def start_presence(self):
+        """Регистрирует соединение и сообщает комнате, что пользователь в сети"""
+        await presence_call(presence.connect, self.user.id, self.channel_name, self.room_group_name)
+        self.heartbeat_task = asyncio.ensure_future(self.send_heartbeats())
+        if await database_sync_to_async(presence.should_announce)(self.room_group_name, self.user.id, True):
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'user_status',
                     'user': {
                         'id': self.user.id,
-                        'is_online': False
+                        'is_online': True
                     }
                 }
             )
-            
-            # Отключение от группы чата
-            await self.channel_layer.group_discard(
-                self.room_group_name,
-                self.channel_name
+    
+    async def stop_presence(self):
+        """
+        Снимает соединение. О выходе из сети все комнаты, где пользователь
+        появлялся, узнают только после закрытия его последнего соединения и
+        истечения OFFLINE_GRACE.
+        """
+        if self.heartbeat_task is None:
+            return
+        self.heartbeat_task.cancel()
+        self.heartbeat_task = None
+        rooms = await presence_call(presence.disconnect, self.user.id, self.channel_name)
+        if rooms:
+            task = asyncio.ensure_future(
+                announce_offline_later(self.channel_layer, rooms, self.user.id)
             )
+            _offline_checks.add(task)
+            task.add_done_callback(_offline_checks.discard)
+    
+    async def send_heartbeats(self):
+        while True:
+            await asyncio.sleep(presence.HEARTBEAT_INTERVAL)
+            await database_sync_to_async(presence.heartbeat)(self.user.id, self.channel_name)
     
     async def receive(self, text_data):
         data = json.loads(text_data)
         message_type = data.get('type')
         
-        if message_type == 'typing':
-            # Обработка статуса печати
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'typing_status',
-                    'user': {
-                        'id': self.user.id,
-                        'typing': data.get('typing', False)
-                    }
-                }
-            )
+        if message_type == 'message':
+            await self.handle_new_message(data)
+        elif message_type == 'typing':
+            await self.count_typing('received')
+            if data.get('typing', False):
+                await self.start_typing()
+            elif not await self.stop_typing():
+                await self.count_typing('suppressed')
         elif message_type == 'read':
-            # Обработка прочтения сообщений
-            message_ids = data.get('message_ids', [])
-            await self.mark_messages_read(message_ids)
-            
-            # Отправка уведомления о прочтении
+            self.queue_read(data)
+    
+    async def start_typing(self):
+        """
+        В комнату уходит только начало печати и редкие подтверждения;
+        остальные нажатия лишь отодвигают угасание статуса.
+        """
+        now = time.monotonic()
+        self.typing_deadline = now + TYPING_TIMEOUT
+        if not await database_sync_to_async(presence.claim_typing)(
+            self.room_group_name, self.user.id, TYPING_REFRESH
+        ):
+            await self.count_typing('suppressed')
+            return
+        self.typing_sent_at = now
+        if self.typing_expiry_task is None:
+            self.typing_expiry_task = asyncio.ensure_future(self.expire_typing())
+        await self.broadcast_typing(True)
+    
+    async def stop_typing(self):
+        """Конец печати рассылается, только если начало было разослано"""
+        if self.typing_sent_at is None:
+            return False
+        self.typing_sent_at = self.typing_deadline = None
+        if self.typing_expiry_task is not None:
+            self.typing_expiry_task.cancel()
+            self.typing_expiry_task = None
+        await self.broadcast_typing(False)
+        await database_sync_to_async(presence.release_typing)(self.room_group_name, self.user.id)
+        return True
+    
+    async def expire_typing(self):
+        while self.typing_deadline is not None:
+            delay = self.typing_deadline - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+        self.typing_expiry_task = None
+        await self.stop_typing()
+    
+    async def count_typing(self, event):
+        await database_sync_to_async(presence.record_typing)(event)
+
+    async def broadcast_typing(self, typing):
+        await self.count_typing('broadcast')
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'typing_status',
+                'user': {
+                    'id': self.user.id,
+                    'typing': typing
+                },
+                'expires_in': TYPING_TIMEOUT
+            }
+        )
+    
+    def queue_read(self, data):
+        """
+        Запоминает наибольший прочитанный id. В базу он попадает одной
+        записью через READ_FLUSH_DELAY секунд после первого события.
+        """
+        message_ids = list(data.get('message_ids') or [])
+        if 'message_id' in data:
+            message_ids.append(data['message_id'])
+        message_ids = [
+            message_id for message_id in message_ids
+            if isinstance(message_id, int) and not isinstance(message_id, bool)
+        ]
+        if not message_ids:
+            return
+        self.pending_read_id = max(self.pending_read_id or 0, *message_ids)
+        if self.read_flush_task is None:
+            self.read_flush_task = asyncio.ensure_future(self.flush_read_later())
+    
+    async def flush_read_later(self):
+        await asyncio.sleep(READ_FLUSH_DELAY)
+        self.read_flush_task = None
+        await self.flush_read()
+    
+    async def flush_read(self):
+        """Пишет отложенную отметку прочтения и рассылает ее участникам"""
+        up_to, self.pending_read_id = self.pending_read_id, None
+        if up_to is None:
+            return
+        last_read_id = await self.mark_messages_read(up_to)
+        if last_read_id is None:
+            return
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'messages_read',
+                'last_read_id': last_read_id,
+                'user_id': self.user.id
+            }
+        )
+    
+    async def handle_new_message(self, data):
+        """
+        Сохраняет и рассылает сообщение, отправленное через веб-сокет.
+
+        Отправитель получает подтверждение с id сообщения на сервере;
+        повтор с тем же client_id подтверждается без нового сообщения.
+        """
+        content = data.get('content')
+        client_id = data.get('client_id')
+        if not isinstance(content, str) or not content.strip():
+            await self.send_error('Сообщение не может быть пустым', client_id)
+            return
+        if len(content) > MAX_MESSAGE_LENGTH:
+            await self.send_error('Сообщение слишком длинное', client_id)
+            return
+        if client_id is not None and (
+            not isinstance(client_id, str) or not 0 < len(client_id) <= MAX_CLIENT_ID_LENGTH
+        ):
+            await self.send_error('Некорректный client_id', None)
+            return
+
+        # Участника могли удалить после подключения; проверка кэширована
+        if not await self.has_access():
+            await self.send_error('Нет доступа к чату', client_id)
+            await self.close()
+            return
+
+        message, created = await self.save_message(content.strip(), client_id)
+        payload = serialize_message(message, self.user)
+        await self.stop_typing()
+        if created:
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
-                    'type': 'messages_read',
-                    'message_ids': message_ids,
-                    'user_id': self.user.id
+                    'type': 'new_message',
+                    'message': payload
                 }
             )
-    
+        await self.send(text_data=json.dumps({
+            'type': 'ack',
+            'client_id': client_id,
+            'message': payload
+        }))
+
+    async def send_error(self, error, client_id):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'error': error,
+            'client_id': client_id
+        }))
+
+    def message_target(self):
+        """Поля сообщения, задающие его чат"""
+        return {'dialog_id': self.dialog_id}
+
+    @database_sync_to_async
+    def has_access(self):
+        return is_dialog_participant(self.user.id, self.dialog_id)
+
+    @database_sync_to_async
+    def save_message(self, content, client_id):
+        """Сохраняет сообщение; возвращает (сообщение, создано ли оно)"""
+        key = {'sender': self.user, 'client_id': client_id, **self.message_target()}
+        if client_id is not None:
+            existing = Message.objects.filter(**key).first()
+            if existing is not None:
+                return existing, False
+        try:
+            # Последнее сообщение и счетчики диалога обновляет Message.save
+            with transaction.atomic():
+                message = Message.objects.create(content=content, **key)
+        except IntegrityError:
+            if client_id is None:
+                raise
+            # Тот же ключ одновременно сохранило другое соединение
+            return Message.objects.get(**key), False
+        return message, True
+
     async def new_message(self, event):
         """Отправка нового сообщения клиенту"""
         message = event['message']
@@ -101,10 +347,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
         }))
     
     async def typing_status(self, event):
-        """Отправка статуса печати клиенту"""
+        """Отправка статуса печати клиенту, кроме самого автора"""
+        if event['user']['id'] == self.user.id:
+            await self.count_typing('echo_suppressed')
+            return
         await self.send(text_data=json.dumps({
             'type': 'typing',
-            'user': event['user']
+            'user': event['user'],
+            'expires_in': event['expires_in']
         }))
     
     async def user_status(self, event):
@@ -114,43 +364,29 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'user': event['user']
         }))
     
+    async def voice_processed(self, event):
+        """Результат обработки голосового сообщения"""
+        await self.send(text_data=json.dumps({
+            'type': 'voice_processed',
+            'voice': event['voice']
+        }))
+    
     async def messages_read(self, event):
         """Отправка статуса прочтения сообщений клиенту"""
         await self.send(text_data=json.dumps({
             'type': 'messages_read',
-            'message_ids': event['message_ids'],
+            'last_read_id': event['last_read_id'],
             'user_id': event['user_id']
         }))
     
-    @database_sync_to_async
-    def has_dialog_access(self):
+    async def has_dialog_access(self):
         """Проверка доступа пользователя к диалогу"""
-        try:
-            dialog = Dialog.objects.get(id=self.dialog_id)
-            return self.user in dialog.participants.all()
-        except Dialog.DoesNotExist:
-            return False
-    
-    @database_sync_to_async
-    def update_user_status(self, is_online):
-        """Обновление статуса пользователя"""
-        User.objects.filter(id=self.user.id).update(
-            is_online=is_online,
-            last_activity=timezone.now()
-        )
+        return await self.has_access()
     
     @database_sync_to_async
-    def mark_messages_read(self, message_ids):
-        """Отметка сообщений как прочитанных"""
-        Message.objects.filter(
-            id__in=message_ids,
-            dialog_id=self.dialog_id
-        ).exclude(
-            sender=self.user
-        ).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+    def mark_messages_read(self, up_to):
+        """Сдвиг отметки прочтения; None, если она не изменилась"""
+        return mark_read(self.dialog_id, self.user.id, up_to)
 
 
 class GroupChatConsumer(ChatConsumer):
@@ -171,60 +407,19 @@ class GroupChatConsumer(ChatConsumer):
         )
         
         await self.accept()
-        
-        # Обновление статуса пользователя
-        await self.update_user_status(True)
-        
-        # Отправка уведомления другим участникам
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'user_status',
-                'user': {
-                    'id': self.user.id,
-                    'is_online': True
-                }
-            }
-        )
+        await self.start_presence()
     
-    @database_sync_to_async
-    def has_group_chat_access(self):
+    async def has_group_chat_access(self):
         """Проверка доступа пользователя к групповому чату"""
-        try:
-            group_chat = GroupChat.objects.get(id=self.chat_id)
-            return self.user in group_chat.participants.all()
-        except GroupChat.DoesNotExist:
-            return False
+        return await self.has_access()
 
-    async def handle_new_message(self, data):
-        """Обработка нового сообщения в групповом чате"""
-        content = data.get('content')
-        if not content:
-            return
-            
-        # Создаем новое сообщение
-        message = Message.objects.create(
-            dialog_id=self.chat_id,  # GroupChat наследуется от Dialog
-            sender=self.user,
-            content=content
-        )
-        
-        # Обновляем последнее сообщение
-        chat = GroupChat.objects.get(id=self.chat_id)
-        chat.last_message = message
-        chat.save()
-        
-        # Отправляем сообщение всем участникам
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': message.id,
-                    'content': message.content,
-                    'sender_id': message.sender.id,
-                    'sender_name': message.sender.get_full_name() or message.sender.username,
-                    'created_at': message.created_at.isoformat()
-                }
-            }
-        ) 
\ No newline at end of file
+    @database_sync_to_async
+    def has_access(self):
+        return is_group_member(self.user.id, self.chat_id)
+
+    def message_target(self):
+        return {'group_chat_id': self.chat_id}
+
+    async def mark_messages_read(self, up_to):
+        # Отметки прочтения ведутся только для диалогов
+        return None
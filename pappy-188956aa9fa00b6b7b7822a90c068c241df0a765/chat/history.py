@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_WINDOW = 50
+MAX_WINDOW = 200
+
+
+class HistoryError(ValueError):
+    """Некорректные параметры запроса истории сообщений"""
+
+
+def serialize_message(message, sender):
+    """Сообщение в виде, который рассылается участникам и отдается API"""
+    return {
+        'id': message.id,
+        'client_id': message.client_id,
+        'content': message.content,
+        'sender_id': sender.id,
+        'sender_name': sender.get_full_name() or str(sender),
+        'created_at': message.created_at.isoformat()
+    }
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_WINDOW
+    try:
+        limit = int(value)
+    except ValueError:
+        raise HistoryError('Invalid limit')
+    return max(1, min(limit, MAX_WINDOW))
+
+
+def encode_cursor(message):
+    """Курсор по позиции сообщения: (created_at, id)"""
+    payload = json.dumps([message.created_at.isoformat(), message.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise HistoryError('Invalid cursor')
+    if created_at is None:
+        raise HistoryError('Invalid cursor')
+    return created_at, pk
+
+
+class MessageWindow:
+    """
+    Окно истории в хронологическом порядке.
+
+    older_cursor - позиция первого сообщения, если есть более ранние;
+    newer_cursor - позиция последнего сообщения, с нее запрашиваются
+    новые (has_newer - они уже есть).
+    """
+
+    def __init__(self, messages, has_older, has_newer):
+        self.messages = messages
+        self.has_older = has_older
+        self.has_newer = has_newer
+
+    @property
+    def older_cursor(self):
+        return encode_cursor(self.messages[0]) if self.has_older else None
+
+    @property
+    def newer_cursor(self):
+        return encode_cursor(self.messages[-1]) if self.messages else None
+
+
+def message_window(queryset, before=None, after=None, limit=DEFAULT_WINDOW):
+    """
+    Окно сообщений по курсору на (created_at, id).
+
+    Без курсора - последние limit сообщений; before - более ранние,
+    after - более новые. Запрос идет по индексу (чат, created_at, id),
+    поэтому стоимость не зависит от длины истории.
+    """
+    if before and after:
+        raise HistoryError('Use either before or after')
+
+    if after:
+        created_at, pk = decode_cursor(after)
+        rows = list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        ).order_by('created_at', 'id')[:limit + 1])
+        return MessageWindow(rows[:limit], has_older=False, has_newer=len(rows) > limit)
+
+    if before:
+        created_at, pk = decode_cursor(before)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+    rows = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+    has_older = len(rows) > limit
+    return MessageWindow(rows[:limit][::-1], has_older=has_older, has_newer=False)
+
+
+def window_page(window):
+    """Ответ API с окном сообщений"""
+    return {
+        'messages': [serialize_message(message, message.sender) for message in window.messages],
+        'older_cursor': window.older_cursor,
+        'newer_cursor': window.newer_cursor,
+        'has_newer': window.has_newer,
+    }
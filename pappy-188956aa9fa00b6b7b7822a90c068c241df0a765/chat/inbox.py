@@ -0,0 +1,63 @@
+from django.db.models import Count, Min, Subquery
+from django.db.models.functions import Coalesce
+from . import presence
+from .models import Dialog, DialogParticipant, Message
+
+
+def mark_read(dialog_id, user_id, up_to=None):
+    """
+    Сдвигает отметку прочтения участника до сообщения up_to (по умолчанию -
+    до последнего в диалоге). Отметка только растет; возвращает id, до
+    которого она сдвинута, или None, если сдвигать было некуда.
+    """
+    last_id = Dialog.objects.filter(id=dialog_id)\
+        .values_list('last_message_id', flat=True).first()
+    if not last_id:
+        return None
+    up_to = last_id if up_to is None else min(up_to, last_id)
+    # Непрочитанные считаются в том же UPDATE: сообщение, сохраненное после
+    # чтения last_message_id, не теряет своего увеличения счетчика
+    unread = Message.objects.filter(dialog_id=dialog_id, id__gt=up_to)\
+        .exclude(sender_id=user_id).values('dialog_id')\
+        .annotate(count=Count('id')).values('count')
+    updated = DialogParticipant.objects.filter(
+        dialog_id=dialog_id, user_id=user_id, last_read_id__lt=up_to
+    ).update(last_read_id=up_to, unread_count=Coalesce(Subquery(unread), 0))
+    return up_to if updated else None
+
+
+def read_by_others(dialog_id, user_id):
+    """До какого сообщения диалог прочитали все собеседники пользователя"""
+    return DialogParticipant.objects.filter(dialog_id=dialog_id).exclude(user_id=user_id)\
+        .aggregate(last_read_id=Min('last_read_id'))['last_read_id'] or 0
+
+
+def inbox(user):
+    """
+    Диалоги пользователя, начиная с последнего сообщения.
+
+    Список читается одним запросом по индексу участников, собеседники -
+    вторым запросом на всю страницу, их присутствие - одним запросом к
+    кэшу. У каждого диалога заполнены unread_count и opponent (с is_online).
+    """
+    rows = list(
+        DialogParticipant.objects.filter(user=user)
+        .select_related('dialog__last_message', 'dialog__product')
+        .order_by('-last_message_at', '-id')
+    )
+    opponents = {
+        row.dialog_id: row.user
+        for row in DialogParticipant.objects.filter(
+            dialog_id__in=[row.dialog_id for row in rows]
+        ).exclude(user=user).select_related('user')
+    }
+    online = presence.online_ids(opponent.id for opponent in opponents.values())
+    for opponent in opponents.values():
+        opponent.is_online = opponent.id in online
+    dialogs = []
+    for row in rows:
+        dialog = row.dialog
+        dialog.unread_count = row.unread_count
+        dialog.opponent = opponents.get(row.dialog_id)
+        dialogs.append(dialog)
+    return dialogs
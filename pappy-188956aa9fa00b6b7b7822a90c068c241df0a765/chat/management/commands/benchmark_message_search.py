@@ -0,0 +1,129 @@
+import random
+import statistics
+import time
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from login_auth.models import User
+from chat.membership import USER_DIALOGS_KEY
+from chat.models import Dialog, DialogParticipant, Message
+from chat.search import search_messages
+
+BENCHMARK_PHONE = '+70000000000'
+WORDS = (
+    'котенок щенок попугай хомяк корм прививки паспорт доставка самовывоз цена '
+    'скидка вольер переноска лоток когтеточка порода окрас возраст привит '
+    'стерилизован документы ветеринар осмотр фото видео договор задаток '
+    'приезжайте завтра сегодня вечером утром адрес метро здравствуйте спасибо'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Time chat message search against the legacy substring scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Create this many synthetic messages first (e.g. 10000000)'
+        )
+        parser.add_argument(
+            '--dialogs',
+            type=int,
+            default=1000,
+            help='Number of benchmark dialogs the seeded messages are spread over'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10000,
+            help='Messages per INSERT while seeding'
+        )
+        parser.add_argument(
+            '--phone',
+            default=BENCHMARK_PHONE,
+            help='Search as this user (default: the benchmark user)'
+        )
+        parser.add_argument(
+            '--query',
+            action='append',
+            help='Search phrase (can be repeated)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Number of runs per query'
+        )
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Print the query plan of the legacy query'
+        )
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], max(options['dialogs'], 1), max(options['batch_size'], 1))
+
+        user = User.objects.filter(phone=options['phone']).first()
+        if user is None:
+            raise CommandError(f'No user with phone {options["phone"]}; run with --seed first')
+        self.stdout.write(f'{Message.objects.count()} messages, {connection.vendor}')
+
+        for query in options['query'] or ['котенок', 'доставка завтра', 'прививки паспорт']:
+            legacy = Message.objects.filter(
+                content__icontains=query,
+                dialog__participants=user
+            ).select_related('dialog', 'sender').order_by('-created_at')
+            self.report(f'legacy  "{query}"', lambda: list(legacy[:20]), options['repeat'])
+            self.report(f'index   "{query}"', lambda: search_messages(user, query).messages, options['repeat'])
+            if options['explain']:
+                self.stdout.write(legacy[:20].explain())
+
+    def report(self, name, run, repeat):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            rows = len(run())
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{name:<36} rows={rows:<3} median={statistics.median(timings):.2f}ms p95={p95:.2f}ms'
+        )
+
+    def seed(self, count, dialog_count, batch_size):
+        rng = random.Random(42)
+        user, _ = User.objects.get_or_create(phone=BENCHMARK_PHONE)
+        dialogs = list(Dialog.objects.filter(participants=user)[:dialog_count])
+        with transaction.atomic():
+            for i in range(len(dialogs), dialog_count):
+                other, _ = User.objects.get_or_create(phone=f'+7001{i:07d}')
+                dialog = Dialog.objects.create()
+                DialogParticipant.objects.bulk_create([
+                    DialogParticipant(dialog=dialog, user=user),
+                    DialogParticipant(dialog=dialog, user=other),
+                ])
+                dialogs.append(dialog)
+        cache.delete(USER_DIALOGS_KEY.format(user_id=user.id))
+
+        # Диалоги пользователя - лишь часть базы, как и в рабочих данных:
+        # остальные сообщения пишутся в диалоги без него
+        strangers = [Dialog.objects.create() for _ in range(dialog_count)]
+        now = timezone.now()
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            Message.objects.bulk_create([
+                Message(
+                    dialog=rng.choice(dialogs if rng.random() < 0.1 else strangers),
+                    sender=user,
+                    content=' '.join(rng.choices(WORDS, k=rng.randint(4, 14))),
+                    created_at=now
+                )
+                for _ in range(size)
+            ])
+            created += size
+            self.stdout.write(f'Seeded {created}/{count} messages')
@@ -0,0 +1,127 @@
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import wave
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from chat.audio_analysis import BLOCK_SIZE, COMPRESS_RATIO, COMPRESS_THRESHOLD, NOISE_WINDOW, process_stream
+
+
+def legacy_process(source_path, output_path, segments=100):
+    """
+    Прежняя обработка для сравнения: весь сигнал в памяти, три копии при
+    улучшении и волновая форма циклом по сегментам
+    """
+    with wave.open(source_path, 'rb') as source:
+        rate = source.getframerate()
+        y = np.frombuffer(source.readframes(source.getnframes()), dtype='<i2') / 32768.0
+    y = y / np.abs(y).max()
+    noise_profile = np.mean(np.abs(y[:int(rate * NOISE_WINDOW)]))
+    y_denoised = y.copy()
+    y_denoised[np.abs(y) < noise_profile * 2] = 0
+    mask = np.abs(y_denoised) > COMPRESS_THRESHOLD
+    y_compressed = y_denoised.copy()
+    y_compressed[mask] = np.sign(y_denoised[mask]) * (
+        COMPRESS_THRESHOLD + (np.abs(y_denoised[mask]) - COMPRESS_THRESHOLD) * COMPRESS_RATIO
+    )
+    segment_size = len(y_compressed) // segments
+    waveform = []
+    for i in range(segments):
+        segment = y_compressed[i * segment_size:(i + 1) * segment_size]
+        waveform.append(float(np.abs(segment).mean()))
+    waveform = np.array(waveform)
+    waveform = (waveform - waveform.min()) / (waveform.max() - waveform.min())
+    with wave.open(output_path, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(rate)
+        output.writeframes((y_compressed * 32767).astype('<i2').tobytes())
+    return {'waveform': waveform.tolist(), 'duration': len(y_compressed) / rate}
+
+
+class Command(BaseCommand):
+    help = 'Time voice message processing against the legacy in-memory implementation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            help='16-bit PCM WAV to process (default: a synthetic voice note)'
+        )
+        parser.add_argument(
+            '--seconds',
+            type=int,
+            default=600,
+            help='Length of the synthetic voice note'
+        )
+        parser.add_argument(
+            '--rate',
+            type=int,
+            default=16000,
+            help='Sample rate of the synthetic voice note'
+        )
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=BLOCK_SIZE,
+            help='Frames decoded per block by the streaming implementation'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of runs per implementation'
+        )
+
+    def handle(self, *args, **options):
+        output_fd, output_path = tempfile.mkstemp(prefix='voice-', suffix='.wav')
+        os.close(output_fd)
+        source_path = options['file']
+        try:
+            if source_path is None:
+                source_fd, source_path = tempfile.mkstemp(prefix='voice-', suffix='.wav')
+                os.close(source_fd)
+                self.synthesize(source_path, max(options['seconds'], 1), options['rate'])
+            elif not os.path.exists(source_path):
+                raise CommandError(f'No such file: {source_path}')
+
+            with wave.open(source_path, 'rb') as source:
+                seconds = source.getnframes() / source.getframerate()
+            self.stdout.write(f'{seconds:.0f}s voice note, block size {options["block_size"]}')
+            self.report('legacy', lambda: legacy_process(source_path, output_path), options['repeat'])
+            self.report('stream', lambda: process_stream(
+                source_path, output_path, block_size=max(options['block_size'], 1)
+            ), options['repeat'])
+        finally:
+            os.remove(output_path)
+            if options['file'] is None and source_path is not None and os.path.exists(source_path):
+                os.remove(source_path)
+
+    def report(self, name, run, repeat):
+        timings = []
+        peaks = []
+        for _ in range(max(repeat, 1)):
+            tracemalloc.start()
+            started = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - started) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+            tracemalloc.stop()
+        self.stdout.write(
+            f'{name:<8} median={statistics.median(timings):.1f}ms peak memory={max(peaks):.1f}MiB'
+        )
+
+    def synthesize(self, path, seconds, rate):
+        # Тихое начало и речь - тон с огибающей слогов; пишется по секунде
+        rng = np.random.default_rng(42)
+        with wave.open(path, 'wb') as output:
+            output.setnchannels(1)
+            output.setsampwidth(2)
+            output.setframerate(rate)
+            t = np.arange(rate) / rate
+            for second in range(seconds):
+                y = rng.normal(0, 0.005, rate)
+                if second:
+                    y += 0.4 * np.sin(2 * np.pi * 180 * t) * np.abs(np.sin(2 * np.pi * 3 * t))
+                output.writeframes((np.clip(y, -1, 1) * 32767).astype('<i2').tobytes())
@@ -49,7 +49,6 @@ class Command(BaseCommand):
                     dialog=dialog,
                     sender=random.choice(participants),
                     content=f'Test message {j} in dialog {i}',
-                    is_read=random.choice([True, False]),
                     created_at=timezone.now()
                 )
                 self.stdout.write(f'Created message in dialog {i}')
@@ -96,7 +95,6 @@ class Command(BaseCommand):
                     group_chat=group,
                     sender=random.choice(participants),
                     content=f'Test message {j} in group {i}',
-                    is_read=random.choice([True, False]),
                     created_at=timezone.now()
                 )
                 self.stdout.write(f'Created message in group chat {i}')
@@ -0,0 +1,42 @@
+import time
+from django.core.management.base import BaseCommand
+from chat.voice import BATCH_SIZE, process_pending_voice
+
+class Command(BaseCommand):
+    help = 'Clean up, analyse and transcribe pending voice messages'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of voice messages claimed per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Number of voice messages processed at the same time'
+        )
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running and poll for new voice messages at this interval'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            report = process_pending_voice(
+                batch_size=options['batch_size'],
+                workers=max(options['workers'], 1)
+            )
+            for pk, error in report.errors:
+                self.stderr.write(f'voice message {pk}: {error}')
+            if options['watch'] is None or report.processed or report.errors:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Processed {report.processed} voice messages, failed: {len(report.errors)}'
+                ))
+            if options['watch'] is None:
+                break
+            time.sleep(options['watch'])
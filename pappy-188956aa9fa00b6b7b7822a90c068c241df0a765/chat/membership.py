@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from .models import DialogParticipant, GroupChatMember
+
+DIALOG_KEY = 'chat:dialog_member:{dialog_id}:{user_id}'
+GROUP_KEY = 'chat:group_member:{chat_id}:{user_id}'
+USER_DIALOGS_KEY = 'chat:user_dialogs:{user_id}'
+# Кэшируются и положительные, и отрицательные ответы; изменения состава
+# сбрасывают их сигналами, TTL лишь ограничивает ошибку при сбое сброса
+MEMBERSHIP_TTL = 60 * 10
+
+
+def _cached_check(key, query):
+    value = cache.get(key)
+    if value is None:
+        value = int(query.exists())
+        cache.set(key, value, MEMBERSHIP_TTL)
+    return bool(value)
+
+
+def is_dialog_participant(user_id, dialog_id):
+    """Участвует ли пользователь в диалоге: один EXISTS по таблице участников"""
+    if user_id is None:
+        return False
+    return _cached_check(
+        DIALOG_KEY.format(dialog_id=dialog_id, user_id=user_id),
+        DialogParticipant.objects.filter(dialog_id=dialog_id, user_id=user_id)
+    )
+
+
+def is_group_member(user_id, chat_id):
+    """Состоит ли пользователь в групповом чате, без загрузки списка участников"""
+    if user_id is None:
+        return False
+    return _cached_check(
+        GROUP_KEY.format(chat_id=chat_id, user_id=user_id),
+        GroupChatMember.objects.filter(chat_id=chat_id, user_id=user_id)
+    )
+
+
+def user_dialog_ids(user_id):
+    """Id диалогов пользователя; кэшируется вместе с ответами о членстве"""
+    key = USER_DIALOGS_KEY.format(user_id=user_id)
+    dialog_ids = cache.get(key)
+    if dialog_ids is None:
+        dialog_ids = list(
+            DialogParticipant.objects.filter(user_id=user_id)
+            .order_by('dialog_id').values_list('dialog_id', flat=True)
+        )
+        cache.set(key, dialog_ids, MEMBERSHIP_TTL)
+    return dialog_ids
+
+
+def invalidate_dialog_membership(pairs):
+    """Сбрасывает ответы для пар (id диалога, id пользователя)"""
+    pairs = list(pairs)
+    cache.delete_many([
+        DIALOG_KEY.format(dialog_id=dialog_id, user_id=user_id) for dialog_id, user_id in pairs
+    ] + [
+        USER_DIALOGS_KEY.format(user_id=user_id) for user_id in {user_id for _, user_id in pairs}
+    ])
+
+
+def invalidate_group_membership(chat_id, user_id):
+    cache.delete(GROUP_KEY.format(chat_id=chat_id, user_id=user_id))
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.2 on 2026-10-19 12:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('uploads', '0001_initial'),
+        ('chat', '0002_dialog_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupchat',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='uploads.imageblob', verbose_name='обработанный файл'),
+        ),
+        migrations.AddField(
+            model_name='messageattachment',
+            name='blob',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='uploads.imageblob'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.2 on 2026-10-19 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_groupchat_blob_messageattachment_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_id__isnull', False)), fields=('sender', 'client_id'), name='message_sender_client_id'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.2 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_client_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['dialog', 'created_at', 'id'], name='message_dialog_created'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['group_chat', 'created_at', 'id'], name='message_group_created'),
+        ),
+    ]
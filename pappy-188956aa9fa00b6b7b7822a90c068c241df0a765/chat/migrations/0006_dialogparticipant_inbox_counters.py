@@ -0,0 +1,83 @@
+# Generated by Django 5.0.2 on 2026-10-19 14:10
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Dialog = apps.get_model('chat', 'Dialog')
+    DialogParticipant = apps.get_model('chat', 'DialogParticipant')
+    Message = apps.get_model('chat', 'Message')
+
+    last = Message.objects.filter(dialog=OuterRef('pk')).order_by('-created_at', '-id')
+    Dialog.objects.update(
+        last_message=Subquery(last.values('id')[:1]),
+        last_message_at=Coalesce(Subquery(last.values('created_at')[:1]), 'created_at')
+    )
+    unread = Message.objects.filter(
+        dialog=OuterRef('dialog'), is_read=False
+    ).exclude(sender=OuterRef('user')).values('dialog').annotate(count=Count('id')).values('count')
+    DialogParticipant.objects.update(
+        last_message_at=Subquery(
+            Dialog.objects.filter(pk=OuterRef('dialog')).values('last_message_at')[:1]
+        ),
+        unread_count=Coalesce(Subquery(unread[:1]), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chat', '0005_message_history_indexes'),
+    ]
+
+    operations = [
+        # Автоматическая таблица связи participants становится явной моделью
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='DialogParticipant',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('dialog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='chat.dialog')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'chat_dialog_participants',
+                        'unique_together': {('dialog', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='dialog',
+                    name='participants',
+                    field=models.ManyToManyField(related_name='dialogs', through='chat.DialogParticipant', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+            database_operations=[],
+        ),
+        migrations.AddField(
+            model_name='dialogparticipant',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dialogparticipant',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='dialog',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='dialogparticipant',
+            index=models.Index(fields=['user', '-last_message_at', '-id'], name='dialog_participant_inbox'),
+        ),
+    ]
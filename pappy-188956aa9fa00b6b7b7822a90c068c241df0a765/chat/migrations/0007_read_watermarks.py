@@ -0,0 +1,50 @@
+# Generated by Django 5.0.2 on 2026-10-19 16:05
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_watermarks(apps, schema_editor):
+    Dialog = apps.get_model('chat', 'Dialog')
+    DialogParticipant = apps.get_model('chat', 'DialogParticipant')
+    Message = apps.get_model('chat', 'Message')
+
+    # Участник прочитал все до первого непрочитанного сообщения собеседника
+    first_unread = Message.objects.filter(
+        dialog=OuterRef('dialog'), is_read=False
+    ).exclude(sender=OuterRef('user')).order_by('id').values('id')[:1]
+    last_message = Dialog.objects.filter(pk=OuterRef('dialog')).values('last_message_id')[:1]
+    DialogParticipant.objects.update(
+        last_read_id=Coalesce(Subquery(first_unread) - 1, Subquery(last_message), 0)
+    )
+
+
+def fill_is_read(apps, schema_editor):
+    DialogParticipant = apps.get_model('chat', 'DialogParticipant')
+    Message = apps.get_model('chat', 'Message')
+
+    for participant in DialogParticipant.objects.all().iterator():
+        Message.objects.filter(
+            dialog_id=participant.dialog_id, id__lte=participant.last_read_id
+        ).exclude(sender_id=participant.user_id).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_dialogparticipant_inbox_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dialogparticipant',
+            name='last_read_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_watermarks, fill_is_read),
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
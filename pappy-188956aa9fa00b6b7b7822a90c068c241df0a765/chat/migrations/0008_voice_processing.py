@@ -0,0 +1,52 @@
+# Generated by Django 5.0.2 on 2026-10-19 17:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voicemessage',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='voicemessage',
+            name='processed_file',
+            field=models.FileField(blank=True, upload_to='voice_messages/processed/'),
+        ),
+        migrations.AddField(
+            model_name='voicemessage',
+            name='waveform',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='voicemessage',
+            name='transcript',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='voicemessage',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='voicemessage',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='voicemessage',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='voicemessage',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'processing'])), fields=['status', 'id'], name='voice_message_queue'),
+        ),
+    ]
@@ -0,0 +1,170 @@
+# Generated by Django 5.0.2 on 2026-10-19 13:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_members(apps, schema_editor):
+    GroupChat = apps.get_model('chat', 'GroupChat')
+    GroupChatMember = apps.get_model('chat', 'GroupChatMember')
+
+    # Администратор прежней схемы становится владельцем, участники - участниками.
+    # Обе связи читаются по id: обратные имена старой и новой связи совпадают
+    owners = dict(GroupChat.objects.exclude(admin=None).values_list('id', 'admin_id'))
+    Participant = GroupChat.participants.through
+    members = [
+        GroupChatMember(chat_id=chat_id, user_id=user_id, role='owner')
+        for chat_id, user_id in owners.items()
+    ]
+    members.extend(
+        GroupChatMember(chat_id=chat_id, user_id=user_id)
+        for chat_id, user_id in Participant.objects.values_list('groupchat_id', 'user_id').iterator()
+        if owners.get(chat_id) != user_id
+    )
+    GroupChatMember.objects.bulk_create(members, batch_size=1000)
+
+
+def copy_participants(apps, schema_editor):
+    GroupChat = apps.get_model('chat', 'GroupChat')
+    GroupChatMember = apps.get_model('chat', 'GroupChatMember')
+
+    Participant = GroupChat.participants.through
+    Participant.objects.bulk_create([
+        Participant(groupchat_id=chat_id, user_id=user_id)
+        for chat_id, user_id in GroupChatMember.objects.values_list('chat_id', 'user_id')
+    ], batch_size=1000)
+    for chat_id, user_id in GroupChatMember.objects.filter(role='owner').values_list('chat_id', 'user_id'):
+        GroupChat.objects.filter(pk=chat_id).update(admin_id=user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_voice_processing'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='groupchat',
+            options={'verbose_name': 'групповой чат', 'verbose_name_plural': 'групповые чаты'},
+        ),
+        migrations.RemoveField(
+            model_name='groupchat',
+            name='updated_at',
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='invite_link',
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True, verbose_name='ссылка-приглашение'),
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='max_members',
+            field=models.PositiveIntegerField(default=100, verbose_name='максимум участников'),
+        ),
+        migrations.AddField(
+            model_name='groupchat',
+            name='privacy',
+            field=models.CharField(choices=[('public', 'Публичный'), ('private', 'Приватный'), ('secret', 'Секретный')], default='private', max_length=20, verbose_name='приватность'),
+        ),
+        migrations.AlterField(
+            model_name='groupchat',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, upload_to='chat/avatars/', verbose_name='аватар'),
+        ),
+        migrations.AlterField(
+            model_name='groupchat',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='создан'),
+        ),
+        migrations.AlterField(
+            model_name='groupchat',
+            name='description',
+            field=models.TextField(blank=True, verbose_name='описание'),
+        ),
+        migrations.AlterField(
+            model_name='groupchat',
+            name='name',
+            field=models.CharField(max_length=100, verbose_name='название'),
+        ),
+        migrations.CreateModel(
+            name='GroupChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content', models.TextField(verbose_name='содержание')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('edited_at', models.DateTimeField(blank=True, null=True, verbose_name='изменено')),
+                ('is_system', models.BooleanField(default=False, verbose_name='системное')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chat.groupchat', verbose_name='чат')),
+                ('reply_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='replies', to='chat.groupchatmessage', verbose_name='ответ на')),
+                ('sender', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='group_messages', to=settings.AUTH_USER_MODEL, verbose_name='отправитель')),
+            ],
+            options={
+                'verbose_name': 'сообщение группового чата',
+                'verbose_name_plural': 'сообщения группового чата',
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupChatModeration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('mute', 'Мут'), ('kick', 'Кик'), ('ban', 'Бан')], max_length=20, verbose_name='действие')),
+                ('reason', models.TextField(verbose_name='причина')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('expires_at', models.DateTimeField(blank=True, null=True, verbose_name='истекает')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moderation_actions', to='chat.groupchat', verbose_name='чат')),
+                ('moderator', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='moderation_actions', to=settings.AUTH_USER_MODEL, verbose_name='модератор')),
+                ('target_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_actions', to=settings.AUTH_USER_MODEL, verbose_name='цель')),
+            ],
+            options={
+                'verbose_name': 'действие модерации',
+                'verbose_name_plural': 'действия модерации',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupChatInvite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('expires_at', models.DateTimeField(verbose_name='истекает')),
+                ('is_accepted', models.BooleanField(default=False, verbose_name='принято')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invites', to='chat.groupchat', verbose_name='чат')),
+                ('invitee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_invites', to=settings.AUTH_USER_MODEL, verbose_name='приглашенный')),
+                ('inviter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_invites', to=settings.AUTH_USER_MODEL, verbose_name='пригласивший')),
+            ],
+            options={
+                'verbose_name': 'приглашение в чат',
+                'verbose_name_plural': 'приглашения в чат',
+                'unique_together': {('chat', 'invitee')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupChatMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Владелец'), ('admin', 'Администратор'), ('moderator', 'Модератор'), ('member', 'Участник')], default='member', max_length=20, verbose_name='роль')),
+                ('joined_at', models.DateTimeField(auto_now_add=True, verbose_name='присоединился')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='chat.groupchat', verbose_name='чат')),
+                ('invited_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invited_members', to=settings.AUTH_USER_MODEL, verbose_name='пригласил')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='group_chats', to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'участник группового чата',
+                'verbose_name_plural': 'участники группового чата',
+                'unique_together': {('chat', 'user')},
+            },
+        ),
+        migrations.RunPython(copy_members, copy_participants),
+        migrations.RemoveField(
+            model_name='groupchat',
+            name='admin',
+        ),
+        migrations.RemoveField(
+            model_name='groupchat',
+            name='participants',
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.2 on 2026-10-19 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_group_chat_members'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='message',
+            name='message_sender_client_id',
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_id__isnull', False), ('dialog__isnull', False)), fields=('dialog', 'sender', 'client_id'), name='message_dialog_client_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(condition=models.Q(('client_id__isnull', False), ('group_chat__isnull', False)), fields=('group_chat', 'sender', 'client_id'), name='message_group_client_id'),
+        ),
+    ]
@@ -1,10 +1,11 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Case, F, Q, Value, When
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
+from django_cleanup import cleanup
 
 User = get_user_model()
 
@@ -23,7 +24,14 @@ class DialogManager(models.Manager):
 
 class Dialog(models.Model):
     """Модель диалога между пользователями"""
-    participants = models.ManyToManyField(User, related_name='dialogs')
+    participants = models.ManyToManyField(User, related_name='dialogs', through='DialogParticipant')
+    product = models.ForeignKey(
+        'catalog.Product',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='dialogs'
+    )
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(default=timezone.now)
     last_message = models.ForeignKey(
@@ -33,6 +41,8 @@ class Dialog(models.Model):
         on_delete=models.SET_NULL,
         related_name='last_message_dialog'
     )
+    # Время последнего сообщения, у диалога без сообщений - время создания
+    last_message_at = models.DateTimeField(default=timezone.now)
     
     objects = DialogManager()
     
@@ -68,6 +78,33 @@ class Dialog(models.Model):
     def __str__(self):
         return f'Dialog {self.id} between {", ".join(str(p) for p in self.participants.all())}'
 
+class DialogParticipant(models.Model):
+    """
+    Участник диалога со счетчиком непрочитанных.
+
+    last_message_at копирует время последнего сообщения диалога, чтобы
+    список диалогов пользователя читался одним запросом по индексу
+    (user, -last_message_at) без соединения и сортировки.
+
+    last_read_id - отметка прочтения: сообщения диалога с id не больше
+    нее участник прочитал.
+    """
+    dialog = models.ForeignKey(Dialog, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_message_at = models.DateTimeField(default=timezone.now)
+    last_read_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        # Таблица бывшей автоматической связи participants
+        db_table = 'chat_dialog_participants'
+        unique_together = ['dialog', 'user']
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'], name='dialog_participant_inbox'),
+        ]
+
+# Файлы удаляет конвейер загрузок (uploads) по счетчику ссылок
+@cleanup.ignore
 class GroupChat(models.Model):
     """Модель группового чата"""
     
@@ -80,6 +117,9 @@ class GroupChat(models.Model):
     name = models.CharField(_('название'), max_length=100)
     description = models.TextField(_('описание'), blank=True)
     avatar = models.ImageField(_('аватар'), upload_to='chat/avatars/', null=True, blank=True)
+    blob = models.ForeignKey('uploads.ImageBlob', verbose_name=_('обработанный файл'),
+                             on_delete=models.SET_NULL, null=True, blank=True,
+                             editable=False, related_name='+')
     created_at = models.DateTimeField(_('создан'), auto_now_add=True)
     
     privacy = models.CharField(
@@ -274,34 +314,78 @@ class Message(models.Model):
     )
     content = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
-    is_read = models.BooleanField(default=False)
+    # Ключ, сгенерированный клиентом: повторная отправка того же сообщения
+    # (после обрыва соединения) не создает дубликат
+    client_id = models.CharField(max_length=64, null=True, blank=True)
     
     def clean(self):
         from django.core.exceptions import ValidationError
-        if not self.dialog and not self.group_chat:
+        # Проверяются id, чтобы не загружать диалог или чат при каждом сохранении
+        if not self.dialog_id and not self.group_chat_id:
             raise ValidationError('Message must belong to either a dialog or a group chat')
-        if self.dialog and self.group_chat:
+        if self.dialog_id and self.group_chat_id:
             raise ValidationError('Message cannot belong to both dialog and group chat')
 
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding and self.dialog_id:
+                self.update_dialog_counters()
+
+    def update_dialog_counters(self):
+        """
+        Обновляет последнее сообщение диалога и счетчики непрочитанных
+        двумя UPDATE без чтения текущих значений
+        """
+        Dialog.objects.filter(id=self.dialog_id).update(
+            last_message=self,
+            last_message_at=self.created_at
+        )
+        # Отправитель прочитал диалог до своего сообщения
+        DialogParticipant.objects.filter(dialog_id=self.dialog_id).update(
+            last_message_at=self.created_at,
+            unread_count=Case(
+                When(user_id=self.sender_id, then=Value(0)),
+                default=F('unread_count') + 1
+            ),
+            last_read_id=Case(
+                When(user_id=self.sender_id, then=Value(self.id)),
+                default=F('last_read_id'),
+                output_field=models.BigIntegerField()
+            )
+        )
 
     class Meta:
         verbose_name = 'Сообщение'
         verbose_name_plural = 'Сообщения'
         ordering = ['created_at']
+        indexes = [
+            # Окна истории по курсору (created_at, id), см. chat.history
+            models.Index(fields=['dialog', 'created_at', 'id'], name='message_dialog_created'),
+            models.Index(fields=['group_chat', 'created_at', 'id'], name='message_group_created'),
+        ]
+        constraints = [
+            # Ключ повтора уникален в пределах чата отправителя
+            models.UniqueConstraint(
+                fields=['dialog', 'sender', 'client_id'],
+                condition=Q(client_id__isnull=False, dialog__isnull=False),
+                name='message_dialog_client_id'
+            ),
+            models.UniqueConstraint(
+                fields=['group_chat', 'sender', 'client_id'],
+                condition=Q(client_id__isnull=False, group_chat__isnull=False),
+                name='message_group_client_id'
+            ),
+        ]
 
     def __str__(self):
         chat_type = 'dialog' if self.dialog else 'group'
         chat_id = self.dialog.id if self.dialog else self.group_chat.id
         return f'Message in {chat_type} {chat_id} from {self.sender}'
 
-    def mark_as_read(self):
-        if not self.is_read:
-            self.is_read = True
-            self.save()
-
+@cleanup.ignore
 class MessageAttachment(models.Model):
     """Модель для хранения файлов, прикрепленных к сообщениям"""
     message = models.ForeignKey(
@@ -311,6 +395,9 @@ class MessageAttachment(models.Model):
     )
     file = models.FileField(upload_to='chat_attachments/')
     file_type = models.CharField(max_length=50)
+    # Обработанное изображение; у остальных вложений всегда пусто
+    blob = models.ForeignKey('uploads.ImageBlob', on_delete=models.SET_NULL,
+                             null=True, blank=True, editable=False, related_name='+')
     created_at = models.DateTimeField(default=timezone.now)
     
     def __str__(self):
@@ -375,9 +462,38 @@ class VoiceMessage(models.Model):
         on_delete=models.CASCADE,
         related_name='voice_messages'
     )
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Ожидает обработки'),
+        (STATUS_PROCESSING, 'Обрабатывается'),
+        (STATUS_READY, 'Готово'),
+        (STATUS_FAILED, 'Ошибка обработки'),
+    ]
+
     audio_file = models.FileField(upload_to='voice_messages/')
     duration = models.IntegerField()  # длительность в секундах
     created_at = models.DateTimeField(default=timezone.now)
+    # Результаты обработки (chat.voice), пока status не ready - пустые
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    processed_file = models.FileField(upload_to='voice_messages/processed/', blank=True)
+    waveform = models.JSONField(default=list, blank=True)
+    transcript = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Очередь обработки: только незавершенные сообщения
+            models.Index(
+                fields=['status', 'id'],
+                name='voice_message_queue',
+                condition=Q(status__in=['pending', 'processing'])
+            ),
+        ]
     
     def clean(self):
         from django.core.exceptions import ValidationError
@@ -0,0 +1,176 @@
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.utils import timezone
+from .models import User
+
+# Состояние хранится в общем кэше (Redis при REDIS_CACHE_URL, иначе кэш
+# процесса), а не в строках пользователей
+CONNECTIONS_KEY = 'chat:presence:connections:{user_id}'
+CHANNEL_KEY = 'chat:presence:channel:{channel_name}'
+LOCK_KEY = 'chat:presence:lock:{user_id}'
+ONLINE_KEY = 'chat:presence:online:{user_id}'
+ANNOUNCED_KEY = 'chat:presence:announced:{room}:{user_id}'
+ACTIVITY_KEY = 'chat:presence:activity:{user_id}'
+TYPING_KEY = 'chat:presence:typing:{room}:{user_id}'
+# Счетчики событий печати всех процессов: received - пришло от клиентов,
+# broadcast - разослано в комнату, suppressed - погашено без рассылки,
+# echo_suppressed - не отправлено обратно автору
+TYPING_STATS_KEY = 'chat:typing:stats:{event}'
+TYPING_STATS_EVENTS = ('received', 'broadcast', 'suppressed', 'echo_suppressed')
+# Без heartbeat дольше PRESENCE_TTL соединение считается оборванным: ключ
+# соединения воркера, упавшего без disconnect, просто истекает
+PRESENCE_TTL = 60
+HEARTBEAT_INTERVAL = 20
+# Сколько после закрытия последнего соединения пользователь еще в сети;
+# перезагрузка страницы укладывается в это время и не видна собеседникам
+OFFLINE_GRACE = 10
+ACTIVITY_PERSIST_INTERVAL = 60 * 5
+LOCK_TTL = 5
+LOCK_RETRY_DELAY = 0.05
+
+
+class PresenceLocked(Exception):
+    """Запись соединений пользователя сейчас меняет другое соединение"""
+
+
+@contextmanager
+def _locked(user_id):
+    """
+    Запись соединений пользователя меняется под коротким замком в кэше.
+
+    Замок не ждем: consumers вызывают эти функции через database_sync_to_async,
+    поток которого общий для всего процесса, и ожидание в нем остановило бы
+    запросы к базе всех соединений. Повторяет вызывающий из цикла событий
+    (chat.consumers.presence_call); замок упавшего процесса истекает через
+    LOCK_TTL.
+    """
+    key = LOCK_KEY.format(user_id=user_id)
+    if not cache.add(key, 1, LOCK_TTL):
+        raise PresenceLocked(user_id)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+def _live_channels(channels):
+    """Соединения, чьи ключи еще не истекли"""
+    keys = {CHANNEL_KEY.format(channel_name=name): name for name in channels}
+    return {keys[key] for key in cache.get_many(keys)}
+
+
+def connect(user_id, channel_name, room):
+    """
+    Регистрирует соединение пользователя в комнате room; True, если он
+    появился в сети. PresenceLocked - повторить позже.
+    """
+    cache.set(CHANNEL_KEY.format(channel_name=channel_name), user_id, PRESENCE_TTL)
+    key = CONNECTIONS_KEY.format(user_id=user_id)
+    with _locked(user_id):
+        # channels - открытые соединения и их комнаты, rooms - все комнаты,
+        # где пользователь появлялся, пока был в сети
+        record = cache.get(key) or {'channels': {}, 'rooms': set()}
+        record['channels'][channel_name] = room
+        record['rooms'].add(room)
+        cache.set(key, record, PRESENCE_TTL)
+    came_online = cache.add(ONLINE_KEY.format(user_id=user_id), 1, PRESENCE_TTL)
+    if not came_online:
+        cache.touch(ONLINE_KEY.format(user_id=user_id), PRESENCE_TTL)
+    record_activity(user_id)
+    return came_online
+
+
+def disconnect(user_id, channel_name):
+    """
+    Снимает соединение пользователя. Если живых соединений не осталось,
+    через OFFLINE_GRACE пользователь выйдет из сети; тогда возвращаются все
+    комнаты, которым нужно об этом сообщить, иначе - пустой список.
+    PresenceLocked - повторить позже.
+    """
+    cache.delete(CHANNEL_KEY.format(channel_name=channel_name))
+    key = CONNECTIONS_KEY.format(user_id=user_id)
+    with _locked(user_id):
+        record = cache.get(key) or {'channels': {}, 'rooms': set()}
+        record['channels'].pop(channel_name, None)
+        # Соединения упавших воркеров отбрасываются
+        live = _live_channels(record['channels'])
+        record['channels'] = {name: room for name, room in record['channels'].items() if name in live}
+        if record['channels']:
+            cache.set(key, record, PRESENCE_TTL)
+        else:
+            cache.delete(key)
+    record_activity(user_id)
+    if record['channels']:
+        return []
+    cache.touch(ONLINE_KEY.format(user_id=user_id), OFFLINE_GRACE)
+    return sorted(record['rooms'])
+
+
+def heartbeat(user_id, channel_name):
+    """Продлевает присутствие живого соединения пользователя"""
+    channel_key = CHANNEL_KEY.format(channel_name=channel_name)
+    if not cache.touch(channel_key, PRESENCE_TTL):
+        cache.set(channel_key, user_id, PRESENCE_TTL)
+    cache.touch(CONNECTIONS_KEY.format(user_id=user_id), PRESENCE_TTL)
+    key = ONLINE_KEY.format(user_id=user_id)
+    if not cache.touch(key, PRESENCE_TTL):
+        cache.add(key, 1, PRESENCE_TTL)
+    record_activity(user_id)
+
+
+def is_online(user_id):
+    return cache.get(ONLINE_KEY.format(user_id=user_id)) is not None
+
+
+def online_ids(user_ids):
+    """Кто из пользователей в сети - одним запросом к кэшу на всю страницу"""
+    keys = {ONLINE_KEY.format(user_id=user_id): user_id for user_id in user_ids}
+    return {keys[key] for key in cache.get_many(keys)}
+
+
+def should_announce(room, user_id, online):
+    """
+    Нужно ли рассылать в комнату смену статуса пользователя. Повтор уже
+    разосланного статуса (вторая вкладка, переподключение) подавляется.
+    """
+    key = ANNOUNCED_KEY.format(room=room, user_id=user_id)
+    if cache.get(key) == int(online):
+        return False
+    cache.set(key, int(online), PRESENCE_TTL)
+    return True
+
+
+def record_activity(user_id):
+    """Сохраняет last_activity в базу не чаще раза в ACTIVITY_PERSIST_INTERVAL"""
+    if cache.add(ACTIVITY_KEY.format(user_id=user_id), 1, ACTIVITY_PERSIST_INTERVAL):
+        User.objects.filter(id=user_id).update(last_activity=timezone.now())
+
+
+def claim_typing(room, user_id, refresh):
+    """
+    Можно ли разослать в комнату статус печати пользователя. Окно refresh
+    общее для всех его вкладок и воркеров: второе соединение того же
+    пользователя в той же комнате статус не повторяет.
+    """
+    return cache.add(TYPING_KEY.format(room=room, user_id=user_id), 1, refresh)
+
+
+def release_typing(room, user_id):
+    """Открывает окно после разосланного конца печати"""
+    cache.delete(TYPING_KEY.format(room=room, user_id=user_id))
+
+
+def record_typing(event):
+    key = TYPING_STATS_KEY.format(event=event)
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def typing_stats():
+    """Счетчики событий печати"""
+    keys = {event: TYPING_STATS_KEY.format(event=event) for event in TYPING_STATS_EVENTS}
+    values = cache.get_many(keys.values())
+    return {event: values.get(key, 0) for event, key in keys.items()}
@@ -0,0 +1,218 @@
+import base64
+import binascii
+import json
+import re
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.functions import Cast
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .membership import user_dialog_ids
+from .models import Message
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Границы совпадений в тексте до экранирования: символы из области для
+# частного использования не встречаются в обычной переписке
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_STOP = '\ue001'
+# Внешнее FTS5-содержимое для SQLite: сам текст остается в chat_message
+FTS_TABLE = 'chat_message_fts'
+FTS_TRIGGERS = ['chat_message_fts_insert', 'chat_message_fts_delete', 'chat_message_fts_update']
+
+
+class SearchError(ValueError):
+    """Некорректные параметры поиска по сообщениям"""
+
+
+def search_config():
+    return getattr(settings, 'CHAT_SEARCH_CONFIG', 'russian')
+
+
+def search_index():
+    """GIN-индекс по tsvector текста; выражение совпадает с фильтром поиска"""
+    config = search_config()
+    return GinIndex(SearchVector('content', config=config), name=f'message_search_{config}')
+
+
+def install_search_index(db_connection):
+    """
+    Создает индекс поиска, если его нет. DDL зависит от СУБД, поэтому он
+    выполняется после migrate, а не миграцией.
+    """
+    table = Message._meta.db_table
+    if table not in db_connection.introspection.table_names():
+        return
+    if db_connection.vendor == 'postgresql':
+        index = search_index()
+        with db_connection.cursor() as cursor:
+            constraints = db_connection.introspection.get_constraints(cursor, table)
+        if index.name not in constraints:
+            with db_connection.schema_editor() as editor:
+                editor.add_index(Message, index)
+    elif db_connection.vendor == 'sqlite':
+        with db_connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+                [FTS_TABLE, *FTS_TRIGGERS]
+            )
+            if len(cursor.fetchall()) == 1 + len(FTS_TRIGGERS):
+                return
+            # Пересоздание таблицы при миграции SQLite теряет триггеры,
+            # поэтому недостающие создаются заново с полной перестройкой
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"content, content='{table}', content_rowid='id', "
+                f"tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS chat_message_fts_insert AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS chat_message_fts_delete AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS chat_message_fts_update AFTER UPDATE OF content ON {table} BEGIN "
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, content) VALUES ('delete', old.id, old.content); "
+                f"INSERT INTO {FTS_TABLE}(rowid, content) VALUES (new.id, new.content); END"
+            )
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def parse_limit(value):
+    if not value:
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise SearchError('Invalid limit')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def encode_cursor(message):
+    """Курсор по позиции результата: (rank, id)"""
+    payload = json.dumps([message.rank, message.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        rank, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), int(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise SearchError('Invalid cursor')
+
+
+def highlight(text):
+    """Экранированный текст с совпадениями в <mark>"""
+    return mark_safe(
+        escape(text).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+    )
+
+
+class SearchPage:
+    """Страница результатов по убыванию релевантности; next_cursor - продолжение"""
+
+    def __init__(self, messages, has_more):
+        self.messages = messages
+        self.has_more = has_more
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(self.messages[-1]) if self.has_more else None
+
+
+def _search_postgres(query, dialog_ids, after, limit):
+    config = search_config()
+    search_query = SearchQuery(query, config=config, search_type='websearch')
+    # Ранг приводится к double precision, чтобы курсор сравнивал его точно
+    rows = Message.objects.filter(dialog_id__in=dialog_ids).annotate(
+        document=SearchVector('content', config=config),
+        rank=Cast(SearchRank(SearchVector('content', config=config), search_query), FloatField())
+    ).filter(document=search_query)
+    if after:
+        rank, pk = after
+        rows = rows.filter(Q(rank__lt=rank) | Q(rank=rank, id__lt=pk))
+    rows = list(rows.order_by('-rank', '-id').values_list('id', 'rank')[:limit])
+    # Фрагменты считаются только для страницы: ts_headline дорогой
+    headlines = dict(
+        Message.objects.filter(id__in=[pk for pk, _ in rows]).annotate(
+            headline=SearchHeadline(
+                'content', search_query, config=config,
+                start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP
+            )
+        ).values_list('id', 'headline')
+    )
+    return [(pk, rank, headlines.get(pk)) for pk, rank in rows]
+
+
+def _search_sqlite(terms, dialog_ids, after, limit):
+    # Каждое слово - префикс в кавычках, так что синтаксис FTS5 из запроса
+    # пользователя не исполняется
+    match = ' '.join(f'"{term}"*' for term in terms)
+    table = Message._meta.db_table
+    sql = (
+        f"SELECT id, score, headline FROM ("
+        f"SELECT m.id AS id, -bm25({FTS_TABLE}) AS score, "
+        f"snippet({FTS_TABLE}, 0, %s, %s, '…', 24) AS headline "
+        f"FROM {FTS_TABLE} JOIN {table} m ON m.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s AND m.dialog_id IN (SELECT value FROM json_each(%s))"
+        f")"
+    )
+    params = [HIGHLIGHT_START, HIGHLIGHT_STOP, match, json.dumps(dialog_ids)]
+    if after:
+        sql += " WHERE score < %s OR (score = %s AND id < %s)"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY score DESC, id DESC LIMIT %s"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit])
+        return cursor.fetchall()
+
+
+def _search_fallback(query, dialog_ids, after, limit):
+    # Без полнотекстового индекса: совпадения по подстроке, новые сначала
+    rows = Message.objects.filter(dialog_id__in=dialog_ids, content__icontains=query)
+    if after:
+        rows = rows.filter(id__lt=after[1])
+    return [(pk, 0.0, None) for pk in rows.order_by('-id').values_list('id', flat=True)[:limit]]
+
+
+def search_messages(user, query, cursor=None, limit=DEFAULT_LIMIT):
+    """
+    Поиск по сообщениям диалогов пользователя.
+
+    Поиск ограничен кэшированным списком диалогов пользователя и идет по
+    индексу: GIN по tsvector в PostgreSQL, FTS5 в SQLite. У сообщений
+    страницы заполнены rank и highlight (безопасный HTML фрагмента).
+    """
+    after = decode_cursor(cursor) if cursor else None
+    query = query.strip()
+    terms = re.findall(r'\w+', query)
+    dialog_ids = user_dialog_ids(user.id) if terms else []
+    if not dialog_ids:
+        return SearchPage([], False)
+
+    if connection.vendor == 'postgresql':
+        rows = _search_postgres(query, dialog_ids, after, limit + 1)
+    elif connection.vendor == 'sqlite':
+        rows = _search_sqlite(terms, dialog_ids, after, limit + 1)
+    else:
+        rows = _search_fallback(query, dialog_ids, after, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    found = Message.objects.select_related('dialog', 'sender').in_bulk([pk for pk, _, _ in rows])
+    messages = []
+    for pk, rank, headline in rows:
+        message = found.get(pk)
+        if message is None:
+            continue
+        message.rank = rank
+        message.highlight = highlight(headline if headline is not None else message.content)
+        messages.append(message)
+    return SearchPage(messages, has_more)
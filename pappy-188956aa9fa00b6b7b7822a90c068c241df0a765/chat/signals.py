@@ -0,0 +1,47 @@
+from django.db import connections
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+from .membership import invalidate_dialog_membership, invalidate_group_membership
+from .models import Dialog, DialogParticipant, GroupChatMember
+from .search import install_search_index
+
+@receiver(m2m_changed, sender=DialogParticipant)
+def handle_participants_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кэш членства при изменении участников диалога"""
+    if action == 'pre_clear':
+        # После очистки уже не узнать, кого она затронула
+        related = instance.dialogs if reverse else instance.participants
+        instance._cleared_membership = list(related.values_list('id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_membership', [])
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if reverse:
+        pairs = [(dialog_id, instance.pk) for dialog_id in pk_set]
+    else:
+        pairs = [(instance.pk, user_id) for user_id in pk_set]
+    invalidate_dialog_membership(pairs)
+
+@receiver(pre_delete, sender=Dialog)
+def remember_dialog_participants(sender, instance, **kwargs):
+    """Строки участников удаляются каскадом, без m2m_changed"""
+    instance._deleted_participants = list(instance.participants.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Dialog)
+def handle_dialog_delete(sender, instance, **kwargs):
+    invalidate_dialog_membership(
+        (instance.pk, user_id) for user_id in getattr(instance, '_deleted_participants', [])
+    )
+
+@receiver(post_save, sender=GroupChatMember)
+@receiver(post_delete, sender=GroupChatMember)
+def handle_group_member_change(sender, instance, **kwargs):
+    """Сбрасывает кэш членства в групповом чате"""
+    invalidate_group_membership(instance.chat_id, instance.user_id)
+
+@receiver(post_migrate)
+def handle_post_migrate(sender, using, **kwargs):
+    """Индекс поиска по сообщениям создается после migrate (и syncdb)"""
+    if sender.label == 'chat':
+        install_search_index(connections[using])
@@ -0,0 +1,124 @@
+import os
+import tempfile
+import tracemalloc
+import wave
+from unittest import mock
+import numpy as np
+from django.test import SimpleTestCase
+from chat.audio_analysis import AudioDecodeError, AudioReader, process_stream
+
+RATE = 16000
+
+
+def write_wav(path, samples, channels=1):
+    with wave.open(path, 'wb') as output:
+        output.setnchannels(channels)
+        output.setsampwidth(2)
+        output.setframerate(RATE)
+        output.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+
+
+def write_wav24(path, samples):
+    with wave.open(path, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(3)
+        output.setframerate(RATE)
+        pcm = (np.clip(samples, -1, 1) * (2 ** 23 - 1)).astype('<i4')
+        output.writeframes(pcm.view(np.uint8).reshape(-1, 4)[:, :3].tobytes())
+
+
+def fake_ffmpeg(samples):
+    """Вместо ffmpeg: пишет samples в WAV, путь к которому - последний аргумент"""
+    def run(command, **kwargs):
+        write_wav(command[-1], samples)
+    return mock.patch('chat.audio_analysis.subprocess.run', side_effect=run)
+
+
+def tone(seconds, amplitude=0.5):
+    return amplitude * np.sin(2 * np.pi * 440 * np.arange(int(seconds * RATE)) / RATE)
+
+
+class StreamingAnalysisTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source = os.path.join(directory.name, 'source.wav')
+        self.output = os.path.join(directory.name, 'output.wav')
+
+    def test_waveform_covers_tail_for_any_block_size(self):
+        """Test that samples past the last full bucket count and blocks don't change the result"""
+        samples = np.zeros(RATE * 2 + 37)
+        samples[-37:] = 0.8
+        write_wav(self.source, samples)
+
+        result = process_stream(self.source, self.output)
+        self.assertEqual(len(result['waveform']), 100)
+        self.assertEqual((result['waveform'][-1], max(result['waveform'][:-1])), (1.0, 0.0))
+        self.assertEqual(process_stream(self.source, self.output, block_size=1000), result)
+
+    def test_silence(self):
+        """Test that silent and empty clips are analysed without dividing by zero"""
+        write_wav(self.source, np.zeros(RATE))
+        result = process_stream(self.source, self.output)
+        self.assertEqual((set(result['waveform']), result['loudness']), ({0.0}, None))
+
+        write_wav(self.source, np.zeros(0))
+        self.assertEqual(process_stream(self.source, self.output)['waveform'], [])
+
+    def test_gain_and_compression(self):
+        """Test that stereo is mixed down, normalized and compressed above the threshold"""
+        samples = np.concatenate([tone(0.5, 0.001), tone(1, 0.25)])
+        write_wav(self.source, np.repeat(samples, 2), channels=2)
+
+        result = process_stream(self.source, self.output, block_size=4096)
+        with wave.open(self.output, 'rb') as output:
+            self.assertEqual((output.getnchannels(), output.getnframes()), (1, len(samples)))
+            processed = np.frombuffer(output.readframes(len(samples)), dtype='<i2') / 32767
+        # Пик 1.0 после нормализации сжимается до 0.3 + 0.7 * 0.6
+        self.assertAlmostEqual(np.abs(processed).max(), 0.72, places=3)
+        self.assertFalse(processed[:RATE // 2].any())
+        self.assertAlmostEqual(result['duration'], 1.5)
+        self.assertLess(result['loudness'], 0)
+
+    def test_memory_is_bounded(self):
+        """Test that a long voice note is processed without loading it whole"""
+        write_wav(self.source, tone(60))
+        tracemalloc.start()
+        try:
+            process_stream(self.source, self.output, block_size=4096)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # Сам сигнал в float32 занял бы почти 4 МБ
+        self.assertLess(peak, 512 * 1024)
+
+    def test_formats_outside_stdlib_wave(self):
+        """Test that 24-bit WAV and browser formats are decoded instead of failing"""
+        samples = tone(1)
+        write_wav24(self.source, samples)
+        # Без soundfile 24-битный WAV перекодирует ffmpeg
+        with fake_ffmpeg(samples):
+            result = process_stream(self.source, self.output)
+        self.assertEqual((len(result['waveform']), result['duration']), (100, 1.0))
+        self.assertAlmostEqual(result['peak'], 0.5, places=3)
+
+        webm = os.path.join(os.path.dirname(self.source), 'voice.webm')
+        with open(webm, 'wb') as source:
+            source.write(b'\x1aE\xdf\xa3' + bytes(64))
+        with mock.patch('tempfile.tempdir', os.path.dirname(self.source)), fake_ffmpeg(samples) as run:
+            self.assertEqual(process_stream(webm, self.output)['duration'], 1.0)
+        self.assertEqual(run.call_args.args[0][:1], ['ffmpeg'])
+        # Временный WAV удален
+        self.assertEqual(sorted(os.listdir(os.path.dirname(self.source))), ['output.wav', 'source.wav', 'voice.webm'])
+
+    def test_undecodable_file(self):
+        """Test that a file nothing can decode raises AudioDecodeError and leaves no temp files"""
+        with open(self.source, 'wb') as source:
+            source.write(b'not audio')
+        directory = os.path.dirname(self.source)
+        with mock.patch('tempfile.tempdir', directory), \
+                mock.patch('chat.audio_analysis.FFMPEG', 'ffmpeg-missing-binary'):
+            with self.assertRaises(AudioDecodeError):
+                with AudioReader(self.source):
+                    pass
+        self.assertEqual(os.listdir(directory), ['source.wav'])
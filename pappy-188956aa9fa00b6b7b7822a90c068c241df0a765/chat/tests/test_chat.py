@@ -2,7 +2,7 @@ from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from .models import Dialog, Message, MessageAttachment, LocationMessage, VoiceMessage, GroupChat
+from chat.models import Dialog, DialogParticipant, Message, MessageAttachment, LocationMessage, VoiceMessage, GroupChat, GroupChatMember
 from decimal import Decimal
 import json
 
@@ -23,10 +23,11 @@ class ChatTests(TestCase):
         # Create test group chat
         self.group_chat = GroupChat.objects.create(
             name='Test Group',
-            admin=self.user1,
             description='Test group chat'
         )
-        self.group_chat.participants.add(self.user1, self.user2, self.user3)
+        GroupChatMember.objects.create(chat=self.group_chat, user=self.user1, role='owner')
+        for user in (self.user2, self.user3):
+            GroupChatMember.objects.create(chat=self.group_chat, user=user)
         
         # Login as user1
         self.client.force_login(self.user1)
@@ -90,8 +91,8 @@ class ChatTests(TestCase):
         message_id = json.loads(response.content)['id']
         
         # Check message is unread
-        message = Message.objects.get(id=message_id)
-        self.assertFalse(message.is_read)
+        participant = DialogParticipant.objects.get(dialog=self.dialog, user=self.user1)
+        self.assertLess(participant.last_read_id, message_id)
         
         # Read message as user1
         self.client.force_login(self.user1)
@@ -99,8 +100,8 @@ class ChatTests(TestCase):
         self.assertEqual(response.status_code, 200)
         
         # Verify message is now read
-        message.refresh_from_db()
-        self.assertTrue(message.is_read)
+        participant.refresh_from_db()
+        self.assertGreaterEqual(participant.last_read_id, message_id)
 
     def test_group_chat_functionality(self):
         """Test group chat functionality"""
@@ -0,0 +1,281 @@
+import json
+from unittest import mock
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from channels.db import database_sync_to_async
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from login_auth.models import User
+from chat import consumers, presence
+from chat.inbox import mark_read
+from chat.models import Dialog, DialogParticipant, GroupChat, GroupChatMember, Message
+from chat.routing import websocket_urlpatterns
+
+application = URLRouter(websocket_urlpatterns)
+
+
+class WebsocketClient(ApplicationCommunicator):
+    """Клиент веб-сокета поверх asgiref (channels.testing требует daphne)"""
+
+    def __init__(self, path, user):
+        super().__init__(application, {
+            'type': 'websocket',
+            'path': path,
+            'headers': [],
+            'subprotocols': [],
+            'user': user,
+        })
+
+    async def connect(self):
+        await self.send_input({'type': 'websocket.connect'})
+        response = await self.receive_output()
+        return response['type'] == 'websocket.accept'
+
+    async def send_json_to(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json_from(self):
+        response = await self.receive_output()
+        return json.loads(response['text'])
+
+    async def disconnect(self):
+        await self.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await self.wait()
+
+
+# Проверка выхода из сети не должна переживать тест
+@mock.patch('chat.presence.OFFLINE_GRACE', 0)
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.seller = User.objects.create_user(
+            phone='+79997654321',
+            password='seller123',
+            is_seller=True
+        )
+        self.dialog = Dialog.objects.create()
+        self.dialog.participants.add(self.buyer, self.seller)
+
+    async def connect(self, user, path=None):
+        communicator = WebsocketClient(path or f'/ws/chat/{self.dialog.id}/', user)
+        self.assertTrue(await communicator.connect())
+        return communicator
+
+    async def receive_type(self, communicator, message_type):
+        """Следующее сообщение нужного типа (статусы пользователей пропускаются)"""
+        while True:
+            response = await communicator.receive_json_from()
+            if response['type'] == message_type:
+                return response
+
+    async def test_message_is_saved_broadcast_and_acked(self):
+        """Test that a websocket message is persisted, delivered and acknowledged"""
+        sender = await self.connect(self.buyer)
+        receiver = await self.connect(self.seller)
+
+        await sender.send_json_to({'type': 'message', 'content': ' Котенок еще доступен? ', 'client_id': 'c-1'})
+        ack = await self.receive_type(sender, 'ack')
+        delivered = await self.receive_type(receiver, 'new_message')
+
+        message = await Message.objects.aget()
+        self.assertEqual(ack['client_id'], 'c-1')
+        self.assertEqual(ack['message']['id'], message.id)
+        self.assertEqual(delivered['message'], ack['message'])
+        self.assertEqual(message.content, 'Котенок еще доступен?')
+        dialog = await Dialog.objects.aget(id=self.dialog.id)
+        self.assertEqual(dialog.last_message_id, message.id)
+
+        await sender.disconnect()
+        await receiver.disconnect()
+
+    async def test_retry_with_same_client_id_is_not_duplicated(self):
+        """Test that a retried message is acknowledged with the original id"""
+        sender = await self.connect(self.buyer)
+        await sender.send_json_to({'type': 'message', 'content': 'Привет', 'client_id': 'c-1'})
+        first = await self.receive_type(sender, 'ack')
+        await sender.send_json_to({'type': 'message', 'content': 'Привет', 'client_id': 'c-1'})
+        second = await self.receive_type(sender, 'ack')
+
+        self.assertEqual(first['message']['id'], second['message']['id'])
+        self.assertEqual(await Message.objects.acount(), 1)
+        # Повтор не рассылается участникам
+        self.assertTrue(await sender.receive_nothing())
+        await sender.disconnect()
+
+        # Тот же ключ в другом диалоге - другое сообщение
+        other = await Dialog.objects.acreate()
+        await other.participants.aadd(self.buyer, self.seller)
+        sender = await self.connect(self.buyer, f'/ws/chat/{other.id}/')
+        await sender.send_json_to({'type': 'message', 'content': 'Привет', 'client_id': 'c-1'})
+        third = await self.receive_type(sender, 'ack')
+        self.assertNotEqual(third['message']['id'], first['message']['id'])
+        self.assertEqual(await Message.objects.filter(dialog=other).acount(), 1)
+        await sender.disconnect()
+
+    async def test_invalid_messages_are_rejected(self):
+        """Test that empty and oversized messages are not saved"""
+        sender = await self.connect(self.buyer)
+        for content in ('   ', 'x' * 5000, None):
+            await sender.send_json_to({'type': 'message', 'content': content, 'client_id': 'c-1'})
+            error = await self.receive_type(sender, 'error')
+            self.assertEqual(error['client_id'], 'c-1')
+        self.assertEqual(await Message.objects.acount(), 0)
+        await sender.disconnect()
+
+    async def test_removed_participant_cannot_send(self):
+        """Test that access is rechecked for every message"""
+        sender = await self.connect(self.buyer)
+        await self.dialog.participants.aremove(self.buyer)
+        await sender.send_json_to({'type': 'message', 'content': 'Привет'})
+        await self.receive_type(sender, 'error')
+        self.assertEqual(await Message.objects.acount(), 0)
+        await sender.disconnect()
+
+    @mock.patch('chat.consumers.READ_FLUSH_DELAY', 0.05)
+    async def test_read_events_are_coalesced(self):
+        """Test that a burst of read events becomes one watermark write and one broadcast"""
+        messages = [
+            await Message.objects.acreate(dialog=self.dialog, sender=self.seller, content=f'Сообщение {i}')
+            for i in range(3)
+        ]
+        reader = await self.connect(self.buyer)
+        seller = await self.connect(self.seller)
+
+        with mock.patch('chat.consumers.mark_read', wraps=mark_read) as write:
+            for message in messages:
+                await reader.send_json_to({'type': 'read', 'message_id': message.id})
+            await reader.send_json_to({'type': 'read', 'message_ids': [messages[0].id]})
+            event = await self.receive_type(seller, 'messages_read')
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(event, {'type': 'messages_read', 'last_read_id': messages[-1].id, 'user_id': self.buyer.id})
+        participant = await DialogParticipant.objects.aget(dialog=self.dialog, user=self.buyer)
+        self.assertEqual((participant.last_read_id, participant.unread_count), (messages[-1].id, 0))
+        await reader.disconnect()
+        await seller.disconnect()
+
+    async def test_pending_read_is_written_on_disconnect(self):
+        """Test that closing the socket does not lose a debounced read"""
+        message = await Message.objects.acreate(dialog=self.dialog, sender=self.seller, content='Привет')
+        reader = await self.connect(self.buyer)
+        await reader.send_json_to({'type': 'read', 'message_id': message.id})
+        await reader.disconnect()
+        participant = await DialogParticipant.objects.aget(dialog=self.dialog, user=self.buyer)
+        self.assertEqual(participant.last_read_id, message.id)
+
+    async def test_presence_is_announced_once_per_state_change(self):
+        """Test that extra tabs do not flap the status and the last tab closing announces offline"""
+        seller = await self.connect(self.seller)
+        self.assertEqual(await seller.receive_json_from(), {'type': 'user_status', 'user': {'id': self.seller.id, 'is_online': True}})
+
+        first = await self.connect(self.buyer)
+        second = await self.connect(self.buyer)
+        self.assertEqual(await seller.receive_json_from(), {'type': 'user_status', 'user': {'id': self.buyer.id, 'is_online': True}})
+        self.assertTrue(await seller.receive_nothing())
+
+        await first.disconnect()
+        self.assertTrue(await seller.receive_nothing())
+        await second.disconnect()
+        self.assertEqual(await seller.receive_json_from(), {'type': 'user_status', 'user': {'id': self.buyer.id, 'is_online': False}})
+        await seller.disconnect()
+
+    async def test_offline_is_announced_in_every_room(self):
+        """Test that closing tabs of two dialogs announces offline in both"""
+        other = await Dialog.objects.acreate()
+        await other.participants.aadd(self.buyer, self.seller)
+        watchers = [
+            await self.connect(self.seller),
+            await self.connect(self.seller, f'/ws/chat/{other.id}/')
+        ]
+        tabs = [
+            await self.connect(self.buyer),
+            await self.connect(self.buyer, f'/ws/chat/{other.id}/')
+        ]
+        for tab in tabs:
+            await tab.disconnect()
+        for watcher in watchers:
+            status = await self.receive_type(watcher, 'user_status')
+            while status['user'] != {'id': self.buyer.id, 'is_online': False}:
+                status = await self.receive_type(watcher, 'user_status')
+            await watcher.disconnect()
+
+    async def test_typing_burst_is_throttled(self):
+        """Test that a burst of keystrokes reaches the room as one start and one stop, without echo"""
+        seller = await self.connect(self.seller)
+        typist = await self.connect(self.buyer)
+        await self.receive_type(typist, 'user_status')
+
+        for _ in range(20):
+            await typist.send_json_to({'type': 'typing', 'typing': True})
+        await typist.send_json_to({'type': 'typing', 'typing': False})
+        await typist.send_json_to({'type': 'typing', 'typing': False})
+
+        started = await self.receive_type(seller, 'typing')
+        stopped = await self.receive_type(seller, 'typing')
+        self.assertEqual(started, {'type': 'typing', 'user': {'id': self.buyer.id, 'typing': True}, 'expires_in': consumers.TYPING_TIMEOUT})
+        self.assertFalse(stopped['user']['typing'])
+        self.assertTrue(await seller.receive_nothing())
+        self.assertTrue(await typist.receive_nothing())
+
+        stats = await database_sync_to_async(presence.typing_stats)()
+        self.assertEqual(stats, {'received': 22, 'broadcast': 2, 'suppressed': 20, 'echo_suppressed': 2})
+        await typist.disconnect()
+        await seller.disconnect()
+
+    async def test_typing_is_throttled_across_tabs(self):
+        """Test that two tabs of one user typing in the same room send a single start"""
+        seller = await self.connect(self.seller)
+        first_tab = await self.connect(self.buyer)
+        second_tab = await self.connect(self.buyer)
+
+        await first_tab.send_json_to({'type': 'typing', 'typing': True})
+        await second_tab.send_json_to({'type': 'typing', 'typing': True})
+        self.assertTrue((await self.receive_type(seller, 'typing'))['user']['typing'])
+        await first_tab.send_json_to({'type': 'typing', 'typing': False})
+        self.assertFalse((await self.receive_type(seller, 'typing'))['user']['typing'])
+        self.assertTrue(await seller.receive_nothing())
+
+        # После разосланного конца печати окно снова открыто
+        await second_tab.send_json_to({'type': 'typing', 'typing': True})
+        self.assertTrue((await self.receive_type(seller, 'typing'))['user']['typing'])
+        await second_tab.disconnect()
+        self.assertFalse((await self.receive_type(seller, 'typing'))['user']['typing'])
+        await first_tab.disconnect()
+        await seller.disconnect()
+
+    @mock.patch('chat.consumers.TYPING_TIMEOUT', 0.05)
+    async def test_typing_expires_and_stops_on_message(self):
+        """Test that typing stops by itself after the timeout and when a message is sent"""
+        seller = await self.connect(self.seller)
+        typist = await self.connect(self.buyer)
+
+        await typist.send_json_to({'type': 'typing', 'typing': True})
+        self.assertTrue((await self.receive_type(seller, 'typing'))['user']['typing'])
+        self.assertFalse((await self.receive_type(seller, 'typing'))['user']['typing'])
+
+        await typist.send_json_to({'type': 'typing', 'typing': True})
+        await typist.send_json_to({'type': 'message', 'content': 'Привет'})
+        self.assertTrue((await self.receive_type(seller, 'typing'))['user']['typing'])
+        self.assertFalse((await self.receive_type(seller, 'typing'))['user']['typing'])
+        await self.receive_type(seller, 'new_message')
+        await typist.disconnect()
+        await seller.disconnect()
+
+    async def test_group_chat_message(self):
+        """Test that group chat messages are stored against the group chat"""
+        chat = await GroupChat.objects.acreate(name='Заводчики')
+        await GroupChatMember.objects.acreate(chat=chat, user=self.buyer, role='owner')
+        sender = await self.connect(self.buyer, f'/ws/group-chat/{chat.id}/')
+
+        await sender.send_json_to({'type': 'message', 'content': 'Всем привет'})
+        ack = await self.receive_type(sender, 'ack')
+        delivered = await self.receive_type(sender, 'new_message')
+
+        self.assertEqual(delivered['message'], ack['message'])
+        message = await Message.objects.aget(id=ack['message']['id'])
+        self.assertEqual(message.group_chat_id, chat.id)
+        self.assertIsNone(message.dialog_id)
+        await sender.disconnect()
@@ -0,0 +1,100 @@
+from datetime import timedelta
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from login_auth.models import User
+from chat.history import message_window
+from chat.models import Dialog, Message
+
+class MessageHistoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.seller = User.objects.create_user(
+            phone='+79997654321',
+            password='seller123',
+            is_seller=True
+        )
+        self.dialog = Dialog.objects.create()
+        self.dialog.participants.add(self.buyer, self.seller)
+        self.client.login(phone='+79991234567', password='testpass123')
+
+    def make_messages(self, count, dialog=None):
+        start = timezone.now() - timedelta(days=365)
+        # Пары сообщений с одинаковым временем проверяют порядок по id
+        return Message.objects.bulk_create([
+            Message(
+                dialog=dialog or self.dialog,
+                sender=self.seller if i % 2 else self.buyer,
+                content=f'Сообщение {i}',
+                created_at=start + timedelta(minutes=i // 2)
+            )
+            for i in range(count)
+        ])
+
+    def test_latest_window_and_older_pages(self):
+        """Test that paging back from the latest window visits every message once"""
+        self.make_messages(125)
+        messages = Message.objects.filter(dialog=self.dialog)
+
+        window = message_window(messages, limit=50)
+        self.assertEqual([m.content for m in window.messages[-2:]], ['Сообщение 123', 'Сообщение 124'])
+        seen = [m.id for m in window.messages]
+        while window.older_cursor:
+            window = message_window(messages, before=window.older_cursor, limit=50)
+            seen = [m.id for m in window.messages] + seen
+
+        expected = list(messages.order_by('created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_newer_messages_after_cursor(self):
+        """Test that the after cursor returns only messages newer than the window"""
+        self.make_messages(10)
+        window = message_window(Message.objects.filter(dialog=self.dialog), limit=5)
+        self.assertIsNotNone(window.older_cursor)
+
+        newer = self.make_messages(3)
+        Message.objects.filter(id__in=[m.id for m in newer]).update(created_at=timezone.now())
+        window = message_window(Message.objects.filter(dialog=self.dialog), after=window.newer_cursor)
+        self.assertEqual([m.id for m in window.messages], [m.id for m in newer])
+        self.assertFalse(window.has_newer)
+
+    def test_api_cost_does_not_depend_on_history_length(self):
+        """Test that the history API issues the same queries for short and long dialogs"""
+        short = Dialog.objects.create()
+        short.participants.add(self.buyer, self.seller)
+        self.make_messages(5, dialog=short)
+        self.make_messages(400)
+
+        for dialog in (short, self.dialog):
+            url = reverse('chat:dialog_messages', args=[dialog.id])
+            self.client.get(url)
+            # Сессия, пользователь, окно сообщений с отправителями
+            with self.assertNumQueries(3):
+                response = self.client.get(url, {'limit': 20})
+            page = response.json()
+            self.assertEqual(len(page['messages']), min(20, dialog.messages.count()))
+
+        response = self.client.get(url, {'before': page['older_cursor'], 'limit': 20})
+        self.assertEqual(response.json()['messages'][-1]['id'], page['messages'][0]['id'] - 1)
+
+    def test_api_rejects_bad_requests(self):
+        """Test that strangers and malformed cursors are rejected"""
+        url = reverse('chat:dialog_messages', args=[self.dialog.id])
+        self.assertEqual(self.client.get(url, {'before': 'garbage'}).status_code, 400)
+
+        stranger = User.objects.create_user(phone='+79990000000', password='stranger123')
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+    def test_dialog_page_renders_latest_window(self):
+        """Test that opening a long dialog renders only the latest messages"""
+        self.make_messages(300)
+        response = self.client.get(reverse('chat:dialog_detail', args=[self.dialog.id]))
+        self.assertEqual(len(response.context['messages']), 50)
+        self.assertIsNotNone(response.context['older_cursor'])
+        self.assertEqual(response.context['messages'][-1].content, 'Сообщение 299')
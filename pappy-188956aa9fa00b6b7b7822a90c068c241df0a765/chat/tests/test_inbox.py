@@ -0,0 +1,107 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from chat.inbox import inbox, mark_read
+from chat.models import Dialog, DialogParticipant, Message
+
+class InboxTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.sellers = [
+            User.objects.create_user(phone=f'+7999765432{i}', password='seller123', is_seller=True)
+            for i in range(3)
+        ]
+        self.dialogs = []
+        for seller in self.sellers:
+            dialog = Dialog.objects.create()
+            dialog.participants.add(self.buyer, seller)
+            self.dialogs.append(dialog)
+        self.client.login(phone='+79991234567', password='testpass123')
+
+    def unread(self, dialog, user):
+        return DialogParticipant.objects.get(dialog=dialog, user=user).unread_count
+
+    def test_message_updates_counters(self):
+        """Test that a new message updates the last message and the other side's unread count"""
+        dialog, seller = self.dialogs[0], self.sellers[0]
+        Message.objects.create(dialog=dialog, sender=seller, content='Здравствуйте')
+        message = Message.objects.create(dialog=dialog, sender=seller, content='Котенок доступен')
+
+        dialog.refresh_from_db()
+        self.assertEqual(dialog.last_message, message)
+        self.assertEqual(dialog.last_message_at, message.created_at)
+        self.assertEqual(self.unread(dialog, self.buyer), 2)
+        self.assertEqual(self.unread(dialog, seller), 0)
+
+    def watermark(self, dialog, user):
+        return DialogParticipant.objects.get(dialog=dialog, user=user).last_read_id
+
+    def test_read_watermark(self):
+        """Test that reading moves the watermark forward and recounts unread messages above it"""
+        dialog, seller = self.dialogs[0], self.sellers[0]
+        messages = [
+            Message.objects.create(dialog=dialog, sender=seller, content=f'Сообщение {i}')
+            for i in range(3)
+        ]
+        self.assertEqual(self.watermark(dialog, seller), messages[-1].id)
+        self.assertEqual(mark_read(dialog.id, self.buyer.id, messages[0].id), messages[0].id)
+        self.assertEqual(self.unread(dialog, self.buyer), 2)
+        # Отметка не движется назад и не уходит дальше последнего сообщения
+        self.assertIsNone(mark_read(dialog.id, self.buyer.id, messages[0].id))
+        self.assertEqual(mark_read(dialog.id, self.buyer.id, messages[-1].id + 100), messages[-1].id)
+        self.assertEqual(self.unread(dialog, self.buyer), 0)
+
+        # Сообщение пришло между чтением last_message_id и UPDATE
+        stale = Message.objects.create(dialog=dialog, sender=seller, content='Еще одно')
+        Message.objects.create(dialog=dialog, sender=seller, content='И последнее')
+        with mock.patch('chat.inbox.Dialog.objects') as dialogs:
+            dialogs.filter.return_value.values_list.return_value.first.return_value = stale.id
+            self.assertEqual(mark_read(dialog.id, self.buyer.id), stale.id)
+        self.assertEqual(self.unread(dialog, self.buyer), 1)
+
+    def test_opening_dialog_reads_it(self):
+        """Test that the dialog page reads everything and shows what the other side has read"""
+        dialog, seller = self.dialogs[0], self.sellers[0]
+        own = Message.objects.create(dialog=dialog, sender=self.buyer, content='Котенок доступен?')
+        Message.objects.create(dialog=dialog, sender=seller, content='Да')
+        Message.objects.create(dialog=dialog, sender=seller, content='Приезжайте')
+
+        response = self.client.get(reverse('chat:dialog_detail', args=[dialog.id]))
+        self.assertEqual(response.context['opponent_last_read'], self.watermark(dialog, seller))
+        self.assertGreater(response.context['opponent_last_read'], own.id)
+        self.assertEqual(self.unread(dialog, self.buyer), 0)
+        self.assertEqual(self.watermark(dialog, self.buyer), dialog.messages.last().id)
+
+    def test_inbox_is_ordered_by_last_message(self):
+        """Test that the inbox lists dialogs by their latest message with counters"""
+        Message.objects.create(dialog=self.dialogs[1], sender=self.sellers[1], content='Первое')
+        Message.objects.create(dialog=self.dialogs[0], sender=self.buyer, content='Второе')
+
+        dialogs = inbox(self.buyer)
+        self.assertEqual([d.id for d in dialogs], [self.dialogs[0].id, self.dialogs[1].id, self.dialogs[2].id])
+        self.assertEqual([d.unread_count for d in dialogs], [0, 1, 0])
+        self.assertEqual(dialogs[0].opponent, self.sellers[0])
+
+    def test_inbox_queries_do_not_grow_with_dialogs(self):
+        """Test that the inbox page costs the same for few and many dialogs"""
+        url = reverse('chat:dialogs_list')
+        self.client.get(url)
+        # Сессия, пользователь, участники, собеседники, счетчик уведомлений
+        with self.assertNumQueries(5):
+            self.client.get(url)
+
+        for i in range(10):
+            seller = User.objects.create_user(phone=f'+7999000000{i}', password='seller123')
+            dialog = Dialog.objects.create()
+            dialog.participants.add(self.buyer, seller)
+            Message.objects.create(dialog=dialog, sender=seller, content='Привет')
+        with self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['dialogs']), 13)
+        self.assertEqual(response.context['unread_count'], 10)
@@ -0,0 +1,109 @@
+import json
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from login_auth.models import User
+from chat.membership import is_dialog_participant, is_group_member
+from chat.models import Dialog, GroupChat, GroupChatMember, Message
+from chat.views import (
+    DialogDetailView, SendLocationView, SendMessageView, SendVoiceMessageView, get_new_messages
+)
+
+class MembershipTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.seller = User.objects.create_user(
+            phone='+79997654321',
+            password='seller123',
+            is_seller=True
+        )
+        self.stranger = User.objects.create_user(
+            phone='+79990000000',
+            password='stranger123'
+        )
+        self.dialog = Dialog.objects.create()
+        self.dialog.participants.add(self.buyer, self.seller)
+
+    def test_answers_are_cached(self):
+        """Test that positive and negative answers cost one query and then none"""
+        with self.assertNumQueries(2):
+            self.assertTrue(is_dialog_participant(self.buyer.id, self.dialog.id))
+            self.assertFalse(is_dialog_participant(self.stranger.id, self.dialog.id))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_dialog_participant(self.buyer.id, self.dialog.id))
+            self.assertFalse(is_dialog_participant(self.stranger.id, self.dialog.id))
+            self.assertFalse(is_dialog_participant(None, self.dialog.id))
+
+    def test_participant_changes_invalidate_cache(self):
+        """Test that adding, removing and clearing participants reset cached answers"""
+        self.assertFalse(is_dialog_participant(self.stranger.id, self.dialog.id))
+        self.dialog.participants.add(self.stranger)
+        self.assertTrue(is_dialog_participant(self.stranger.id, self.dialog.id))
+
+        self.stranger.dialogs.remove(self.dialog)
+        self.assertFalse(is_dialog_participant(self.stranger.id, self.dialog.id))
+
+        self.assertTrue(is_dialog_participant(self.seller.id, self.dialog.id))
+        self.dialog.participants.clear()
+        self.assertFalse(is_dialog_participant(self.seller.id, self.dialog.id))
+
+    def test_dialog_delete_invalidates_cache(self):
+        """Test that participants lose access when the dialog is deleted"""
+        dialog_id = self.dialog.id
+        self.assertTrue(is_dialog_participant(self.buyer.id, dialog_id))
+        self.dialog.delete()
+        self.assertFalse(is_dialog_participant(self.buyer.id, dialog_id))
+
+    def test_group_membership(self):
+        """Test that group access is one lookup and follows member changes"""
+        chat = GroupChat.objects.create(name='Заводчики')
+        GroupChatMember.objects.bulk_create([
+            GroupChatMember(chat=chat, user=User.objects.create_user(phone=f'+7998000{i:04d}'))
+            for i in range(50)
+        ])
+        with self.assertNumQueries(1):
+            self.assertFalse(is_group_member(self.buyer.id, chat.id))
+
+        member = GroupChatMember.objects.create(chat=chat, user=self.buyer, role='owner')
+        with self.assertNumQueries(1):
+            self.assertTrue(is_group_member(self.buyer.id, chat.id))
+            self.assertTrue(is_group_member(self.buyer.id, chat.id))
+
+        member.delete()
+        self.assertFalse(is_group_member(self.buyer.id, chat.id))
+
+    def test_polling_view_checks_membership(self):
+        """Test that message polling checks access with the cached lookup only"""
+        request = RequestFactory().get('/')
+        request.user = self.stranger
+        self.assertEqual(get_new_messages(request, self.dialog.id).status_code, 403)
+
+        request.user = self.buyer
+        Message.objects.create(dialog=self.dialog, sender=self.seller, content='Здравствуйте')
+        is_dialog_participant(self.buyer.id, self.dialog.id)
+        # Только выборка сообщений, отметка прочтения и счетчик непрочитанных
+        with self.assertNumQueries(3):
+            response = get_new_messages(request, self.dialog.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['messages']), 1)
+
+    def test_dialog_class_views_check_membership(self):
+        """Test that the routed dialog views load by id and reject non-participants from the cache"""
+        factory = RequestFactory()
+        is_dialog_participant(self.stranger.id, self.dialog.id)
+        for view in (DialogDetailView, SendMessageView, SendLocationView, SendVoiceMessageView):
+            method = 'get' if view is DialogDetailView else 'post'
+            request = getattr(factory, method)('/')
+            request.user = self.stranger
+            with self.subTest(view=view.__name__), self.assertNumQueries(0):
+                with self.assertRaises(Http404):
+                    view.as_view()(request, dialog_id=self.dialog.id)
+
+        request = factory.get('/')
+        request.user = self.buyer
+        response = DialogDetailView.as_view()(request, dialog_id=self.dialog.id)
+        self.assertEqual(response.context_data['dialog'], self.dialog)
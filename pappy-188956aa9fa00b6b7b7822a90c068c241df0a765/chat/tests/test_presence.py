@@ -0,0 +1,103 @@
+import asyncio
+import time
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from chat import presence
+from chat.consumers import presence_call
+from chat.models import Dialog
+
+class PresenceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+
+    def test_connections_are_tracked_per_channel(self):
+        """Test that the user stays online until the last connection closes and every room is reported"""
+        self.assertTrue(presence.connect(self.user.id, 'channel-a', 'chat_1'))
+        self.assertFalse(presence.connect(self.user.id, 'channel-b', 'chat_2'))
+        self.assertEqual(presence.disconnect(self.user.id, 'channel-b'), [])
+        self.assertTrue(presence.is_online(self.user.id))
+        self.assertEqual(presence.disconnect(self.user.id, 'channel-a'), ['chat_1', 'chat_2'])
+        # До истечения OFFLINE_GRACE пользователь еще в сети
+        self.assertTrue(presence.is_online(self.user.id))
+        self.assertFalse(presence.connect(self.user.id, 'channel-c', 'chat_1'))
+
+    @mock.patch('chat.presence.OFFLINE_GRACE', 0)
+    def test_last_disconnect_goes_offline(self):
+        """Test that the user is offline once the grace period after the last connection ends"""
+        presence.connect(self.user.id, 'channel-a', 'chat_1')
+        presence.disconnect(self.user.id, 'channel-a')
+        self.assertFalse(presence.is_online(self.user.id))
+        # Повторный disconnect ничего не ломает
+        presence.disconnect(self.user.id, 'channel-a')
+        self.assertTrue(presence.connect(self.user.id, 'channel-a', 'chat_1'))
+
+    @mock.patch('chat.presence.OFFLINE_GRACE', 0)
+    def test_dead_connections_expire(self):
+        """Test that a connection of a crashed worker does not keep the user online"""
+        presence.connect(self.user.id, 'dead', 'chat_1')
+        presence.connect(self.user.id, 'live', 'chat_2')
+        for _ in range(3):
+            presence.heartbeat(self.user.id, 'live')
+        # Ключ соединения упавшего воркера истек без disconnect
+        cache.delete(presence.CHANNEL_KEY.format(channel_name='dead'))
+        self.assertEqual(presence.disconnect(self.user.id, 'live'), ['chat_1', 'chat_2'])
+        self.assertFalse(presence.is_online(self.user.id))
+
+    def test_held_lock_is_retried_outside_the_orm_thread(self):
+        """Test that a busy lock fails fast and the consumer retries it from the event loop"""
+        lock = presence.LOCK_KEY.format(user_id=self.user.id)
+        cache.add(lock, 1, presence.LOCK_TTL)
+        started = time.monotonic()
+        with self.assertRaises(presence.PresenceLocked):
+            presence.connect(self.user.id, 'channel-a', 'chat_1')
+        self.assertLess(time.monotonic() - started, 0.5)
+
+        async def connect_while_locked():
+            asyncio.get_running_loop().call_later(0.2, cache.delete, lock)
+            return await presence_call(presence.connect, self.user.id, 'channel-a', 'chat_1')
+
+        self.assertTrue(async_to_sync(connect_while_locked)())
+        self.assertEqual(presence.disconnect(self.user.id, 'channel-a'), ['chat_1'])
+
+    def test_online_ids_and_announcements(self):
+        """Test the bulk online query and that a repeated status is not announced twice"""
+        others = [
+            User.objects.create_user(phone=f'+7999000000{i}', password='x') for i in range(3)
+        ]
+        presence.connect(self.user.id, 'channel-a', 'chat_1')
+        presence.connect(others[1].id, 'channel-b', 'chat_1')
+        self.assertEqual(presence.online_ids([self.user.id] + [u.id for u in others]), {self.user.id, others[1].id})
+
+        self.assertTrue(presence.should_announce('chat_1', self.user.id, True))
+        self.assertFalse(presence.should_announce('chat_1', self.user.id, True))
+        self.assertTrue(presence.should_announce('chat_2', self.user.id, True))
+        self.assertTrue(presence.should_announce('chat_1', self.user.id, False))
+
+    def test_activity_writes_are_throttled(self):
+        """Test that reconnects and heartbeats persist last_activity at most once per interval"""
+        with self.assertNumQueries(1):
+            presence.connect(self.user.id, 'channel-a', 'chat_1')
+            presence.heartbeat(self.user.id, 'channel-a')
+            presence.disconnect(self.user.id, 'channel-a')
+            presence.connect(self.user.id, 'channel-a', 'chat_1')
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_activity)
+
+    def test_inbox_shows_presence(self):
+        """Test that the inbox marks online opponents without extra queries per dialog"""
+        seller = User.objects.create_user(phone='+79997654321', password='seller123')
+        dialog = Dialog.objects.create()
+        dialog.participants.add(self.user, seller)
+        presence.connect(seller.id, 'channel-a', f'chat_{dialog.id}')
+
+        self.client.login(phone='+79991234567', password='testpass123')
+        response = self.client.get(reverse('chat:dialogs_list'))
+        self.assertTrue(response.context['dialogs'][0].opponent.is_online)
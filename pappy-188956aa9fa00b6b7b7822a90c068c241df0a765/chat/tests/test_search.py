@@ -0,0 +1,104 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from login_auth.models import User
+from chat.models import Dialog, Message
+from chat.search import FTS_TABLE, search_index, search_messages
+
+class MessageSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.seller = User.objects.create_user(
+            phone='+79997654321',
+            password='seller123',
+            is_seller=True
+        )
+        self.dialog = Dialog.objects.create()
+        self.dialog.participants.add(self.buyer, self.seller)
+
+    def send(self, content, dialog=None, sender=None):
+        return Message.objects.create(dialog=dialog or self.dialog, sender=sender or self.seller, content=content)
+
+    def test_search_is_scoped_to_own_dialogs(self):
+        """Test that messages from dialogs the user is not in are not found"""
+        own = self.send('Котенок мейн-кун ищет дом')
+        stranger = User.objects.create_user(phone='+79990000000', password='x')
+        other = Dialog.objects.create()
+        other.participants.add(self.seller, stranger)
+        self.send('Котенок британец', dialog=other)
+
+        page = search_messages(self.buyer, 'котенок')
+        self.assertEqual([m.id for m in page.messages], [own.id])
+        self.assertIn('<mark>', page.messages[0].highlight)
+
+        # Новый диалог сразу попадает в поиск: список диалогов сбрасывается сигналом
+        other.participants.add(self.buyer)
+        self.assertEqual(len(search_messages(self.buyer, 'котенок').messages), 2)
+
+    def test_highlight_is_escaped(self):
+        """Test that markup in the message text never reaches the highlight unescaped"""
+        self.send('<script>alert(1)</script> щенок')
+        highlight = search_messages(self.buyer, 'щенок').messages[0].highlight
+        # ts_headline вырезает теги, FTS5 оставляет - тогда они экранируются
+        self.assertNotIn('<script>', highlight)
+        self.assertIn('<mark>щенок</mark>', highlight)
+
+    def test_index_is_installed(self):
+        """Test that the search index exists after migrate"""
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, Message._meta.db_table)
+            self.assertIn(search_index().name, constraints)
+        else:
+            self.assertIn(FTS_TABLE, connection.introspection.table_names())
+
+    def test_results_are_ranked_and_paged_by_cursor(self):
+        """Test that pages follow relevance and together visit every match once"""
+        for i in range(7):
+            self.send(f'Попугай номер {i}')
+        best = self.send('Попугай попугай попугай')
+        self.send('Про хомяка')
+
+        seen = []
+        cursor = None
+        while True:
+            page = search_messages(self.buyer, 'попугай', cursor=cursor, limit=3)
+            seen.extend(page.messages)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen[0].id, best.id)
+        self.assertEqual(len({m.id for m in seen}), 8)
+        ranks = [m.rank for m in seen]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+
+    def test_edited_and_deleted_messages(self):
+        """Test that the index follows edits and deletions"""
+        message = self.send('Продам аквариум')
+        message.content = 'Продам террариум'
+        message.save()
+        self.assertEqual(search_messages(self.buyer, 'аквариум').messages, [])
+        self.assertEqual(len(search_messages(self.buyer, 'террариум').messages), 1)
+        message.delete()
+        self.assertEqual(search_messages(self.buyer, 'террариум').messages, [])
+
+    def test_search_view(self):
+        """Test the search page, its next link and a broken cursor"""
+        for i in range(3):
+            self.send(f'Корм для кошек {i}')
+        self.client.login(phone='+79991234567', password='testpass123')
+        url = reverse('chat:message_search')
+
+        response = self.client.get(url, {'q': 'корм', 'limit': 2})
+        self.assertEqual(len(response.context['messages']), 2)
+        self.assertContains(response, '<mark>')
+        response = self.client.get(url, {'q': 'корм', 'limit': 2, 'cursor': response.context['next_cursor']})
+        self.assertEqual(len(response.context['messages']), 1)
+        self.assertIsNone(response.context['next_cursor'])
+
+        self.assertEqual(self.client.get(url, {'q': 'корм', 'cursor': 'broken'}).status_code, 400)
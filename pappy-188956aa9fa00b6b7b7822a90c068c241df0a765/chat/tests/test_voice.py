@@ -0,0 +1,159 @@
+import io
+import math
+import os
+import shutil
+import tempfile
+import wave
+from array import array
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from login_auth.models import User
+from chat.audio import LocalTranscriber, TranscriptionError
+from chat.models import Dialog, VoiceMessage
+from chat.voice import claim, process_pending_voice
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_wav(seconds=1, rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as output:
+        output.setnchannels(1)
+        output.setsampwidth(2)
+        output.setframerate(rate)
+        # Тон 440 Гц, тихий первые полсекунды
+        output.writeframes(array('h', (
+            int((300 if i < rate // 2 else 12000) * math.sin(2 * math.pi * 440 * i / rate))
+            for i in range(int(seconds * rate))
+        )).tobytes())
+    return buffer.getvalue()
+
+
+class CopyProcessor:
+    """Обработчик для тестов: копирует файл, а заданные данные не декодирует"""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = fail_on
+
+    def process_audio(self, source_path, output_path):
+        with open(source_path, 'rb') as source:
+            data = source.read()
+        if data in self.fail_on:
+            raise ValueError('Не удалось декодировать')
+        with open(output_path, 'wb') as output:
+            output.write(data)
+        return {'waveform': [0.0, 1.0], 'duration': 2.4}
+
+
+class FailingTranscriber:
+    def transcribe(self, path):
+        raise TranscriptionError('Сервис недоступен')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CHAT_TRANSCRIPTION_BACKEND='chat.audio.LocalTranscriber')
+class VoicePipelineTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.buyer = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.seller = User.objects.create_user(
+            phone='+79997654321',
+            password='seller123',
+            is_seller=True
+        )
+        self.dialog = Dialog.objects.create()
+        self.dialog.participants.add(self.buyer, self.seller)
+
+    def make_voice(self, data=None):
+        voice = VoiceMessage(dialog=self.dialog, sender=self.buyer, duration=1)
+        voice.audio_file.save('voice.wav', ContentFile(data or make_wav()), save=False)
+        voice.save()
+        return voice
+
+    def test_send_returns_before_processing(self):
+        """Test that the send endpoint only queues the voice message"""
+        self.client.login(phone='+79991234567', password='testpass123')
+        response = self.client.post(reverse('chat:send_voice', args=[self.dialog.id]), {
+            'audio': SimpleUploadedFile('voice.wav', make_wav(), content_type='audio/wav'),
+            'duration': '1'
+        })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], VoiceMessage.STATUS_PENDING)
+        self.assertEqual(VoiceMessage.objects.get().status, VoiceMessage.STATUS_PENDING)
+
+    def test_pending_messages_are_processed(self):
+        """Test that each job gets its own temp files, results are stored and the chat is notified"""
+        voices = [self.make_voice() for _ in range(3)]
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'chat_{self.dialog.id}', channel)
+
+        paths = []
+        real_mkstemp = tempfile.mkstemp
+
+        def mkstemp(**kwargs):
+            fd, path = real_mkstemp(**kwargs)
+            paths.append(path)
+            return fd, path
+
+        with mock.patch('chat.voice.tempfile.mkstemp', side_effect=mkstemp):
+            report = process_pending_voice(workers=2)
+
+        self.assertEqual(report.processed, 3)
+        self.assertEqual(len(set(paths)), 6)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        for voice in voices:
+            voice.refresh_from_db()
+            self.assertEqual(voice.status, VoiceMessage.STATUS_READY)
+            self.assertEqual((voice.duration, len(voice.waveform), max(voice.waveform)), (1, 100, 1.0))
+            # Тихое начало срезано шумоподавлением
+            self.assertEqual(voice.waveform[0], 0.0)
+            self.assertTrue(voice.processed_file.storage.exists(voice.processed_file.name))
+
+        events = [async_to_sync(channel_layer.receive)(channel) for _ in voices]
+        self.assertEqual({event['voice']['id'] for event in events}, {voice.id for voice in voices})
+        self.assertEqual(events[0]['type'], 'voice_processed')
+        self.assertEqual(events[0]['voice']['status'], VoiceMessage.STATUS_READY)
+
+    def test_failures_are_isolated(self):
+        """Test that a broken file fails alone and transcription errors keep the audio"""
+        broken = self.make_voice(b'not audio')
+        voice = self.make_voice()
+
+        report = process_pending_voice(processor=CopyProcessor(fail_on=[b'not audio']), transcriber=FailingTranscriber())
+        self.assertEqual((report.processed, [pk for pk, _ in report.errors]), (1, [broken.id]))
+
+        broken.refresh_from_db()
+        voice.refresh_from_db()
+        self.assertEqual(broken.status, VoiceMessage.STATUS_FAILED)
+        self.assertIn('декодировать', broken.error)
+        self.assertEqual(voice.status, VoiceMessage.STATUS_READY)
+        self.assertEqual((voice.transcript, voice.error), ('', 'Сервис недоступен'))
+
+    def test_stale_claims_are_retried(self):
+        """Test that a job abandoned by a crashed worker is picked up again"""
+        stale, busy = self.make_voice(), self.make_voice()
+        VoiceMessage.objects.filter(pk=stale.pk).update(
+            status=VoiceMessage.STATUS_PROCESSING, claimed_at=timezone.now() - timedelta(hours=1)
+        )
+        VoiceMessage.objects.filter(pk=busy.pk).update(
+            status=VoiceMessage.STATUS_PROCESSING, claimed_at=timezone.now()
+        )
+        self.assertEqual([voice.id for voice in claim()], [stale.id])
+        self.assertEqual(claim(), [])
+        self.assertIsInstance(LocalTranscriber().transcribe('voice.wav'), str)
@@ -15,6 +15,9 @@ urlpatterns = [
     path('<int:dialog_id>/send-location/', views.SendLocationView.as_view(), name='send_location'),
     path('<int:dialog_id>/send-voice/', views.SendVoiceMessageView.as_view(), name='send_voice'),
     
+    # История сообщений по курсору
+    path('<int:dialog_id>/messages/', views.dialog_messages, name='dialog_messages'),
+    
     # Поиск по сообщениям
     path('search/', views.MessageSearchView.as_view(), name='message_search'),
     
@@ -1,9 +1,13 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponseForbidden
-from django.db.models import Q, Max, Prefetch
-from django.utils import timezone
+from django.core.exceptions import BadRequest
+from django.http import Http404, JsonResponse, HttpResponseForbidden
+from django.db.models import Prefetch
+from . import history, presence, search
+from .inbox import inbox, mark_read, read_by_others
+from .membership import is_dialog_participant, is_group_member
 from .models import Dialog, Message, MessageAttachment, LocationMessage, VoiceMessage, GroupChat
+from .voice import serialize_voice
 from catalog.models import Product
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView, View
@@ -11,13 +15,12 @@ from django.views.generic import ListView, DetailView, View
 @login_required
 def dialogs_list(request):
     """Список диалогов пользователя"""
-    dialogs = Dialog.objects.filter(participants=request.user)\
-        .select_related('product')\
-        .prefetch_related('participants')\
-        .annotate(last_message_time=Max('messages__created'))\
-        .order_by('-last_message_time')
+    dialogs = inbox(request.user)
     
-    return render(request, 'chat/dialogs_list.html', {'dialogs': dialogs})
+    return render(request, 'chat/dialogs_list.html', {
+        'dialogs': dialogs,
+        'unread_count': sum(dialog.unread_count for dialog in dialogs)
+    })
 
 @login_required
 def dialog_detail(request, dialog_id):
@@ -25,20 +28,20 @@ def dialog_detail(request, dialog_id):
     dialog = get_object_or_404(Dialog, id=dialog_id)
     
     # Проверяем права доступа
-    if request.user not in dialog.participants.all():
+    if not is_dialog_participant(request.user.id, dialog.id):
         return HttpResponseForbidden('У вас нет доступа к этому диалогу')
     
-    # Отмечаем сообщения как прочитанные
-    Message.objects.filter(dialog=dialog)\
-        .exclude(sender=request.user)\
-        .filter(is_read=False)\
-        .update(is_read=True)
+    # Сдвигаем отметку прочтения до последнего сообщения
+    mark_read(dialog.id, request.user.id)
     
-    messages = dialog.messages.select_related('sender').all()
+    # Только последние сообщения; более ранние подгружаются по курсору
+    window = history.message_window(dialog.messages.select_related('sender'))
     
     return render(request, 'chat/dialog_detail.html', {
         'dialog': dialog,
-        'messages': messages
+        'messages': window.messages,
+        'older_cursor': window.older_cursor,
+        'opponent_last_read': read_by_others(dialog.id, request.user.id)
     })
 
 @login_required
@@ -50,7 +53,7 @@ def send_message(request, dialog_id):
     dialog = get_object_or_404(Dialog, id=dialog_id)
     
     # Проверяем права доступа
-    if request.user not in dialog.participants.all():
+    if not is_dialog_participant(request.user.id, dialog.id):
         return HttpResponseForbidden('У вас нет доступа к этому диалогу')
     
     text = request.POST.get('text', '').strip()
@@ -58,20 +61,17 @@ def send_message(request, dialog_id):
     if not text:
         return JsonResponse({'error': 'Текст сообщения не может быть пустым'}, status=400)
     
+    # Последнее сообщение и счетчики диалога обновляет Message.save
     message = Message.objects.create(
         dialog=dialog,
         sender=request.user,
-        text=text
+        content=text
     )
     
-    # Обновляем время последнего сообщения в диалоге
-    dialog.updated = timezone.now()
-    dialog.save()
-    
     return JsonResponse({
         'id': message.id,
-        'text': message.text,
-        'created': message.created.strftime('%Y-%m-%d %H:%M:%S'),
+        'text': message.content,
+        'created': message.created_at.strftime('%Y-%m-%d %H:%M:%S'),
         'sender_name': message.sender.get_full_name(),
         'is_own': True
     })
@@ -79,34 +79,58 @@ def send_message(request, dialog_id):
 @login_required
 def get_new_messages(request, dialog_id):
     """API для получения новых сообщений"""
-    dialog = get_object_or_404(Dialog, id=dialog_id)
-    
-    # Проверяем права доступа
-    if request.user not in dialog.participants.all():
+    # Проверяем права доступа; диалог без участников недоступен никому,
+    # поэтому загружать сам диалог не нужно
+    if not is_dialog_participant(request.user.id, dialog_id):
         return HttpResponseForbidden('У вас нет доступа к этому диалогу')
     
-    last_message_id = request.GET.get('last_id')
+    last_message_id = request.GET.get('last_id', '')
     
-    messages_query = dialog.messages.select_related('sender')
+    messages_query = Message.objects.filter(dialog_id=dialog_id).select_related('sender')
     
-    if last_message_id:
-        messages_query = messages_query.filter(id__gt=last_message_id)
-    
-    messages = messages_query.all()
+    if last_message_id.isdigit():
+        # Новые сообщения - не больше одного окна за запрос
+        messages = list(
+            messages_query.filter(id__gt=last_message_id)
+            .order_by('created_at', 'id')[:history.MAX_WINDOW]
+        )
+    else:
+        messages = history.message_window(messages_query).messages
     
-    # Отмечаем полученные сообщения как прочитанные
-    messages.exclude(sender=request.user).filter(is_read=False).update(is_read=True)
+    # Сдвигаем отметку прочтения до последнего полученного сообщения
+    if messages:
+        mark_read(dialog_id, request.user.id, up_to=max(msg.id for msg in messages))
     
     return JsonResponse({
         'messages': [{
             'id': msg.id,
-            'text': msg.text,
-            'created': msg.created.strftime('%Y-%m-%d %H:%M:%S'),
+            'text': msg.content,
+            'created': msg.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'sender_name': msg.sender.get_full_name(),
-            'is_own': msg.sender == request.user
+            'is_own': msg.sender_id == request.user.id
         } for msg in messages]
     })
 
+@login_required
+def dialog_messages(request, dialog_id):
+    """
+    API истории диалога: последние сообщения, before - более ранние,
+    after - более новые, по курсору на (created_at, id)
+    """
+    if not is_dialog_participant(request.user.id, dialog_id):
+        return HttpResponseForbidden('У вас нет доступа к этому диалогу')
+    
+    try:
+        window = history.message_window(
+            Message.objects.filter(dialog_id=dialog_id).select_related('sender'),
+            before=request.GET.get('before'),
+            after=request.GET.get('after'),
+            limit=history.parse_limit(request.GET.get('limit'))
+        )
+    except history.HistoryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(history.window_page(window))
+
 @login_required
 def create_dialog(request, product_id):
     """Создание нового диалога"""
@@ -144,20 +168,23 @@ class DialogListView(LoginRequiredMixin, ListView):
     context_object_name = 'dialogs'
     
     def get_queryset(self):
-        return Dialog.objects.filter(
-            participants=self.request.user
-        ).annotate(
-            last_message_time=Max('messages__created_at')
-        ).order_by('-last_message_time')
+        return inbox(self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['unread_count'] = Message.objects.filter(
-            dialog__participants=self.request.user,
-            is_read=False
-        ).exclude(sender=self.request.user).count()
+        # Сумма денормализованных счетчиков, без запроса к сообщениям
+        context['unread_count'] = sum(dialog.unread_count for dialog in context['dialogs'])
         return context
 
+def get_participant_dialog(user, dialog_id):
+    """
+    Диалог, в котором участвует пользователь: проверка по кэшу членства
+    и выборка по первичному ключу, без соединения с участниками
+    """
+    if not is_dialog_participant(user.id, dialog_id):
+        raise Http404
+    return get_object_or_404(Dialog, id=dialog_id)
+
 class DialogDetailView(LoginRequiredMixin, DetailView):
     """Представление для просмотра конкретного диалога"""
     model = Dialog
@@ -165,37 +192,34 @@ class DialogDetailView(LoginRequiredMixin, DetailView):
     context_object_name = 'dialog'
     
     def get_object(self):
-        return get_object_or_404(
-            Dialog,
-            id=self.kwargs['dialog_id'],
-            participants=self.request.user
-        )
+        return get_participant_dialog(self.request.user, self.kwargs['dialog_id'])
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        dialog = self.get_object()
+        dialog = self.object
         
         # Получаем сообщения с вложениями
         messages = dialog.messages.select_related('sender').prefetch_related(
             Prefetch('attachments', queryset=MessageAttachment.objects.all())
         )
         
-        # Помечаем непрочитанные сообщения как прочитанные
-        unread_messages = messages.filter(
-            is_read=False
-        ).exclude(sender=self.request.user)
+        # Сдвигаем отметку прочтения до последнего сообщения
+        mark_read(dialog.id, self.request.user.id)
         
-        for message in unread_messages:
-            message.mark_as_read()
-            
-        context['messages'] = messages
-        context['opponent'] = dialog.get_opponent(self.request.user)
+        # Последнее окно истории; более ранние сообщения - через dialog_messages
+        window = history.message_window(messages)
+        context['messages'] = window.messages
+        context['older_cursor'] = window.older_cursor
+        context['opponent'] = opponent = dialog.get_opponent(self.request.user)
+        if opponent is not None:
+            opponent.is_online = presence.is_online(opponent.id)
+        context['opponent_last_read'] = read_by_others(dialog.id, self.request.user.id)
         return context
 
 class SendMessageView(LoginRequiredMixin, View):
     """Представление для отправки сообщения"""
     def post(self, request, dialog_id):
-        dialog = get_object_or_404(Dialog, id=dialog_id, participants=request.user)
+        dialog = get_participant_dialog(request.user, dialog_id)
         content = request.POST.get('content')
         
         if not content:
@@ -214,10 +238,6 @@ class SendMessageView(LoginRequiredMixin, View):
                 file=file,
                 file_type=file.content_type
             )
-            
-        # Обновляем последнее сообщение в диалоге
-        dialog.last_message = message
-        dialog.save()
         
         return JsonResponse({
             'message_id': message.id,
@@ -229,7 +249,7 @@ class SendMessageView(LoginRequiredMixin, View):
 class SendLocationView(LoginRequiredMixin, View):
     """Представление для отправки геолокации"""
     def post(self, request, dialog_id):
-        dialog = get_object_or_404(Dialog, id=dialog_id, participants=request.user)
+        dialog = get_participant_dialog(request.user, dialog_id)
         latitude = request.POST.get('latitude')
         longitude = request.POST.get('longitude')
         address = request.POST.get('address', '')
@@ -260,44 +280,48 @@ class SendLocationView(LoginRequiredMixin, View):
 class SendVoiceMessageView(LoginRequiredMixin, View):
     """Представление для отправки голосового сообщения"""
     def post(self, request, dialog_id):
-        dialog = get_object_or_404(Dialog, id=dialog_id, participants=request.user)
+        dialog = get_participant_dialog(request.user, dialog_id)
         audio_file = request.FILES.get('audio')
         duration = request.POST.get('duration')
         
-        if not all([audio_file, duration]):
+        if not all([audio_file, duration]) or not duration.isdigit():
             return JsonResponse({'error': 'Не указан аудио файл или длительность'}, status=400)
-            
+        
+        # Обработка идет в process_voice_messages; о ее окончании участники
+        # узнают по веб-сокету (voice_processed)
         message = VoiceMessage.objects.create(
             dialog=dialog,
             sender=request.user,
-            content='Голосовое сообщение',
             audio_file=audio_file,
             duration=int(duration)
         )
         
-        dialog.last_message = message
-        dialog.save()
-        
-        return JsonResponse({
-            'message_id': message.id,
-            'audio_url': message.audio_file.url,
-            'duration': message.duration,
-            'created_at': message.created_at.isoformat()
-        })
+        return JsonResponse({'message_id': message.id, **serialize_voice(message)}, status=202)
 
 class MessageSearchView(LoginRequiredMixin, ListView):
     """Представление для поиска по сообщениям"""
     model = Message
     template_name = 'chat/search_results.html'
     context_object_name = 'messages'
-    paginate_by = 20
     
     def get_queryset(self):
-        query = self.request.GET.get('q', '')
-        return Message.objects.filter(
-            Q(content__icontains=query),
-            dialog__participants=self.request.user
-        ).select_related('dialog', 'sender').order_by('-created_at')
+        # Страницы идут по курсору (rank, id), а не по номеру
+        try:
+            self.page = search.search_messages(
+                self.request.user,
+                self.request.GET.get('q', ''),
+                cursor=self.request.GET.get('cursor'),
+                limit=search.parse_limit(self.request.GET.get('limit'))
+            )
+        except search.SearchError as e:
+            raise BadRequest(str(e))
+        return self.page.messages
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        context['next_cursor'] = self.page.next_cursor
+        return context
 
 class GroupChatView(LoginRequiredMixin, DetailView):
     """Представление для группового чата"""
@@ -306,11 +330,9 @@ class GroupChatView(LoginRequiredMixin, DetailView):
     context_object_name = 'chat'
     
     def get_object(self):
-        return get_object_or_404(
-            GroupChat,
-            id=self.kwargs['chat_id'],
-            participants=self.request.user
-        )
+        if not is_group_member(self.request.user.id, self.kwargs['chat_id']):
+            raise Http404
+        return get_object_or_404(GroupChat, id=self.kwargs['chat_id'])
         
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -0,0 +1,160 @@
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .audio import AudioMessageProcessor, TranscriptionError, get_transcriber
+from .models import VoiceMessage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 20
+# Сообщение, взятое обработчиком, который упал, не закончив, через это
+# время снова считается ожидающим
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+class VoiceReport:
+    """Итоги обработки: готовые сообщения и ошибки"""
+
+    def __init__(self):
+        self.processed = 0
+        self.errors = []
+
+
+def serialize_voice(voice):
+    """Голосовое сообщение в виде, который отдается API и рассылается участникам"""
+    ready = voice.status == VoiceMessage.STATUS_READY and voice.processed_file
+    return {
+        'id': voice.id,
+        'status': voice.status,
+        'audio_url': (voice.processed_file if ready else voice.audio_file).url,
+        'duration': voice.duration,
+        'waveform': voice.waveform,
+        'transcript': voice.transcript,
+        'created_at': voice.created_at.isoformat()
+    }
+
+
+def pending():
+    """Ожидающие обработки сообщения, включая зависшие дольше CLAIM_TIMEOUT"""
+    return VoiceMessage.objects.filter(
+        Q(status=VoiceMessage.STATUS_PENDING) |
+        Q(status=VoiceMessage.STATUS_PROCESSING, claimed_at__lt=timezone.now() - CLAIM_TIMEOUT)
+    )
+
+
+def claim(batch_size=BATCH_SIZE):
+    """Забирает пачку сообщений; параллельные обработчики пропускают чужие строки"""
+    with transaction.atomic():
+        ids = list(
+            pending().select_for_update(skip_locked=True)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        VoiceMessage.objects.filter(id__in=ids).update(
+            status=VoiceMessage.STATUS_PROCESSING,
+            claimed_at=timezone.now()
+        )
+    return list(VoiceMessage.objects.filter(id__in=ids).order_by('id'))
+
+
+def process_voice(voice, processor, transcriber):
+    """
+    Обрабатывает одно сообщение в пуле потоков: без обращений к базе, только
+    файлы. У каждой задачи свои временные файлы, удаляемые в конце.
+    """
+    suffix = os.path.splitext(voice.audio_file.name)[1] or '.audio'
+    source_fd, source_path = tempfile.mkstemp(prefix='voice-', suffix=suffix)
+    output_fd, output_path = tempfile.mkstemp(prefix='voice-', suffix='.wav')
+    os.close(output_fd)
+    try:
+        with os.fdopen(source_fd, 'wb') as target, voice.audio_file.open('rb') as source:
+            shutil.copyfileobj(source, target)
+        result = processor.process_audio(source_path, output_path)
+        try:
+            transcript, error = transcriber.transcribe(output_path), ''
+        except TranscriptionError as e:
+            # Без текста сообщение остается пригодным
+            transcript, error = '', str(e)
+        with open(output_path, 'rb') as processed:
+            voice.processed_file.save(f'voice-{voice.pk}.wav', File(processed), save=False)
+        return {
+            'processed_file': voice.processed_file.name,
+            'waveform': result['waveform'],
+            'duration': round(result['duration']),
+            'transcript': transcript,
+            'error': error,
+        }
+    finally:
+        for path in (source_path, output_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _attempt(func, *args):
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, e
+
+
+def notify(voice):
+    """Сообщает участникам чата, что обработка закончилась"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    if voice.dialog_id:
+        room_group_name = f'chat_{voice.dialog_id}'
+    else:
+        room_group_name = f'group_chat_{voice.group_chat_id}'
+    async_to_sync(channel_layer.group_send)(room_group_name, {
+        'type': 'voice_processed',
+        'voice': serialize_voice(voice)
+    })
+
+
+def _finish(voice, result, error, report):
+    if error is not None:
+        logger.warning('Failed to process voice message %s: %s', voice.pk, error)
+        report.errors.append((voice.pk, str(error)))
+        updates = {'status': VoiceMessage.STATUS_FAILED, 'error': str(error)}
+    else:
+        report.processed += 1
+        updates = {'status': VoiceMessage.STATUS_READY, 'processed_at': timezone.now(), **result}
+    # Сообщение могли удалить, пока шла обработка
+    if not VoiceMessage.objects.filter(pk=voice.pk).update(**updates):
+        if result is not None:
+            voice.processed_file.storage.delete(result['processed_file'])
+        return
+    for field, value in updates.items():
+        setattr(voice, field, value)
+    notify(voice)
+
+
+def process_pending_voice(batch_size=BATCH_SIZE, workers=2, processor=None, transcriber=None):
+    """
+    Обрабатывает очередь голосовых сообщений пачками.
+
+    Декодирование, обработка и распознавание идут в пуле из workers потоков -
+    это и есть ограничение параллельности; статусы пишутся в основном потоке.
+    """
+    processor = processor or AudioMessageProcessor()
+    transcriber = transcriber or get_transcriber()
+    report = VoiceReport()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = claim(batch_size)
+            if not batch:
+                break
+            for voice, (result, error) in zip(batch, pool.map(
+                lambda voice: _attempt(process_voice, voice, processor, transcriber), batch
+            )):
+                _finish(voice, result, error, report)
+    return report
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
     'user_profile.apps.UserProfileConfig',
     'announcements.apps.AnnouncementsConfig',
     'pets.apps.PetsConfig',
+    'cart.apps.CartConfig',
+    'uploads.apps.UploadsConfig',
 ]
 
 MIDDLEWARE = [
@@ -56,6 +58,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'cart.middleware.CartPersistMiddleware',
     'django_otp.middleware.OTPMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -76,6 +79,7 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
                 'notifications.context_processors.unread_notifications_count',
+                'cart.context_processors.cart_count',
             ],
         },
     },
@@ -93,6 +97,42 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache
+# Без REDIS_CACHE_URL используется локальный кэш процесса
+if os.getenv('REDIS_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Время жизни кэша фасетов каталога (секунды)
+CATALOG_FACETS_TTL = 60
+
+# Через сколько дней без изменений активное объявление уходит в архив
+CATALOG_LISTING_TTL_DAYS = 90
+
+# Как часто измененная корзина сохраняется в базу в конце запроса (секунды)
+CART_PERSIST_INTERVAL = 60
+
+# Наибольшая сторона изображения после обработки загрузки (пиксели)
+UPLOAD_IMAGE_MAX_DIMENSION = 2048
+
+# Конфигурация полнотекстового поиска PostgreSQL для сообщений чата;
+# индекс строится под нее, после смены нужен migrate
+CHAT_SEARCH_CONFIG = 'russian'
+
+# Распознавание речи голосовых сообщений; chat.audio.LocalTranscriber -
+# замена без сети для разработки
+CHAT_TRANSCRIPTION_BACKEND = 'chat.audio.GoogleTranscriber'
+
 # WebSocket
 WEBSOCKET_URL = '/ws/'
 WSGI_APPLICATION = 'config.wsgi.application'
@@ -12,6 +12,7 @@ urlpatterns = [
     path('chat/', include('chat.urls')),
     path('notifications/', include('notifications.urls')),
     path('pets/', include('pets.urls')),
+    path('cart/', include('cart.urls')),
 ]
 
 if settings.DEBUG:
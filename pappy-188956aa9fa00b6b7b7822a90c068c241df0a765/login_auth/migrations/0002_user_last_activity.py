@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-19 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('login_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='last_activity',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='последняя активность'),
+        ),
+    ]
@@ -49,6 +49,8 @@ class User(AbstractUser):
     
     # Дополнительные поля
     rating = models.DecimalField(_('рейтинг'), max_digits=3, decimal_places=2, default=0)
+    # Пишется сервисом присутствия чата не чаще ACTIVITY_PERSIST_INTERVAL
+    last_activity = models.DateTimeField(_('последняя активность'), null=True, blank=True)
     
     # Настройки Django
     username = None
@@ -56,8 +56,8 @@ class Notification(models.Model):
         )
     
     @classmethod
-    def create_product_status_notification(cls, recipient, product, status):
-        """Создает уведомление об изменении статуса объявления"""
+    def product_status_notification(cls, recipient_id, product, status):
+        """Уведомление об изменении статуса объявления (без сохранения)"""
         status_choices = {
             'active': 'активный',
             'archived': 'в архиве',
@@ -66,14 +66,21 @@ class Notification(models.Model):
             'rejected': 'отклонен'
         }
         status_display = status_choices.get(status, status)
-        return cls.objects.create(
-            recipient=recipient,
+        return cls(
+            recipient_id=recipient_id,
             type='product_status',
             title='Статус объявления изменен',
             text=f'Статус вашего объявления "{product.title}" изменен на "{status_display}"',
             link=f'/catalog/product/{product.slug}/'
         )
     
+    @classmethod
+    def create_product_status_notification(cls, recipient, product, status):
+        """Создает уведомление об изменении статуса объявления"""
+        notification = cls.product_status_notification(recipient.pk, product, status)
+        notification.save()
+        return notification
+    
     @classmethod
     def create_verification_notification(cls, recipient, is_verified):
         """Создает уведомление о результате верификации"""
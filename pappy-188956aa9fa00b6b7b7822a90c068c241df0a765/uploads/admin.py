@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import ImageBlob
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ['file', 'width', 'height', 'size', 'refs', 'created']
+    search_fields = ['sha256']
+    readonly_fields = ['sha256', 'width', 'height', 'size', 'refs', 'created']
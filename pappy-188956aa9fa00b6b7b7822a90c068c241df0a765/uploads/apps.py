@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class UploadsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'uploads'
+    verbose_name = 'Загрузки'
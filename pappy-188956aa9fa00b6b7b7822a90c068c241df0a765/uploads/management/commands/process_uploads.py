@@ -0,0 +1,60 @@
+import time
+from django.core.management.base import BaseCommand
+from uploads.pipeline import BATCH_SIZE, SOURCES, process_pending
+
+class Command(BaseCommand):
+    help = 'Strip metadata, downscale and deduplicate pending image uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of uploads processed per batch'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker threads'
+        )
+        parser.add_argument(
+            '--source',
+            action='append',
+            choices=sorted(source.label for source in SOURCES.values()),
+            help='Process only this model field (can be repeated)'
+        )
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running and poll for new uploads at this interval'
+        )
+
+    def handle(self, *args, **options):
+        sources = [
+            source for source in SOURCES.values()
+            if not options['source'] or source.label in options['source']
+        ]
+        while True:
+            for source in sources:
+                report = process_pending(
+                    source,
+                    batch_size=options['batch_size'],
+                    workers=options['workers']
+                )
+                self.report(source, report, quiet=options['watch'] is not None)
+            if options['watch'] is None:
+                break
+            time.sleep(options['watch'])
+
+    def report(self, source, report, quiet):
+        for pk, error in report.errors:
+            self.stderr.write(f'{source.label} {pk}: {error}')
+        if quiet and not report.processed:
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'{source.label}: processed {report.processed} uploads, '
+            f'new files: {report.created}, deduplicated: {report.deduplicated}, '
+            f'{report.bytes_before / 1024:.0f} KB -> {report.bytes_after / 1024:.0f} KB'
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-19 12:18
+
+import uploads.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.ImageField(upload_to=uploads.models.blob_path, verbose_name='file')),
+                ('width', models.PositiveIntegerField(verbose_name='width')),
+                ('height', models.PositiveIntegerField(verbose_name='height')),
+                ('size', models.PositiveIntegerField(verbose_name='size')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='references')),
+                ('thumbnails_ready', models.BooleanField(default=False, verbose_name='thumbnails ready')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+            ],
+            options={
+                'verbose_name': 'image blob',
+                'verbose_name_plural': 'image blobs',
+            },
+        ),
+    ]
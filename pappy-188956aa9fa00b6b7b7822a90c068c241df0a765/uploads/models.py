@@ -0,0 +1,36 @@
+import os
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+# Каталог хранилища с обработанными изображениями
+BLOB_DIR = 'blobs'
+
+
+def blob_path(instance, filename):
+    """blobs/ab/ab12...ef.jpg - имя определяется содержимым"""
+    ext = os.path.splitext(filename)[1].lower()
+    return f'{BLOB_DIR}/{instance.sha256[:2]}/{instance.sha256}{ext}'
+
+
+class ImageBlob(models.Model):
+    """
+    Обработанное изображение, общее для всех загрузок с тем же содержимым.
+
+    refs - число строк, ссылающихся на файл; при нуле запись и файл удаляются.
+    """
+    sha256 = models.CharField(_('SHA-256'), max_length=64, unique=True)
+    file = models.ImageField(_('file'), upload_to=blob_path)
+    width = models.PositiveIntegerField(_('width'))
+    height = models.PositiveIntegerField(_('height'))
+    size = models.PositiveIntegerField(_('size'))
+    refs = models.PositiveIntegerField(_('references'), default=0)
+    # Превью карточек (catalog.thumbnails) уже созданы для файла
+    thumbnails_ready = models.BooleanField(_('thumbnails ready'), default=False)
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('image blob')
+        verbose_name_plural = _('image blobs')
+
+    def __str__(self):
+        return self.file.name
@@ -0,0 +1,359 @@
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import reduce
+from io import BytesIO
+from operator import or_
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from PIL import Image, ImageOps
+from .models import ImageBlob
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+CHUNK_SIZE = 64 * 1024
+
+JPEG_OPTIONS = {'quality': 85, 'optimize': True, 'progressive': True}
+PNG_OPTIONS = {'optimize': True}
+
+# Вложения с такими расширениями обрабатываются как изображения
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+# Поля моделей, загрузки в которые проходят через конвейер
+SOURCES = {}
+
+
+def max_dimension():
+    return getattr(settings, 'UPLOAD_IMAGE_MAX_DIMENSION', 2048)
+
+
+class UploadSource:
+    """
+    Поле модели с загрузками.
+
+    Модель хранит ссылку blob на обработанный файл; пока ее нет, в поле
+    лежит исходная загрузка. thumbnails - функция, создающая производные
+    файлы для обработанного изображения, derived_names - их имена (удаляются
+    вместе с файлом), on_processed - вызывается с id обработанных строк.
+    """
+
+    def __init__(self, model, field, images_only=False, thumbnails=None, ready_field=None,
+                 derived_names=None, on_processed=None):
+        self.model = model
+        self.field = field
+        self.images_only = images_only
+        self.thumbnails = thumbnails
+        self.ready_field = ready_field
+        self.derived_names = derived_names
+        self.on_processed = on_processed
+        self.label = f'{model._meta.label}.{field}'
+
+    @property
+    def storage(self):
+        return self.model._meta.get_field(self.field).storage
+
+    def pending(self):
+        """Строки с необработанной загрузкой"""
+        rows = self.model._default_manager.filter(
+            blob__isnull=True, **{f'{self.field}__isnull': False}
+        ).exclude(**{self.field: ''})
+        if self.images_only:
+            rows = rows.filter(reduce(or_, (
+                Q(**{f'{self.field}__iendswith': ext}) for ext in IMAGE_EXTENSIONS
+            )))
+        return rows
+
+    def delete_file(self, name):
+        """Удаляет исходную загрузку вместе с производными файлами"""
+        names = [name] + (self.derived_names(name) if self.derived_names else [])
+        for path in names:
+            if self.storage.exists(path):
+                self.storage.delete(path)
+
+
+class PipelineReport:
+    """Итоги обработки: строки, новые файлы, объем до и после"""
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+        self.errors = []
+
+    @property
+    def deduplicated(self):
+        return self.processed - self.created
+
+
+def register(model, field, **options):
+    """Подключает поле модели к конвейеру и отслеживает замену и удаление файла"""
+    source = SOURCES[model] = UploadSource(model, field, **options)
+    uid = f'uploads:{source.label}'
+    post_init.connect(_remember_file, sender=model, dispatch_uid=uid)
+    pre_save.connect(_detach_replaced, sender=model, dispatch_uid=uid)
+    post_save.connect(_release_replaced, sender=model, dispatch_uid=uid)
+    post_delete.connect(_release_deleted, sender=model, dispatch_uid=uid)
+    return source
+
+
+def _file_name(instance, field):
+    value = instance.__dict__.get(field)
+    return getattr(value, 'name', value) or ''
+
+
+def _remember_file(sender, instance, **kwargs):
+    # Модели подключены к конвейеру вместо django-cleanup: файл может быть
+    # общим, поэтому удаляется только по счетчику ссылок
+    instance._upload_name = _file_name(instance, SOURCES[sender].field)
+
+
+def _detach_replaced(sender, instance, raw=False, **kwargs):
+    source = SOURCES[sender]
+    instance._upload_replaced = None
+    value = instance.__dict__.get(source.field)
+    if raw or instance._state.adding or value is None:
+        return
+    name = _file_name(instance, source.field)
+    if getattr(value, '_committed', True) and name == getattr(instance, '_upload_name', name):
+        return
+    # Файл в поле мог смениться: прежние значения берутся из базы, так как
+    # экземпляр мог быть перечитан после обработки (refresh_from_db)
+    old = sender._default_manager.filter(pk=instance.pk).values_list(source.field, 'blob_id').first()
+    if old is None or (old[0] == name and getattr(value, '_committed', True)):
+        return
+    instance._upload_replaced = old
+    if instance.blob_id == old[1]:
+        # Загружен новый файл - он снова ждет обработки, превью старого не подходят
+        instance.blob = None
+        if source.ready_field:
+            setattr(instance, source.ready_field, False)
+
+
+def _release_replaced(sender, instance, created, raw=False, **kwargs):
+    source = SOURCES[sender]
+    replaced = getattr(instance, '_upload_replaced', None)
+    if replaced is not None:
+        _release(source, *replaced)
+        instance._upload_replaced = None
+    instance._upload_name = _file_name(instance, source.field)
+
+
+def _release_deleted(sender, instance, **kwargs):
+    source = SOURCES[sender]
+    _release(source, _file_name(instance, source.field), instance.__dict__.get('blob_id'))
+
+
+def _release(source, name, blob_id):
+    if blob_id:
+        transaction.on_commit(lambda: release_blob(blob_id))
+    elif name:
+        transaction.on_commit(lambda: source.delete_file(name))
+
+
+def release_blob(blob_id, count=1):
+    """Уменьшает счетчик ссылок; файл без ссылок удаляется"""
+    ImageBlob.objects.filter(pk=blob_id, refs__gte=count).update(refs=F('refs') - count)
+    for blob in ImageBlob.objects.filter(pk=blob_id, refs=0):
+        _delete_blob(blob)
+
+
+def _delete_blob(blob):
+    storage = blob.file.storage
+    names = {
+        name
+        for source in SOURCES.values() if source.derived_names
+        for name in source.derived_names(blob.file.name)
+    }
+    # Файл самого blob удаляет django-cleanup после коммита
+    blob.delete()
+    for name in names:
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def content_hash(storage, name):
+    """SHA-256 и размер файла, читаемого частями"""
+    digest = hashlib.sha256()
+    size = 0
+    with storage.open(name, 'rb') as f:
+        for chunk in f.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def process_image(storage, name):
+    """
+    Перекодирует изображение: поворот по EXIF, уменьшение до
+    max_dimension() по большей стороне, без метаданных. Анимированные
+    изображения сохраняются как есть: в JPEG/PNG остался бы первый кадр.
+
+    Возвращает (ContentFile, ширина, высота).
+    """
+    limit = max_dimension()
+    with storage.open(name, 'rb') as f:
+        image = Image.open(f)
+        if getattr(image, 'is_animated', False):
+            f.seek(0)
+            ext = os.path.splitext(name)[1].lower()
+            return ContentFile(f.read(), name=f'image{ext}'), image.width, image.height
+        # JPEG декодируется сразу в уменьшенном масштабе
+        image.draft('RGB', (limit, limit))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((limit, limit), Image.LANCZOS)
+
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    buffer = BytesIO()
+    # Метаданные (EXIF с геолокацией, ICC, комментарии) не переносятся
+    if has_alpha:
+        image.convert('RGBA').save(buffer, 'PNG', **PNG_OPTIONS)
+        ext = '.png'
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', **JPEG_OPTIONS)
+        ext = '.jpg'
+    return ContentFile(buffer.getvalue(), name=f'image{ext}'), image.width, image.height
+
+
+def _attempt(func, *args):
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, e
+
+
+def _store_blob(storage, digest, name):
+    """Обрабатывает файл и записывает результат в хранилище; выполняется в пуле потоков"""
+    content, width, height = process_image(storage, name)
+    blob = ImageBlob(sha256=digest, width=width, height=height, size=content.size)
+    blob.file.save(content.name, content, save=False)
+    return blob
+
+
+def _save_blob(blob):
+    try:
+        with transaction.atomic():
+            blob.save()
+        return blob, True
+    except IntegrityError:
+        # Тот же файл успел сохранить другой обработчик
+        blob.file.storage.delete(blob.file.name)
+        return ImageBlob.objects.get(sha256=blob.sha256), False
+
+
+def _process_batch(source, rows, pool, report):
+    storage = source.storage
+
+    hashes = {}
+    for (pk, name), (result, error) in zip(rows, pool.map(
+        lambda row: _attempt(content_hash, storage, row[1]), rows
+    )):
+        if error is not None:
+            report.errors.append((pk, str(error)))
+        else:
+            hashes[pk] = (name, *result)
+
+    # Уже сохраненные файлы с тем же содержимым не обрабатываются повторно
+    blobs = ImageBlob.objects.in_bulk({digest for _name, digest, _size in hashes.values()}, field_name='sha256')
+    todo = {}
+    for name, digest, _size in hashes.values():
+        if digest not in blobs:
+            todo.setdefault(digest, name)
+
+    created = []
+    for digest, (blob, error) in zip(todo, pool.map(
+        lambda item: _attempt(_store_blob, storage, *item), todo.items()
+    )):
+        if error is not None:
+            logger.warning('Failed to process upload %s: %s', todo[digest], error)
+            report.errors.extend(
+                (pk, str(error)) for pk, (_name, row_digest, _size) in hashes.items() if row_digest == digest
+            )
+            continue
+        blobs[digest], is_new = _save_blob(blob)
+        if is_new:
+            created.append(blobs[digest].pk)
+
+    if source.thumbnails:
+        missing = [blob for blob in blobs.values() if not blob.thumbnails_ready]
+        ready = [
+            blob.pk for blob, (_result, error) in zip(missing, pool.map(
+                lambda blob: _attempt(source.thumbnails, blob.file), missing
+            ))
+            if error is None
+        ]
+        ImageBlob.objects.filter(pk__in=ready).update(thumbnails_ready=True)
+        for blob in missing:
+            blob.thumbnails_ready = blob.pk in ready
+
+    with transaction.atomic():
+        # Строку могли изменить или удалить, пока шла обработка, а файл -
+        # освободить; блокировки не дают удалить blob до коммита
+        locked = set(ImageBlob.objects.select_for_update().filter(
+            pk__in=[blob.pk for blob in blobs.values()]
+        ).values_list('pk', flat=True))
+        current = dict(source.model._default_manager.select_for_update().filter(
+            pk__in=hashes, blob__isnull=True
+        ).values_list('pk', source.field))
+
+        by_blob = defaultdict(list)
+        for pk, (name, digest, size) in hashes.items():
+            blob = blobs.get(digest)
+            if blob is not None and blob.pk in locked and current.get(pk) == name:
+                by_blob[blob].append(pk)
+                report.bytes_before += size
+
+        raw_names = []
+        for blob, pks in by_blob.items():
+            updates = {'blob': blob, source.field: blob.file.name}
+            if source.ready_field:
+                updates[source.ready_field] = blob.thumbnails_ready
+            source.model._default_manager.filter(pk__in=pks).update(**updates)
+            ImageBlob.objects.filter(pk=blob.pk).update(refs=F('refs') + len(pks))
+            raw_names.extend(current[pk] for pk in pks)
+            report.processed += len(pks)
+            report.bytes_after += blob.size * len(pks)
+
+        processed = [pk for pks in by_blob.values() for pk in pks]
+
+        def after_commit():
+            for name in raw_names:
+                source.delete_file(name)
+            # Новые файлы, на которые так и не сослались
+            for blob in ImageBlob.objects.filter(pk__in=created, refs=0):
+                _delete_blob(blob)
+            if source.on_processed and processed:
+                source.on_processed(processed)
+
+        transaction.on_commit(after_commit)
+    report.created += len(created)
+
+
+def process_pending(source, batch_size=BATCH_SIZE, workers=4, report=None):
+    """
+    Обрабатывает ожидающие загрузки одного поля пачками.
+
+    Хеширование, декодирование и кодирование идут в пуле потоков (Pillow
+    отпускает GIL), запись в базу - одной транзакцией на пачку.
+    """
+    report = report or PipelineReport()
+    last_pk = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            rows = list(
+                source.pending().filter(pk__gt=last_pk).order_by('pk')
+                .values_list('pk', source.field)[:batch_size]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            _process_batch(source, rows, pool, report)
+    return report
@@ -0,0 +1,193 @@
+import io
+import shutil
+import tempfile
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from login_auth.models import User
+from catalog.models import Category, Product, ProductImage
+from catalog.thumbnails import thumbnail_names
+from chat.models import Dialog, Message, MessageAttachment
+from uploads.models import ImageBlob
+from uploads.pipeline import SOURCES, process_pending
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Тег EXIF Orientation: 6 - снимок повернут на 90 градусов по часовой стрелке
+ORIENTATION = 0x0112
+
+
+def make_image(name='photo.jpg', size=(800, 600), color='red', orientation=None):
+    image_io = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = 'Camera'
+    if orientation:
+        exif[ORIENTATION] = orientation
+    Image.new('RGB', size, color=color).save(image_io, format='JPEG', exif=exif)
+    return SimpleUploadedFile(name, image_io.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_IMAGE_MAX_DIMENSION=400)
+class ImagePipelineTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            phone='+79991234567',
+            password='testpass123'
+        )
+        self.category = Category.objects.create(name='Аксессуары')
+        self.product = Product.objects.create(
+            seller=self.user,
+            category=self.category,
+            title='Ошейник',
+            description='Описание',
+            condition='new',
+            status='active'
+        )
+        self.source = SOURCES[ProductImage]
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return process_pending(self.source, workers=2)
+
+    def test_image_is_rotated_resized_and_stripped(self):
+        """Test that processing applies EXIF orientation, downscales and drops metadata"""
+        image = ProductImage.objects.create(
+            product=self.product, image=make_image(size=(1200, 600), orientation=6)
+        )
+        raw_name = image.image.name
+
+        report = self.process()
+
+        self.assertEqual(report.processed, 1)
+        image.refresh_from_db()
+        blob = image.blob
+        self.assertEqual(image.image.name, blob.file.name)
+        self.assertEqual((blob.width, blob.height), (200, 400))
+        self.assertTrue(image.thumbnails_ready)
+        with default_storage.open(blob.file.name) as f:
+            stored = Image.open(f)
+            self.assertEqual(stored.size, (200, 400))
+            self.assertEqual(len(stored.getexif()), 0)
+        self.assertFalse(default_storage.exists(raw_name))
+
+    def test_identical_uploads_share_one_file(self):
+        """Test that uploads with the same content are stored once with a reference count"""
+        first = ProductImage.objects.create(product=self.product, image=make_image('a.jpg'))
+        second = ProductImage.objects.create(product=self.product, image=make_image('b.jpg'))
+        ProductImage.objects.create(product=self.product, image=make_image('c.jpg', color='blue'))
+
+        report = self.process()
+
+        self.assertEqual((report.processed, report.created, report.deduplicated), (3, 2, 1))
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.blob.refs, 2)
+        # Повторный запуск ничего не делает
+        self.assertEqual(self.process().processed, 0)
+
+        # Новая загрузка того же файла ссылается на существующий blob
+        third = ProductImage.objects.create(product=self.product, image=make_image('d.jpg'))
+        report = self.process()
+        self.assertEqual((report.processed, report.created), (1, 0))
+        third.refresh_from_db()
+        self.assertEqual(third.blob_id, first.blob_id)
+        self.assertEqual(ImageBlob.objects.get(pk=first.blob_id).refs, 3)
+
+    def test_blob_deleted_with_last_reference(self):
+        """Test that the shared file survives until the last referencing row is deleted"""
+        first = ProductImage.objects.create(product=self.product, image=make_image('a.jpg'))
+        second = ProductImage.objects.create(product=self.product, image=make_image('b.jpg'))
+        self.process()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        blob = first.blob
+        names = [blob.file.name] + thumbnail_names(blob.file.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.refs, 1)
+        self.assertTrue(all(default_storage.exists(name) for name in names))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+
+    def test_replaced_file_is_processed_again(self):
+        """Test that uploading a new file releases the old blob and waits for processing"""
+        image = ProductImage.objects.create(product=self.product, image=make_image())
+        self.process()
+        image.refresh_from_db()
+        old_blob = image.blob
+
+        image.image = make_image('new.jpg', color='green')
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertIsNone(image.blob_id)
+        image.refresh_from_db()
+        # Пока новый файл не обработан, карточки показывают оригинал
+        self.assertFalse(image.thumbnails_ready)
+        self.assertEqual(image.thumbnail_url('card'), image.image.url)
+        self.assertFalse(ImageBlob.objects.filter(pk=old_blob.pk).exists())
+        self.assertFalse(default_storage.exists(old_blob.file.name))
+
+        self.process()
+        image.refresh_from_db()
+        self.assertIsNotNone(image.blob_id)
+        self.assertNotEqual(image.blob.sha256, old_blob.sha256)
+
+    def test_non_image_attachments_are_skipped(self):
+        """Test that chat attachments other than images are left untouched"""
+        other = User.objects.create_user(phone='+79997654321', password='testpass123')
+        dialog = Dialog.objects.create()
+        dialog.participants.add(self.user, other)
+        message = Message.objects.create(dialog=dialog, sender=self.user, content='Файлы')
+        photo = MessageAttachment.objects.create(message=message, file=make_image(), file_type='image')
+        document = MessageAttachment.objects.create(
+            message=message, file=ContentFile(b'%PDF-1.4', name='doc.pdf'), file_type='document'
+        )
+        document_name = document.file.name
+
+        stdout = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_uploads', source=['chat.MessageAttachment.file'], stdout=stdout)
+
+        self.assertIn('processed 1 uploads', stdout.getvalue())
+        photo.refresh_from_db()
+        document.refresh_from_db()
+        self.assertIsNotNone(photo.blob_id)
+        self.assertIsNone(document.blob_id)
+        self.assertEqual(document.file.name, document_name)
+        self.assertTrue(default_storage.exists(document_name))
+
+    def test_animated_gif_kept_as_is(self):
+        """Test that animated images are stored unchanged instead of flattened to one frame"""
+        other = User.objects.create_user(phone='+79997654321', password='testpass123')
+        dialog = Dialog.objects.create()
+        dialog.participants.add(self.user, other)
+        message = Message.objects.create(dialog=dialog, sender=self.user, content='Гифка')
+        gif_io = io.BytesIO()
+        frames = [Image.new('P', (600, 600), color) for color in (1, 2, 3)]
+        frames[0].save(gif_io, 'GIF', save_all=True, append_images=frames[1:], duration=100, loop=0)
+        attachment = MessageAttachment.objects.create(
+            message=message, file=ContentFile(gif_io.getvalue(), name='cat.gif'), file_type='image'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending(SOURCES[MessageAttachment], workers=2)
+
+        attachment.refresh_from_db()
+        self.assertTrue(attachment.file.name.endswith('.gif'))
+        with default_storage.open(attachment.file.name) as f:
+            self.assertEqual(f.read(), gif_io.getvalue())
+        self.assertEqual((attachment.blob.width, attachment.blob.height), (600, 600))